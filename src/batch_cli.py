@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.15) Пакетна генерація документів без Telegram (напр., для всього потоку курсу).
+
+Один запис = один проєкт, у тих самих полях, що збирає бот
+(див. `documents.py`), плюс поле `type`: policy | dpia | checklist
+(або `--type` для всього файлу).
+
+Формати входу (визначаються за розширенням або --format):
+  .jsonl / .ndjson — по одному JSON-об'єкту на рядок (рекомендовано)
+  .json            — масив об'єктів (читається потоково) або один об'єкт
+  .yaml / .yml     — документ(и) YAML (потрібен PyYAML, опційно)
+  .csv             — заголовок = назви полів; `minimization_data` — JSON у клітинці
+  -                — stdin (тоді --format обов'язковий)
+
+Рендер виконується паралельно на всіх ядрах (пул з `pdf_utils`). Записи
+читаються потоково, в роботі одночасно не більше 2 x workers документів.
+
+Приклад:
+    python batch_cli.py cohort.jsonl --out ./pdf --workers 8
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+from documents import BUILDERS, DOCUMENT_TYPES, normalize_record
+from pdf_utils import create_render_pool, warm_up_renderer
+
+FORMATS = ("jsonl", "json", "yaml", "csv")
+_EXTENSIONS = {".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "json", ".yaml": "yaml", ".yml": "yaml", ".csv": "csv"}
+
+
+# --- Лінивий імпорт, щоб не падати, якщо пакета немає ---
+def _try_import_yaml():
+    try:
+        import yaml  # type: ignore
+        return yaml
+    except Exception:
+        return None
+
+
+# === Читання записів (потоково) ===
+
+def _read_jsonl(stream: TextIO) -> Iterator[Any]:
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _read_json(stream: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Потоково читає масив JSON-об'єктів (або один об'єкт), не завантажуючи файл цілком."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    in_array = None
+    eof = False
+    while True:
+        # Пропускаємо пробіли, '[' ',' ']' між елементами
+        stripped = buffer.lstrip()
+        if in_array is None and stripped:
+            in_array = stripped[0] == "["
+            if in_array:
+                stripped = stripped[1:]
+        while in_array and stripped[:1] in (",", "]") and stripped:
+            stripped = stripped[1:].lstrip()
+        buffer = stripped
+
+        if buffer:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield value
+                buffer = buffer[end:]
+                if not in_array:
+                    return
+                continue
+        if eof:
+            return
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def _read_yaml(stream: TextIO) -> Iterator[Any]:
+    yaml = _try_import_yaml()
+    if not yaml:
+        raise SystemExit("Для YAML потрібен PyYAML: pip install pyyaml")
+    for document in yaml.safe_load_all(stream):
+        if isinstance(document, list):
+            yield from document
+        elif document is not None:
+            yield document
+
+
+def _read_csv(stream: TextIO) -> Iterator[Any]:
+    for row in csv.DictReader(stream):
+        record = {key.strip(): value for key, value in row.items() if key and value not in (None, "")}
+        if "minimization_data" in record:
+            record["minimization_data"] = json.loads(record["minimization_data"])
+        yield record
+
+
+_READERS = {"jsonl": _read_jsonl, "json": _read_json, "yaml": _read_yaml, "csv": _read_csv}
+
+
+def detect_format(path: str, explicit: Optional[str]) -> str:
+    if explicit:
+        return explicit
+    fmt = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if not fmt:
+        raise SystemExit(f"Не вдалося визначити формат '{path}'. Вкажіть --format ({', '.join(FORMATS)}).")
+    return fmt
+
+
+def output_name(index: int, doc_type: str, data: Dict[str, Any]) -> str:
+    slug = re.sub(r"[^\w-]+", "_", data.get("project_name", ""), flags=re.UNICODE).strip("_")[:40]
+    return f"{index:05d}_{doc_type}_{slug or 'project'}.pdf"
+
+
+# === Воркери (окремі процеси) ===
+
+def _render(doc_type: str, data: Dict[str, Any], output_path: str) -> float:
+    from pdf_utils import create_pdf_from_markdown
+    started = time.perf_counter()
+    markdown = BUILDERS[doc_type](data)
+    create_pdf_from_markdown(content=markdown, is_html=False, output_filename=output_path)
+    return time.perf_counter() - started
+
+
+# === Головний цикл ===
+
+class Progress:
+    def __init__(self, stream: TextIO, quiet: bool):
+        self.stream = stream
+        self.quiet = quiet
+        self.started = time.perf_counter()
+        self.ok = 0
+        self.failed = 0
+        self.render_times: List[float] = []
+        self._last_print = 0.0
+
+    def update(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if self.quiet or (not force and now - self._last_print < 0.5):
+            return
+        self._last_print = now
+        elapsed = now - self.started
+        rate = self.ok / elapsed if elapsed else 0.0
+        self.stream.write(f"\r  готово {self.ok}, помилок {self.failed}, {rate:.1f} док/с ")
+        self.stream.flush()
+
+    def error(self, index: int, message: str) -> None:
+        self.failed += 1
+        self.stream.write(f"\n  [#{index}] ПОМИЛКА: {message}\n")
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    fmt = detect_format(args.input, args.format)
+    os.makedirs(args.out, exist_ok=True)
+    workers = args.workers or os.cpu_count() or 1
+    progress = Progress(sys.stderr, args.quiet)
+
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8-sig", newline="")
+    pending: Dict[Any, int] = {}
+
+    def collect(done) -> None:
+        for future in done:
+            index = pending.pop(future)
+            try:
+                progress.render_times.append(future.result())
+                progress.ok += 1
+            except Exception as e:
+                progress.error(index, str(e).splitlines()[0] if str(e) else type(e).__name__)
+        progress.update()
+
+    try:
+        with create_render_pool(workers, quiet=True) as pool:
+            # Прогріваємо кожен воркер (імпорт бекендів), поки читаємо вхід
+            for _ in range(workers):
+                pool.submit(warm_up_renderer)
+            for index, raw in enumerate(_READERS[fmt](stream), start=1):
+                try:
+                    doc_type, data = normalize_record(raw, args.type)
+                except ValueError as e:
+                    progress.error(index, str(e))
+                    continue
+
+                path = os.path.join(args.out, output_name(index, doc_type, data))
+                pending[pool.submit(_render, doc_type, data, path)] = index
+
+                # Обмежуємо кількість документів "у польоті" (пам'ять не росте з розміром файлу)
+                if len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    progress.update(force=True)
+    elapsed = time.perf_counter() - progress.started
+    times = sorted(progress.render_times)
+    print(f"\n\n=== Пакетна генерація ({workers} воркерів) ===")
+    print(f"Документів: {progress.ok} успішно, {progress.failed} з помилкою, за {elapsed:.2f} с")
+    if times:
+        print(f"Пропускна здатність: {progress.ok / elapsed:.1f} док/с")
+        print(f"Час на документ: p50 {times[len(times) // 2] * 1000:.0f} мс, "
+              f"p95 {times[min(len(times) - 1, int(len(times) * 0.95))] * 1000:.0f} мс")
+    print(f"Результат: {os.path.abspath(args.out)}")
+    return 1 if progress.failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пакетна генерація PDF (Політика / DPIA / Чек-ліст) з файлу відповідей.")
+    parser.add_argument("input", help="Файл з відповідями або '-' для stdin")
+    parser.add_argument("--format", choices=FORMATS, help="Формат входу (за замовчуванням — за розширенням)")
+    parser.add_argument("--type", choices=DOCUMENT_TYPES, help="Тип документа для записів без поля 'type'")
+    parser.add_argument("--out", default="batch_output", help="Каталог для PDF")
+    parser.add_argument("--workers", type=int, default=0, help="Кількість процесів (за замовчуванням — усі ядра)")
+    parser.add_argument("--quiet", action="store_true", help="Без рядка прогресу")
+    args = parser.parse_args()
+    if args.input == "-" and not args.format:
+        parser.error("для stdin потрібен --format")
+    sys.exit(run_batch(args))
+
+
+if __name__ == "__main__":
+    main()
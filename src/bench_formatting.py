@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.32) Ворожий корпус для повідомлень бота: legacy Markdown проти сутностей.
+
+Для кожного рядка корпусу (`CORPUS`) проходить екрани Політики, DPIA, Чек-ліста
+та "Повного комплекту", де КОЖНА відповідь — цей рядок, і збирає кожне
+"Головне" повідомлення двома способами:
+
+  legacy    — як до v3.32: `html.escape` + `str.format` у шаблон і
+              `parse_mode=Markdown`; текст розбирає `fake_bot_api.parse_legacy_markdown`
+              (той самий розбір, що в Telegram);
+  entities  — `tg_format.render` (функції bot.py) і `entities=`; перевіряє
+              `fake_bot_api.entities_error` + відповідь має бути в тексті дослівно.
+
+Виклики API рахує модель `edit_main_message` до v3.32: відхилене редагування
+(400) -> deleteMessage -> sendMessage з тим самим текстом (ще 400) — і
+повідомлення з питанням у користувача зникає; наступні екрани вже лише
+надсилаються (і теж відхиляються, поки в них є ця відповідь).
+
+"Зекономлено" = викликів legacy - викликів entities. "Спотворено" — екрани, які
+Telegram прийняв, але відповідь у них не дослівна ("AT&amp;T", "`" з'їдено).
+
+Приклад:
+    python bench_formatting.py
+    python bench_formatting.py --only backtick,underscore --show
+"""
+
+import argparse
+import html
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+
+import bot  # noqa: E402
+import templates  # noqa: E402
+import tg_format  # noqa: E402
+from fake_bot_api import entities_error, legacy_markdown_error, parse_legacy_markdown  # noqa: E402
+
+# (назва, відповідь) — те, що користувачі справді надсилають, і те, що ламає розмітку
+CORPUS: List[Tuple[str, str]] = [
+    ("plain", "Розклад КАІ"),
+    ("backtick", "Бот `beta`"),
+    ("lone_backtick", "it`s"),
+    ("underscore", "my_bot_v2"),
+    ("snake_email", "first_last@kai.edu.ua"),
+    ("asterisk", "5* готель"),
+    ("double_asterisk", "**важливо**"),
+    ("bracket", "[TODO"),
+    ("link", "[натисни](https://example.com)"),
+    ("pre", "```python\nprint(1)```"),
+    ("backslash", "C:\\Users\\bot_data\\"),
+    ("escaped", "\\_not italic\\_"),
+    ("html", "AT&T <b>bold</b> &amp;"),
+    ("emoji", "📥 Бот 🤖 для 👩‍💻 (ZWJ) і 🇺🇦"),
+    ("emoji_markup", "🤖_*`"),
+    ("combining", "е́ а́ ї"),
+    ("rtl", "مرحبا_עולם"),
+    ("newline_injection", "Назва\n---\n**Крок 9/5: фейк**"),
+    ("placeholder", "{project_name} {0} {{"),
+    ("markdown_v2", "_*[]()~`>#+-=|{}.!"),
+    ("long_mixed", "a_b*c`d[e " * 40),
+]
+
+# === legacy: побудова повідомлень до v3.32 ===
+
+def _legacy_dpia(data: dict) -> dict:
+    text = ""
+    minimization_data = data.get('minimization_data', [])
+    if data.get('data_list') and not minimization_data:
+        for i, item in enumerate(data['data_list']):
+            text += f"\n**{i+1}. {html.escape(item)}:** [Очікує...] "
+    else:
+        for i, item_data in enumerate(minimization_data):
+            item, reason = html.escape(item_data['item']), html.escape(item_data['reason'])
+            if item_data['needed']:
+                text += f"\n**{i+1}. {item}:** ✅ **Так** (Навіщо: `{reason}`)"
+            else:
+                text += f"\n**{i+1}. {item}:** ❌ **Ні** (`{reason}`)"
+    fields = {
+        key: html.escape(data.get(key, '...'))
+        for key in ('project_name', 'team', 'goal', 'retention_period', 'retention_mechanism', 'storage', 'risk',
+                    'mitigation')
+    }
+    fields['data_list'] = "\n".join(f"- `{html.escape(item)}`" for item in data.get('data_list', []))
+    fields['minimization_summary'] = text.strip()
+    return fields
+
+
+def _legacy_checklist(cl: dict) -> dict:
+    summary = f"✅ **Назва Проєкту:** `{html.escape(cl.get('project_name', '...'))}`\n\n"
+    for key, name in (('c1_s1', "1.1. 2FA"), ('c1_s2', "1.2. 'Найменші привілеї'")):
+        if cl.get(f"{key}_status"):
+            summary += f"**{name}:** ✅ **Виконано**\n"
+            if cl.get(f"{key}_note"):
+                summary += f"Нотатка: `{html.escape(cl[f'{key}_note'])}`\n"
+    return {'project_name': html.escape(cl.get('project_name', '...')), 'summary_text': summary.strip(),
+            'status': "✅ **Виконано**"}
+
+
+# === Сценарії: (екран, legacy-текст, entities-повідомлення) ===
+
+Screen = Tuple[str, str, Dict]
+
+
+def screens(answer: str) -> List[Screen]:
+    result: List[Screen] = []
+
+    def add(name: str, template: str, legacy: dict, rich: dict, **extra) -> None:
+        result.append((name, template.format(**legacy, **extra), tg_format.message(template, **rich, **extra)))
+
+    policy: Dict = {}
+    for field, template in (
+        ('project_name', templates.POLICY_Q_CONTACT), ('contact', templates.POLICY_Q_DATA_COLLECTED),
+        ('data_collected', templates.POLICY_Q_DATA_STORAGE), ('data_storage', templates.POLICY_Q_DELETE_MECHANISM),
+    ):
+        policy[field] = answer
+        legacy = {key: html.escape(value) for key, value in policy.items()}
+        add(f"policy:{field}", template, {**bot.get_policy_template_data({}), **legacy},
+            bot.get_policy_template_data(policy))
+
+    dpia: Dict = {'minimization_data': [], 'data_list': []}
+    for field, template in (
+        ('project_name', templates.DPIA_Q_TEAM), ('team', templates.DPIA_Q_GOAL), ('goal', templates.DPIA_Q_DATA_LIST),
+    ):
+        dpia[field] = answer
+        add(f"dpia:{field}", template, _legacy_dpia(dpia), bot.get_dpia_template_data(dpia))
+    dpia['data_list'] = [answer, "Email"]
+    dpia['min_needed'] = [True, True]
+    add("dpia:data_list", templates.DPIA_Q_MINIMIZATION_SELECT, _legacy_dpia(dpia), bot.get_dpia_template_data(dpia),
+        kept=2, total=2)
+    legacy_items = "\n".join(f"{n}. `{html.escape(item)}`" for n, item in enumerate(dpia['data_list'], 1))
+    result.append(("dpia:min_done", templates.DPIA_Q_MINIMIZATION_REASONS.format(kept=2, total=2, items=legacy_items),
+                   tg_format.message(templates.DPIA_Q_MINIMIZATION_REASONS, kept=2, total=2,
+                                     items=bot._format_reason_items(dpia, [0, 1]))))
+    dpia['minimization_data'] = [
+        {'item': answer, 'needed': True, 'reason': answer},
+        {'item': "Email", 'needed': False, 'reason': "Відмовлено (мінімізовано)"},
+    ]
+    for field, template in (
+        ('min_reasons', templates.DPIA_Q_RETENTION_PERIOD), ('retention_period', templates.DPIA_Q_RETENTION_MECHANISM),
+        ('retention_mechanism', templates.DPIA_Q_STORAGE), ('storage', templates.DPIA_Q_RISK),
+        ('risk', templates.DPIA_Q_MITIGATION), ('mitigation', templates.KIT_Q_CONTACT),
+    ):
+        if field != 'min_reasons':
+            dpia[field] = answer
+        add(f"dpia:{field}", template, _legacy_dpia(dpia), bot.get_dpia_template_data(dpia))
+
+    cl: Dict = {'project_name': answer}
+    add("checklist:project_name", templates.CHECKLIST_C1_S1_STATUS, _legacy_checklist(cl),
+        bot.get_checklist_template_data(cl))
+    cl['c1_s1_status'] = "yes"
+    rich = {**bot.get_checklist_template_data(cl), 'status': bot.get_status_text_md("yes")}
+    add("checklist:status", templates.CHECKLIST_C1_S1_NOTE, _legacy_checklist(cl), rich)
+    cl['c1_s1_note'] = answer
+    add("checklist:note", templates.CHECKLIST_C1_S2_STATUS, _legacy_checklist(cl), bot.get_checklist_template_data(cl))
+    return result
+
+
+# === Модель викликів API ===
+
+Check = Callable[[str, Dict], Optional[str]]
+
+
+def _legacy_check(text: str, _: Dict) -> Optional[str]:
+    return legacy_markdown_error(text)
+
+
+def _entities_check(_: str, message: Dict) -> Optional[str]:
+    return entities_error(message["text"], [entity.to_dict() for entity in message["entities"]])
+
+
+def replay(flow: List[Tuple[str, str, Dict]], check: Check) -> dict:
+    """Прогін екранів сценарію через модель `edit_main_message` (див. модуль)."""
+    stats = {"calls": 0, "rejected": 0, "lost": 0}
+    scenario, has_message = None, True
+    for screen, legacy_text, message in flow:
+        if screen.split(":")[0] != scenario:
+            # Перший екран сценарію редагує вже надіслане повідомлення
+            scenario, has_message = screen.split(":")[0], True
+        stats["calls"] += 1
+        if not check(legacy_text, message):
+            has_message = True
+            continue
+        stats["rejected"] += 1
+        if has_message:
+            # Редагування відхилено -> видалити й надіслати новим (теж 400)
+            stats["calls"] += 2
+            stats["rejected"] += 1
+            has_message = False
+        stats["lost"] += 1
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ворожий корпус: legacy Markdown проти локальних сутностей.")
+    parser.add_argument("--only", help="Лише ці рядки корпусу (через кому)")
+    parser.add_argument("--show", action="store_true", help="Показати відхилені legacy-екрани з помилкою Telegram")
+    args = parser.parse_args()
+
+    corpus = [(name, text) for name, text in CORPUS if not args.only or name in args.only.split(",")]
+    totals = {"legacy": {"calls": 0, "rejected": 0, "lost": 0}, "entities": {"calls": 0, "rejected": 0, "lost": 0}}
+    mismatches = 0
+    mangled_total = 0
+
+    print(f"\n{'відповідь':<18} {'екранів':>8} {'legacy: 400':>12} {'втрачено':>9} {'спотворено':>11} {'викликів':>9}   "
+          f"{'entities: 400':>13} {'викликів':>9} {'зекономлено':>12}")
+    for name, answer in corpus:
+        flow = screens(answer)
+        legacy = replay(flow, _legacy_check)
+        entities = replay(flow, _entities_check)
+        # Відповідь має дійти до користувача дослівно (без екранування й без "з'їденої" розмітки)
+        mismatches += sum(1 for _, _, message in flow if answer.strip() not in message["text"])
+        mangled = 0
+        for _, text, _ in flow:
+            shown, error = parse_legacy_markdown(text)
+            mangled += not error and answer.strip() not in shown
+        mangled_total += mangled
+        for mode, stats in (("legacy", legacy), ("entities", entities)):
+            for key in stats:
+                totals[mode][key] += stats[key]
+        print(f"{name:<18} {len(flow):>8} {legacy['rejected']:>12} {legacy['lost']:>9} {mangled:>11} {legacy['calls']:>9}   "
+              f"{entities['rejected']:>13} {entities['calls']:>9} {legacy['calls'] - entities['calls']:>12}")
+        if args.show:
+            for screen, text, _ in flow:
+                error = legacy_markdown_error(text)
+                if error:
+                    print(f"    {screen:<28} {error}")
+
+    legacy, entities = totals["legacy"], totals["entities"]
+    print(f"\nРазом: legacy — {legacy['rejected']} відповідей 400 на {legacy['calls']} викликів, "
+          f"{legacy['lost']} екранів не дійшли до користувача, {mangled_total} показали відповідь спотвореною;")
+    print(f"       entities — {entities['rejected']} відповідей 400 на {entities['calls']} викликів.")
+    print(f"Зекономлено викликів API: {legacy['calls'] - entities['calls']}; "
+          f"відповідь не дослівно в тексті: {mismatches}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.13) Бенчмарк: скільки часу event loop витрачає на логування.
+
+Імітує обробку апдейтів з тим самим набором рядків логу, що пише бот на один
+крок розмови (бот + httpx), і порівнює режими:
+
+  sync-fstring   — як було: basicConfig (синхронний StreamHandler) + f-рядки
+  sync-lazy      — basicConfig + ліниве %-форматування
+  queue-lazy     — logging_setup: QueueHandler + фоновий потік + семплінг
+  queue-json     — те саме з LOG_FORMAT=json
+
+Приклад:
+    python bench_logging.py --updates 20000 --sink-delay-ms 0.05
+`--sink-delay-ms` імітує повільний приймач stderr (journald, переповнений pipe).
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import logging_setup
+
+USER_ID = 123456789
+MESSAGE_ID = 42
+API_URL = "https://api.telegram.org/bot<token>/editMessageText"
+
+
+class SlowFile:
+    """Файловий потік з штучною затримкою кожного write (повільний stderr)."""
+
+    def __init__(self, path: str, delay_s: float):
+        self._file = open(path, "w", encoding="utf-8")
+        self._delay_s = delay_s
+
+    def write(self, data: str) -> int:
+        if self._delay_s:
+            time.sleep(self._delay_s)
+        return self._file.write(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def emit_fstring(bot_log, pdf_log, httpx_log) -> None:
+    bot_log.info(f"User {USER_ID}: крок розмови.")
+    bot_log.info(f"Видалено 'Головне' повідомлення {MESSAGE_ID}")
+    bot_log.info(f"Очищення даних для user {USER_ID}.")
+    pdf_log.info(f"Тимчасовий файл видалено: policy_{USER_ID}.pdf")
+    for _ in range(3):
+        httpx_log.info(f'HTTP Request: POST {API_URL} "HTTP/1.1 200 OK"')
+
+
+def emit_lazy(bot_log, pdf_log, httpx_log) -> None:
+    bot_log.info("User %s: крок розмови.", USER_ID)
+    bot_log.info("Видалено 'Головне' повідомлення %s", MESSAGE_ID)
+    bot_log.info("Очищення даних для user %s.", USER_ID)
+    pdf_log.info("Тимчасовий файл видалено: policy_%s.pdf", USER_ID)
+    for _ in range(3):
+        httpx_log.info('HTTP Request: %s %s "%s %d %s"', "POST", API_URL, "HTTP/1.1", 200, "OK")
+
+
+async def run_updates(updates: int, emit) -> list:
+    """Повертає час (с), витрачений на логування в кожному апдейті."""
+    bot_log = logging.getLogger("bench.bot")
+    pdf_log = logging.getLogger("bench.pdf_utils")
+    httpx_log = logging.getLogger("httpx")
+    samples = []
+    for i in range(updates):
+        started = time.perf_counter()
+        emit(bot_log, pdf_log, httpx_log)
+        samples.append(time.perf_counter() - started)
+        if i % 100 == 0:
+            # Даємо шанс іншим задачам, як у справжньому боті
+            await asyncio.sleep(0)
+    return samples
+
+
+def run_mode(mode: str, updates: int, sink_delay_s: float, sink_path: str) -> dict:
+    sink = SlowFile(sink_path, sink_delay_s)
+    if mode.startswith("sync"):
+        logging.basicConfig(format=logging_setup.TEXT_FORMAT, level=logging.INFO, stream=sink, force=True)
+    else:
+        logging_setup.configure_logging(
+            level="INFO", fmt="json" if mode == "queue-json" else "text", sampling="", stream=sink
+        )
+
+    emit = emit_fstring if mode == "sync-fstring" else emit_lazy
+    samples = asyncio.run(run_updates(updates, emit))
+
+    # Скільки ще треба, щоб фоновий потік дописав чергу (поза event loop)
+    drain_started = time.perf_counter()
+    logging_setup.stop_logging()
+    drain = time.perf_counter() - drain_started
+    for handler in list(logging.getLogger().handlers):
+        logging.getLogger().removeHandler(handler)
+    sink.close()
+
+    samples.sort()
+    return {
+        "mode": mode,
+        "loop_total_ms": sum(samples) * 1000,
+        "per_update_us": statistics.mean(samples) * 1e6,
+        "p99_us": samples[int(len(samples) * 0.99) - 1] * 1e6,
+        "drain_ms": drain * 1000,
+        "lines": sum(1 for _ in open(sink_path, encoding="utf-8")),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Час event loop, витрачений на логування.")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--sink-delay-ms", type=float, default=0.0,
+                        help="Штучна затримка кожного запису в приймач (імітація повільного stderr)")
+    parser.add_argument("--modes", default="sync-fstring,sync-lazy,queue-lazy,queue-json")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(","):
+            results.append(run_mode(mode, args.updates, args.sink_delay_ms / 1000, os.path.join(tmp, f"{mode}.log")))
+
+    print(f"\n{args.updates} апдейтів, 7 рядків логу на апдейт (з них 3 - httpx), "
+          f"затримка приймача {args.sink_delay_ms} мс\n")
+    print(f"  {'режим':<14} {'у loop, мс':>11} {'на апдейт, мкс':>15} {'p99, мкс':>9} "
+          f"{'дозапис, мс':>12} {'рядків':>8}")
+    for r in results:
+        print(f"  {r['mode']:<14} {r['loop_total_ms']:>11.1f} {r['per_update_us']:>15.1f} {r['p99_us']:>9.1f} "
+              f"{r['drain_ms']:>12.1f} {r['lines']:>8}")
+    print("\n'дозапис' — час фонового потоку після завершення (поза event loop).")
+    print("Для queue-режимів діє семплінг за замовчуванням (httpx=5%).")
+
+
+if __name__ == "__main__":
+    main()
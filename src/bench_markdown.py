@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.31) Фаз-бенчмарк Markdown-шляху: найгірший час перетворення документа.
+
+Заповнює КОЖНЕ поле відповіді Політики, DPIA та Чек-ліста ворожим текстом і
+міряє `pdf_utils._md_to_html` (markdown2 з розширеннями бота) у двох режимах:
+
+  legacy    — як до v3.31: лише `html.escape` (переноси в нотатках -> <br>)
+  sanitize  — `sanitize.clean_text`: ліміти за питаннями, сутності замість
+              метасимволів, переноси -> <br>
+
+Сімейства даних (кожне — розміром --sizes символів на поле):
+  run:X      — серія одного метасимволу ("*" * N, "[" * N, ...)
+  alt:X      — чергування розмітки з текстом ("*a", "[a](", ...)
+  nested     — вкладений список ("  " * i + "- x" по рядку на рівень)
+  table      — рядки, схожі на таблицю ("a | b" + "| --- |")
+  random     — випадкова суміш метасимволів, літер і переносів (--seed)
+
+"Збої" — винятки markdown2 (напр., RecursionError на глибокому списку):
+документ узагалі не рендериться.
+
+Приклад:
+    python bench_markdown.py --sizes 100,1000,4000 --random 10 --top 5
+"""
+
+import argparse
+import contextlib
+import html
+import json
+import random
+import statistics
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import documents
+import pdf_utils
+import sanitize
+
+METACHARS = "*_[]`|~<>\\#!()&-+.\n "
+RUNS = "*_[`|~<\\"
+ALTERNATIONS = ("*a", "_a ", "[a](", "![", "**_", "`a", "\\*")
+
+
+def payloads(sizes: List[int], random_samples: int, seed: int) -> Iterator[Tuple[str, int, str]]:
+    """(сімейство, розмір, текст поля)."""
+    rng = random.Random(seed)
+    for size in sizes:
+        for char in RUNS:
+            yield f"run:{char!r}", size, char * size
+        for pattern in ALTERNATIONS:
+            yield f"alt:{pattern!r}", size, (pattern * (size // len(pattern) + 1))[:size]
+        yield "nested", size, "\n".join("  " * level + "- x" for level in range(max(size // 8, 1)))[:size]
+        yield "table", size, ("a | b\n| --- | --- |\n" * (size // 19 + 1))[:size]
+        alphabet = METACHARS + "абвгдxyz"
+        for i in range(random_samples):
+            yield f"random#{i}", size, "".join(rng.choice(alphabet) for _ in range(size))
+
+
+def fill(doc_type: str, text: str) -> dict:
+    """Відповіді документа, де кожне поле — `text`."""
+    if doc_type == "policy":
+        fields = ("project_name", "contact", "data_collected", "data_storage", "delete_mechanism")
+        return {field: text for field in fields}
+    if doc_type == "dpia":
+        fields = ("project_name", "team", "goal", "retention_period", "retention_mechanism", "storage", "risk",
+                  "mitigation")
+        data = {field: text for field in fields}
+        data["minimization_data"] = [
+            {"item": text, "needed": True, "reason": text},
+            {"item": text, "needed": False, "reason": "Відмовлено"},
+        ]
+        return data
+    data = {"project_name": text}
+    for key in documents.CHECKLIST_KEYS:
+        data[f"{key}_status"] = "yes"
+        data[f"{key}_note"] = text
+    return data
+
+
+def _legacy_answer(data: dict, field: str, default: str) -> str:
+    return html.escape(data.get(field, default))
+
+
+def _legacy_clean_text(value, field: str) -> str:
+    text = html.escape(str(value))
+    return text.replace("\n", "<br>") if field.endswith("_note") else text
+
+
+@contextlib.contextmanager
+def mode(name: str) -> Iterator[None]:
+    """legacy — тимчасово підміняє `sanitize` поведінкою до v3.31."""
+    if name != "legacy":
+        yield
+        return
+    saved = sanitize.answer, sanitize.clean_text
+    sanitize.answer, sanitize.clean_text = _legacy_answer, _legacy_clean_text
+    try:
+        yield
+    finally:
+        sanitize.answer, sanitize.clean_text = saved
+
+
+BUILDERS: Dict[str, Callable[[dict], str]] = {
+    "policy": documents.build_policy_markdown,
+    "dpia": documents.build_dpia_markdown,
+    "checklist": documents.build_checklist_markdown,
+}
+
+
+def run(sizes: List[int], random_samples: int, seed: int, modes: List[str]) -> List[dict]:
+    results = []
+    for mode_name in modes:
+        with mode(mode_name):
+            for doc_type, build in BUILDERS.items():
+                for family, size, text in payloads(sizes, random_samples, seed):
+                    started = time.perf_counter()
+                    error = None
+                    try:
+                        pdf_utils._md_to_html(build(fill(doc_type, text)))
+                    except Exception as e:
+                        error = type(e).__name__
+                    results.append({
+                        "mode": mode_name, "document": doc_type, "family": family, "size": size,
+                        "ms": (time.perf_counter() - started) * 1000, "error": error,
+                    })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Фаз-бенчмарк перетворення Markdown -> HTML на ворожих відповідях.")
+    parser.add_argument("--sizes", default="100,1000,4000", help="Символів на поле (4000 — ліміт повідомлення Telegram)")
+    parser.add_argument("--random", type=int, default=10, help="Випадкових зразків на розмір")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--modes", default="legacy,sanitize")
+    parser.add_argument("--top", type=int, default=5, help="Скільки найгірших випадків показати на режим")
+    parser.add_argument("--json", help="Записати всі виміри у JSON-файл")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    modes = args.modes.split(",")
+    results = run(sizes, args.random, args.seed, modes)
+
+    print(f"\nПеретворення Markdown -> HTML, поля розміром {args.sizes} символів (мс):")
+    print(f"  {'режим':<10} {'документ':<10} {'випадків':>9} {'збоїв':>6} {'медіана':>9} {'p99':>9} {'найгірше':>9}  на чому")
+    for mode_name in modes:
+        for doc_type in BUILDERS:
+            rows = [r for r in results if r["mode"] == mode_name and r["document"] == doc_type]
+            times = sorted(r["ms"] for r in rows)
+            worst = max(rows, key=lambda r: r["ms"])
+            crashes = sum(1 for r in rows if r["error"])
+            p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+            print(f"  {mode_name:<10} {doc_type:<10} {len(rows):>9} {crashes:>6} {statistics.median(times):>9.1f} "
+                  f"{p99:>9.1f} {worst['ms']:>9.1f}  {worst['family']} x{worst['size']}")
+
+    for mode_name in modes:
+        worst = sorted((r for r in results if r["mode"] == mode_name), key=lambda r: r["ms"], reverse=True)
+        print(f"\nНайгірші випадки ({mode_name}):")
+        for r in worst[:args.top]:
+            suffix = f"  ЗБІЙ: {r['error']}" if r["error"] else ""
+            print(f"  {r['ms']:>9.1f} мс  {r['document']:<10} {r['family']} x{r['size']}{suffix}")
+        crashed = sorted({(r["document"], r["family"], r["error"]) for r in results if r["mode"] == mode_name and r["error"]})
+        for doc_type, family, error in crashed:
+            print(f"  збій: {doc_type:<10} {family}: {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"\nВиміри записано у {args.json}.")
+
+
+if __name__ == "__main__":
+    main()
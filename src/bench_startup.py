@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.14) Бенчмарк холодного старту бота проти фейкового Bot API.
+
+Для кожного запуску стартує НОВИЙ процес `bot.py` і міряє:
+  - до getUpdates   — від запуску процесу до першого опитування;
+  - перший апдейт   — від запуску до відповіді на /start (апдейт уже
+                      чекає в черзі, коли бот стартує);
+  - рендер 1-го PDF — від останньої відповіді Політики до sendDocument
+                      (саме тут раніше платили за імпорт xhtml2pdf);
+  - перший PDF      — від запуску процесу до першого доставленого PDF.
+
+Між /start і сценарієм Політики є пауза --think-ms (живий користувач
+читає меню й відповідає на 5 питань — це секунди, а не мілісекунди).
+
+Порівнюються режими з прогрівом (за замовчуванням) і без (RENDER_WARM_UP=0).
+
+Приклад:
+    python bench_startup.py --runs 3
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from fake_bot_api import FakeBotAPI, serve
+from loadtest import Stats, VirtualUser, policy_script
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+async def measure_once(host: str, port: int, warm_up: bool, step_timeout: float, think_s: float) -> Dict[str, float]:
+    api = FakeBotAPI()
+    runner = await serve(api, host, port)
+
+    env = dict(os.environ)
+    env["BOT_TOKEN"] = env.get("BOT_TOKEN") or "123456:FAKE"
+    env["TELEGRAM_API_BASE_URL"] = f"http://{host}:{port}/bot"
+    env["RENDER_WARM_UP"] = "1" if warm_up else "0"
+
+    stats = Stats()
+    started = time.perf_counter()
+    bot_process = subprocess.Popen(
+        [sys.executable, BOT_PATH], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        # /start потрапляє в чергу одразу — бот забере його першим же getUpdates
+        first = VirtualUser(api, 10**9, stats, step_timeout)
+        if not await first.run([("cmd", "/start", "start")]):
+            raise SystemExit("Бот не відповів на /start.")
+        first_update_at = started + stats.latencies["start"][0]
+
+        # Після паузи — повний сценарій Політики (перший PDF у житті процесу)
+        await asyncio.sleep(think_s)
+        user = VirtualUser(api, 10**9 + 1, stats, step_timeout)
+        if not await user.run(policy_script(1)):
+            raise SystemExit("Сценарій Політики не завершився.")
+        first_pdf_at = time.perf_counter()
+
+        return {
+            "to_get_updates": api.first_get_updates_at - started,
+            "first_update": first_update_at - started,
+            "first_render": stats.latencies["policy:generate:pdf"][0],
+            "first_pdf": first_pdf_at - started,
+        }
+    finally:
+        bot_process.terminate()
+        deadline = time.perf_counter() + 15
+        while bot_process.poll() is None and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        if bot_process.poll() is None:
+            bot_process.kill()
+        await runner.cleanup()
+
+
+async def run(args: argparse.Namespace) -> None:
+    results: Dict[str, List[Dict[str, float]]] = {"з прогрівом": [], "без прогріву": []}
+    for i in range(args.runs):
+        for mode, warm_up in (("з прогрівом", True), ("без прогріву", False)):
+            sample = await measure_once(args.host, args.port, warm_up, args.step_timeout, args.think_ms / 1000)
+            results[mode].append(sample)
+            print(f"  запуск {i + 1}/{args.runs} ({mode}): перший PDF через {sample['first_pdf'] * 1000:.0f} мс")
+
+    columns = (
+        ("to_get_updates", "до getUpdates"),
+        ("first_update", "перший апдейт"),
+        ("first_render", "рендер 1-го PDF"),
+        ("first_pdf", "перший PDF"),
+    )
+    print(f"\nМедіана з {args.runs} запусків (мс):")
+    print(f"  {'режим':<14}" + "".join(f"{title:>18}" for _, title in columns))
+    for mode, samples in results.items():
+        row = "".join(f"{statistics.median(s[key] for s in samples) * 1000:>18.0f}" for key, _ in columns)
+        print(f"  {mode:<14}{row}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Час до першого апдейту та першого PDF після старту бота.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--step-timeout", type=float, default=30.0)
+    parser.add_argument("--think-ms", type=float, default=2000.0,
+                        help="Пауза між /start і сценарієм Політики")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,115 @@
 #
 # -*- coding: utf-8 -*-
 """
-Головний файл бота "Privacy Sentry" (v3.8 - Фікс Чек-ліста)
+Головний файл бота "Privacy Sentry" (v3.33 - Довгі підсумки)
 
 Що нового:
+- (v3.33) "Головне" повідомлення більше не перевищує ліміт Telegram: перед
+  надсиланням `tg_format.fit` міряє текст (4096 символів UTF-16 і бюджет
+  MAIN_MESSAGE_BUDGET_BYTES на текст + сутності) і згортає старі відповіді в
+  дайджест, а за потреби ховає їх за одним рядком. Повний підсумок — кнопка
+  "📋 Показати підсумок" (сторінки ◀️/▶️, "↩️ До питання"). DPIA зі 150
+  пунктами чи Чек-ліст з довгими нотатками більше не падає на
+  "message is too long" (loadtest --dpia-items 150, --mix long=1).
+- (v3.32) Повідомлення бота збираються локально (`tg_format.py`): розмітка
+  шаблонів -> MessageEntity (зсуви в UTF-16), відповіді вставляються як текст,
+  без `ParseMode.MARKDOWN` і без `html.escape`. "`" чи "_" у відповіді більше
+  не дають 400 "can't parse entities" і не запускають повторне надсилання
+  (`bench_formatting.py`: 136 відхилених викликів -> 0); заголовки `**...**`
+  нарешті жирні. "Message to edit not found" розпізнається без урахування регістру.
+- (v3.31) Відповіді потрапляють у PDF лише через `sanitize.py`: ліміт довжини
+  за питанням, метасимволи Markdown -> HTML-сутності, переноси -> <br>.
+  Ворожий текст ("[" * 4000, "|" у клітинках) більше не ламає таблиці й не
+  вмикає повільні регулярки markdown2 (секунди -> десятки мс, `bench_markdown.py`).
+- (v3.30) Кожен PDF рендериться в окремому процесі з лімітами пам'яті, CPU і
+  розміру файлу (RENDER_MAX_MEMORY_MB / _CPU_SECONDS / _OUTPUT_MB): патологічний
+  документ отримує зрозуміле повідомлення (`pdf_utils.RenderLimitExceeded`)
+  і метрику `pdf_render_limit_exceeded_total`, а не OOM для всього бота.
+- (v3.29) Рендер можна винести в окремий демон (`render_daemon.py`): з
+  RENDER_SOCKET бот надсилає Markdown через Unix-сокет (пул з'єднань,
+  дедлайн RENDER_DEADLINE) і отримує PDF; без демона — рендер у власному пулі.
+- (v3.28) Горизонтальне масштабування (`dispatcher.py`): вебхук-диспетчер
+  шардує апдейти за user_id (консистентне хешування) по N процесах bot.py;
+  з BOT_WORKER_PORT бот працює воркером — без Updater, апдейти приходять
+  від диспетчера. Перевірки здоров'я, перезапуск і ребалансування воркерів.
+- (v3.27) Монітор затримки event loop (`loop_monitor.py`): серцебиття в циклі
+  + потік-вартовий, що під час блокування понад LOOP_LAG_THRESHOLD знімає
+  стек і хендлер; WARNING у лог, метрики event_loop_lag_seconds та
+  event_loop_blocked_total{handler}. USE_UVLOOP=1 — цикл uvloop.
+- (v3.26) Тимчасові PDF — у спулі `pdf_utils.SPOOL` (tmpfs, PDF_SPOOL_DIR)
+  з унікальними іменами замість `policy_{user_id}.pdf` у робочому каталозі;
+  квота PDF_SPOOL_QUOTA обмежує пам'ять при сплеску генерацій, файл втрачає
+  ім'я одразу після рендера, "сироти" прибираються на старті й періодично.
+  Процеси зі спільним каталогом (воркери диспетчера, демон рендера) ділять
+  квоту порівну (PDF_SPOOL_PROCESSES), кожен — у своєму підкаталозі.
+- (v3.25) Коректна зупинка (`shutdown.py`): під час деплою нові генерації
+  не приймаються, поточні рендери й надсилання мають SHUTDOWN_DEADLINE
+  секунд, решта скасовується з проханням повторити; тимчасові PDF
+  прибираються (і під час старту), у лог пишеться звіт.
+- (v3.24) Тимчасові повідомлення ("блокувальник", "Генерую ваш PDF...")
+  видаляє один фоновий "підмітальник" (`expiry.py`: купа термінів,
+  пакетний deleteMessages на чат) замість задачі APScheduler на кожне
+  повідомлення; JobQueue більше не створюється.
+- (v3.23) Token bucket на користувача до хендлерів (`throttle.py`, група -2:
+  THROTTLE_RATE/THROTTLE_BURST) — надлишкові натискання кнопок відкидаються
+  (лише `query.answer()`, без розмови); повідомлення ліміт не відкидає.
+  "Блокувальник" перемикання воркфлоу — один на чат: повторні натискання
+  лише відсувають його видалення (без нового повідомлення і нової задачі).
+- (v3.22) Ідемпотентність (`idempotency.py`): дублікати update_id /
+  callback_query.id і повторне натискання тієї ж кнопки (DEDUP_TAP_WINDOW)
+  відкидаються в групі -3 з дешевим `query.answer()`; генерація — не
+  більше однієї на користувача (`@single_flight_generation`), тож подвійне
+  "Пропустити" на останньому кроці більше не рендерить PDF двічі.
+- (v3.21) "Повний комплект": питання DPIA + контакт + статуси Чек-ліста
+  одним проходом; Політика та Чек-ліст виводяться зі спільних відповідей
+  (`documents.build_kit_records`), три PDF рендеряться одночасно в пулі,
+  доставка — одна медіагрупа (або zip у пам'яті: KIT_DELIVERY=zip).
+- (v3.20) Крок мінімізації DPIA — один екран: усі пункти як перемикачі
+  ✅/❌ (по сторінках), потім обґрунтування для залишених пунктів одним
+  багаторядковим повідомленням. DPIA з 30 пунктами (половину знято):
+  ~115 -> ~63 виклики Bot API, 56 -> 30 дій користувача (loadtest --dpia-items 30).
+- (v3.19) Заповнений Чек-ліст (копія `3_minimization_checklist.md` з
+  "- [x]" або таблиця з нашого PDF) можна вставити текстом чи надіслати
+  файлом .md/.txt — бот одразу генерує PDF замість 19 кроків (~40 викликів
+  Bot API). Парсер: `documents.parse_checklist_markdown`.
+- (v3.18) Заповнений офлайн `1_dpia_lite.xlsx` можна просто надіслати боту:
+  файл читається в read-only режимі поза event loop (ліміти розміру та
+  рядків), бот показує один екран підсумку і після "Згенерувати" одразу
+  надсилає документи — без 12 кроків розмови.
+- (v3.17) DPIA також надсилається як редагований .xlsx (`xlsx_export.py`):
+  шаблон `artifacts/1_dpia_lite.xlsx` розбирається один раз під час
+  прогріву, далі — клонування моделі й write-only запис у пам'ять.
+  Без openpyxl бот надсилає лише PDF.
+- (v3.16) PDF рендериться в пулі процесів (`pdf_utils.render_pdf_async`,
+  RENDER_WORKERS) — event loop більше не блокується на сотні мс, а апдейти
+  різних користувачів обробляються паралельно (`update_processor.py`,
+  UPDATE_CONCURRENCY; апдейти одного користувача — по черзі).
+  Той самий пул і ті самі збирачі використовує HTTP API (`http_api.py`):
+  у процесі бота (HTTP_API_PORT) або окремо.
+- (v3.15) Markdown документів збирається в `documents.py` (спільно з
+  `batch_cli.py` — пакетна генерація PDF для цілого потоку з JSON/YAML/CSV
+  на всіх ядрах). Генератори бота лише викликають `build_*_markdown`.
+- (v3.14) Старт у дві фази: бот починає опитування одразу (markdown2 та
+  бекенди PDF більше не імпортуються під час старту), а `post_init` у фоні
+  перевіряє шаблони, знаходить робочі бекенди і робить пробний рендер.
+  Вимкнути прогрів: RENDER_WARM_UP=0. Вимірювання: `bench_startup.py`.
+- (v3.13) Логування більше не пише в stderr з event loop (`logging_setup.py`):
+  QueueHandler + QueueListener у фоновому потоці, ліниве %-форматування,
+  семплінг INFO по логерах (LOG_SAMPLING), JSON-вивід (LOG_FORMAT=json).
+- (v3.12) Наскрізне трасування (`tracing.py`): кожен апдейт отримує
+  анонімний випадковий trace_id, спани покривають хендлер, видалення/
+  редагування повідомлень, рендер PDF, send_document і очистку файлу.
+  Експорт у JSONL або OTLP/HTTP (TRACE_EXPORT), семплінг TRACE_SAMPLE_RATE.
+- (v3.11) Prometheus-метрики (`metrics.py`, ендпоінт /metrics на METRICS_PORT):
+  латентність кроків за станом, виклики Bot API, рендер по бекендах,
+  активні сесії та глибина черги генерацій. Жодних user_id у мітках.
+- (v3.10) TELEGRAM_API_BASE_URL: бот може працювати проти фейкового
+  Bot API (`fake_bot_api.py`) для навантажувальних тестів (`loadtest.py`).
+- (v3.9) Опційне зашифроване сховище незавершених сесій (`session_store.py`):
+  - Вмикається змінною SESSION_STORE_PATH; ключ — SESSION_STORE_KEY.
+  - Рестарт/деплой більше не "викидає" користувачів посеред аудиту.
+  - Записи живуть не довше SESSION_STORE_TTL, завершені сесії
+    стираються негайно в `clear_user_data`.
 - (v3.8) КРИТИЧНИЙ ФІКС (KeyError):
   - `checklist_conv_handler` тепер має НОВИЙ
     перший стан: `CHECKLIST_Q_PROJECT_NAME`.
@@ -24,20 +130,27 @@
   - Змінено нумерацію на "Категорія X (Питання Y/9)".
 """
 
+import contextlib
+import functools
 import logging
 import os
-import html
-import asyncio # (v3.6) Потрібно для job_queue
-from datetime import date
+import io
+import re
+import string
+import time
+import zipfile
+import asyncio # (v3.6) Фонові задачі (прогрів, "підмітальник" тимчасових повідомлень)
 from dotenv import load_dotenv
-from telegram import Update, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaDocument
 from telegram.ext import (
     Application,
     CommandHandler,
     ConversationHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters,
+    CallbackContext,
     ContextTypes,
 )
 from telegram.constants import ParseMode
@@ -46,14 +159,47 @@ from telegram.error import BadRequest
 # Локальні імпорти
 import templates
 # (Важливо!) Ми припускаємо, що це 'pdf_utils.py' від твого товариша (v3.2)
-from pdf_utils import create_pdf_from_markdown, clear_temp_file
+from pdf_utils import (
+    SPOOL, render_pdf_async, warm_up_render_pool, shutdown_render_pool, sweep_temp_pdfs, close_render_client
+)
+# (v3.15) Спільні (з batch_cli.py) збирачі Markdown документів
+from documents import (
+    CHECKLIST_CATEGORIES,
+    build_checklist_markdown,
+    build_dpia_markdown,
+    build_kit_records,
+    build_policy_markdown,
+    parse_checklist_markdown,
+)
+# (v3.17) Excel-версія DPIA (опційно, потрібен openpyxl)
+from xlsx_export import build_dpia_xlsx, load_dpia_template, parse_dpia_xlsx, xlsx_available
+# (v3.9) Опційне зашифроване сховище незавершених сесій
+from session_store import build_session_persistence
+# (v3.16) Паралельна обробка користувачів (апдейти одного — по черзі)
+from update_processor import PerUserUpdateProcessor
+# (v3.22) Дублікати апдейтів і single-flight генерації
+from idempotency import SingleFlight, UpdateDeduplicator
+# (v3.23) Ліміт частоти апдейтів на користувача
+from throttle import UpdateThrottle
+# (v3.24) Відкладене видалення тимчасових повідомлень
+from expiry import ExpiryService
+# (v3.25) Коректна зупинка: дочекатися генерацій, решту скасувати
+from shutdown import ShutdownCoordinator
+# (v3.27) Монітор затримки event loop та опційний uvloop
+from loop_monitor import LoopLagMonitor, install_uvloop
+# (v3.11) Prometheus-метрики (/metrics)
+import metrics
+# (v3.12) Трасування "апдейт -> доставлений PDF"
+import tracing
+# (v3.13) Логування через чергу + фоновий потік
+from logging_setup import configure_logging
+# (v3.32) Повідомлення: текст + сутності, зібрані локально (без parse_mode)
+import tg_format
 
 # Налаштування логування
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
-# (v3.6) Встановлюємо рівень логування для 'JobQueue' вище, щоб не спамив
-logging.getLogger("telegram.ext.JobQueue").setLevel(logging.WARNING)
+# (v3.13) Неблокуюче: запис у stderr виконує фоновий потік (див. logging_setup.py).
+# (v3.16) Викликається в main(): воркери пулу рендера імпортують цей модуль
+# і не повинні запускати власний потік логування.
 logger = logging.getLogger(__name__)
 
 # --- Завантаження конфігурації ---
@@ -68,6 +214,7 @@ if not BOT_TOKEN:
 # 10-19: Політика
 # 20-39: DPIA
 # 40-59: Чек-ліст
+# 60-69: Повний комплект (v3.21)
 
 # --- Етапи для "Політики" (Безшовний UX) ---
 (
@@ -94,6 +241,9 @@ if not BOT_TOKEN:
     DPIA_GENERATE, # 31
 ) = range(20, 32) # 12 станів
 
+# (v3.18) Імпорт DPIA з Excel: підтвердження підсумку
+DPIA_UPLOAD_CONFIRM = 32
+
 # --- Етапи для "Чек-ліста" (v3.8 - Додано Q_PROJECT_NAME) ---
 (
     CHECKLIST_Q_PROJECT_NAME, # 40 (НОВИЙ)
@@ -117,6 +267,22 @@ if not BOT_TOKEN:
     CHECKLIST_GENERATE, # 58
 ) = range(40, 59) # 19 станів (було 18)
 
+# --- (v3.21) "Повний комплект": питання DPIA (стани 20-31) + ці два ---
+(
+    KIT_Q_CONTACT, # 60
+    KIT_Q_CHECKLIST, # 61
+) = range(60, 62)
+
+# (v3.11) Назви станів для міток метрик (POLICY_Q_CONTACT, C2_S1_NOTE, ...)
+STATE_NAMES = {
+    value: name for name, value in list(globals().items())
+    if name.isupper() and isinstance(value, int) and 10 <= value < 70
+}
+
+# (v3.11) Ключ у user_data -> назва воркфлоу (для метрики активних сесій)
+# (v3.21) Сесія "Повного комплекту" має і 'kit', і 'dpia'
+FLOW_KEYS = {'policy': 'policy', 'dpia': 'dpia', 'cl': 'checklist', 'kit': 'kit'}
+
 
 # === 1. Головне Меню та Допоміжні Функції ===
 
@@ -126,6 +292,7 @@ def get_main_menu_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton("📄 Сгенерувати Політику", callback_data="start_policy")],
         [InlineKeyboardButton("📝 Пройти Оцінку (DPIA)", callback_data="start_dpia")],
         [InlineKeyboardButton("✅ Пройти Чек-ліст", callback_data="start_checklist")],
+        [InlineKeyboardButton("🧰 Повний комплект (3 документи)", callback_data="start_kit")],
         [
             InlineKeyboardButton("❓ Допомога", callback_data="show_help"),
             InlineKeyboardButton("🔒 Наша Політика", callback_data="show_privacy")
@@ -171,17 +338,18 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             if query.data in ("start_menu", "start_menu_post_generation"):
                 await delete_main_message(context, query.message.message_id)
 
-            await context.bot.send_message(chat_id=query.message.chat_id, text=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+            await context.bot.send_message(chat_id=query.message.chat_id, reply_markup=reply_markup, **tg_format.message(text))
 
         except BadRequest as e:
             if "Message is not modified" not in str(e):
-                logger.error(f"Помилка в start (query): {e}")
+                logger.error("Помилка в start (query): %s", e)
             # Якщо повідомлення не знайдено, надсилаємо нове
-            if "message to edit not found" in str(e) or "message to delete not found" in str(e):
-                 await context.bot.send_message(chat_id=query.message.chat_id, text=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+            # (v3.32) PTB пише опис помилки з великої літери — порівнюємо без регістру
+            if "message to edit not found" in str(e).lower() or "message to delete not found" in str(e).lower():
+                 await context.bot.send_message(chat_id=query.message.chat_id, reply_markup=reply_markup, **tg_format.message(text))
     else:
         # Це команда /start
-        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text(reply_markup=reply_markup, **tg_format.message(text))
             
     # (v3.2) Оскільки /start тепер поза ConversationHandler, він не повертає стан
     # return ConversationHandler.END 
@@ -193,18 +361,26 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return # Безпека
         
     await update.message.reply_text(
-        templates.BOT_HELP, 
-        parse_mode=ParseMode.MARKDOWN,
+        **tg_format.message(templates.BOT_HELP),
         disable_web_page_preview=True
         # (v3.3) ВИДАЛЕНО 'reply_markup'
     )
 
+def get_privacy_policy_text(context: ContextTypes.DEFAULT_TYPE) -> str:
+    """(v3.9) Політика бота: пункт 2.3 відповідає тому, чи увімкнено сховище сесій."""
+    persistence = context.application.persistence
+    if persistence:
+        notice = templates.PRIVACY_STORAGE_SESSION_STORE.format(ttl_minutes=max(1, persistence.ttl // 60))
+    else:
+        notice = templates.PRIVACY_STORAGE_RAM_ONLY
+    return templates.BOT_PRIVACY_POLICY.format(storage_notice=notice)
+
 async def show_privacy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """(v3.7) Оновлено ParseMode.HTML"""
     if not update.message:
         return
     await update.message.reply_text(
-        templates.BOT_PRIVACY_POLICY, 
+        get_privacy_policy_text(context), 
         parse_mode=ParseMode.HTML, # (v3.7) ЗМІНЕНО
         disable_web_page_preview=True # (v3.7) ДОДАНО
     )
@@ -218,14 +394,13 @@ async def show_help_inline(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     # Редагуємо, а не надсилаємо нове
     try:
         await query.edit_message_text(
-            templates.BOT_HELP, 
+            **tg_format.message(templates.BOT_HELP),
             reply_markup=InlineKeyboardMarkup(keyboard), 
-            parse_mode=ParseMode.MARKDOWN,
             disable_web_page_preview=True
         )
     except BadRequest as e:
         if "Message is not modified" not in str(e):
-             logger.warning(f"show_help_inline: {e}")
+             logger.warning("show_help_inline: %s", e)
 
 async def show_privacy_inline(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """(v3.7) Оновлено ParseMode.HTML"""
@@ -235,14 +410,14 @@ async def show_privacy_inline(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         await query.edit_message_text(
-            templates.BOT_PRIVACY_POLICY, 
+            get_privacy_policy_text(context), 
             reply_markup=InlineKeyboardMarkup(keyboard), 
             parse_mode=ParseMode.HTML, # (v3.7) ЗМІНЕНО
             disable_web_page_preview=True # (v3.7) ДОДАНО
         )
     except BadRequest as e:
         if "Message is not modified" not in str(e):
-             logger.warning(f"show_privacy_inline: {e}")
+             logger.warning("show_privacy_inline: %s", e)
 
 # (НОВЕ v3.4) Клас-обгортка для 'start'
 class _FakeUpdate:
@@ -261,8 +436,8 @@ class _FakeUpdate:
                 self.id = chat_id
         
         # start() викликає reply_text
-        async def reply_text(self, text, reply_markup, parse_mode):
-            await self._bot.send_message(chat_id=self.chat.id, text=text, reply_markup=reply_markup, parse_mode=parse_mode)
+        async def reply_text(self, text, reply_markup=None, entities=None):
+            await self._bot.send_message(chat_id=self.chat.id, text=text, reply_markup=reply_markup, entities=entities)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """(ОНОВЛЕНО v3.4) Скасовує поточну операцію, очищує дані та повертає в меню."""
@@ -289,17 +464,12 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         
     return ConversationHandler.END
 
-# (v3.6) Допоміжна функція для видалення повідомлення-блокувальника
-async def _delete_blocker_message(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """(v3.6) Видаляє повідомлення 'Ви вже заповнюєте...'."""
-    message_id = context.job.data.get('message_id')
-    chat_id = context.job.data.get('chat_id')
-    if message_id and chat_id:
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-            logger.info(f"Видалено 'повідомлення-блокувальник' {message_id}")
-        except BadRequest as e:
-            logger.warning(f"Не вдалося видалити 'повідомлення-блокувальник': {e}")
+# (v3.24) Один "підмітальник" для всіх тимчасових повідомлень (запускається в post_init)
+EXPIRY = ExpiryService()
+
+# (v3.23) Показаний блокувальник — один на чат: EXPIRY.tagged(chat_id, BLOCKER_TAG)
+BLOCKER_TTL = 5
+BLOCKER_TAG = "blocker"
 
 
 # (НОВЕ v3.3, ОНОВЛЕНО v3.6) "Блокувальник" перемикання воркфлоу
@@ -319,35 +489,36 @@ async def block_workflow_switch(update: Update, context: ContextTypes.DEFAULT_TY
     
     if current_state is None:
         # Це не мало статися, але якщо стан втрачено, краще скасувати
-        logger.warning(f"block_workflow_switch не зміг знайти 'current_state' для user {context._user_id}. Скасування.")
+        logger.warning("block_workflow_switch не зміг знайти 'current_state' для user %s. Скасування.", context._user_id)
         return await cancel(update, context)
 
+    # (v3.23) Блокувальник уже на екрані — лише відсуваємо його видалення
+    chat_id = query.message.chat_id
+    blocker_id = EXPIRY.tagged(chat_id, BLOCKER_TAG)
+    if blocker_id:
+        EXPIRY.schedule_delete(chat_id, blocker_id, BLOCKER_TTL, tag=BLOCKER_TAG)
+        metrics.THROTTLED_UPDATES.inc(type="callback_query", action="coalesced")
+        return current_state
+
     # Надсилаємо тимчасове повідомлення-попередження
     try:
         # (v3.4) Додаємо кнопку Cancel для зручності
         keyboard = [[InlineKeyboardButton("❌ Скасувати поточний аудит", callback_data="cancel_from_block")]]
         sent_message = await query.message.reply_text(
-            "⚠️ **Ви вже заповнюєте інший документ.**\n\n"
-            "Будь ласка, спочатку завершіть поточний аудит, або натисніть 'Скасувати' нижче.\n"
-            "_(Це повідомлення зникне через 5 секунд)_",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN
+            **tg_format.message(
+                "⚠️ **Ви вже заповнюєте інший документ.**\n\n"
+                "Будь ласка, спочатку завершіть поточний аудит, або натисніть 'Скасувати' нижче.\n"
+                "_(Це повідомлення зникне через 5 секунд)_"
+            ),
+            reply_markup=InlineKeyboardMarkup(keyboard)
         )
         
         # (v3.6) ПЛАНУЄМО ВИДАЛЕННЯ ЦЬОГО ПОВІДОМЛЕННЯ
-        if context.job_queue:
-            context.job_queue.run_once(
-                _delete_blocker_message,
-                5, # (v3.6) Видаляємо через 5 секунд
-                data={'message_id': sent_message.message_id, 'chat_id': sent_message.chat_id},
-                name=f"delete_blocker_{sent_message.message_id}"
-            )
-        else:
-            # (v3.6.1) Додано захист від падіння, якщо JobQueue = None
-            logger.warning("JobQueue не налаштовано. Не можу запланувати видалення 'блокувальника'.")
+        # (v3.24) Через спільний "підмітальник", а не окрему задачу JobQueue
+        EXPIRY.schedule_delete(chat_id, sent_message.message_id, BLOCKER_TTL, tag=BLOCKER_TAG)
 
     except BadRequest as e:
-        logger.warning(f"Не вдалося надіслати block_workflow_switch: {e}")
+        logger.warning("Не вдалося надіслати block_workflow_switch: %s", e)
     
     # Повертаємо ПОТОЧНИЙ стан, щоб розмова не перервалася
     return current_state
@@ -359,10 +530,11 @@ async def cancel_from_block(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     # Видаляємо повідомлення "⚠️ Ви вже заповнюєте..."
+    EXPIRY.cancel(query.message.chat_id, query.message.message_id)
     try:
         await query.message.delete()
     except BadRequest as e:
-        logger.warning(f"Не вдалося видалити 'block' повідомлення: {e}")
+        logger.warning("Не вдалося видалити 'block' повідомлення: %s", e)
         
     # Викликаємо стандартний cancel
     # (v3.4) Ми передаємо 'query', щоб 'cancel' міг видалити "Головне" повідомлення
@@ -373,13 +545,56 @@ def clear_user_data(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Безпечно очищує context.user_data."""
     user_id = context._user_id
     if context.user_data:
-        logger.info(f"Очищення даних для user {user_id}.")
+        logger.info("Очищення даних для user %s.", user_id)
         context.user_data.clear()
     else:
-        logger.info(f"Для user {user_id} немає даних для очищення.")
+        logger.info("Для user %s немає даних для очищення.", user_id)
+
+    # (v3.9) Якщо увімкнено сховище сесій — стираємо запис з диска НЕГАЙНО,
+    # не чекаючи наступного циклу update_persistence.
+    persistence = context.application.persistence
+    if persistence and user_id:
+        persistence.forget_user(user_id)
+
+# (v3.22) Поточні генерації (user_id) та фільтр дублікатів (група -3)
+GENERATIONS = SingleFlight()
+DEDUPLICATOR = UpdateDeduplicator(GENERATIONS)
+
+def single_flight_generation(func):
+    """(v3.22) Не більше однієї генерації на користувача: дублікат не рендерить і не надсилає."""
+    @functools.wraps(func)
+    async def wrapper(*args):
+        context = next(arg for arg in args if isinstance(arg, CallbackContext))
+        user_id = context._user_id
+        with GENERATIONS.claim(user_id) as claimed:
+            if not claimed:
+                metrics.DUPLICATE_UPDATES.inc(reason="in_flight")
+                logger.info("User %s: генерація вже триває, дублікат пропущено.", user_id)
+                return ConversationHandler.END
+            return await func(*args)
+    return wrapper
+
+# (v3.25) Генерації в роботі для коректної зупинки
+SHUTDOWN = ShutdownCoordinator()
+
+def drainable_generation(func):
+    """(v3.25) Генерація — окрема задача, яку зупинка дочекається або скасує."""
+    @functools.wraps(func)
+    async def wrapper(*args):
+        context = next(arg for arg in args if isinstance(arg, CallbackContext))
+        if not SHUTDOWN.accepting:
+            # Відповіді ще не видалено: стан розмови не змінюємо, користувач повторить
+            logger.info("User %s: генерацію відкладено — бот зупиняється.", context._user_id)
+            await context.bot.send_message(
+                chat_id=context._chat_id, **tg_format.message(templates.SHUTDOWN_GENERATION_DEFERRED)
+            )
+            return None
+        return await SHUTDOWN.run(func(*args), context._chat_id, aborted_result=ConversationHandler.END)
+    return wrapper
 
 # === (v3.0) УНІФІКОВАНІ "БЕЗШОВНІ" ХЕЛПЕРИ ===
 
+@tracing.traced("tg.delete_main_message")
 async def delete_main_message(context: ContextTypes.DEFAULT_TYPE, message_id: int = None) -> None:
     """Допоміжна функція для чистого видалення "Головного" повідомлення."""
     # (v3.1) Дозволяємо передавати message_id напряму (для 'start_menu_post_generation')
@@ -389,14 +604,21 @@ async def delete_main_message(context: ContextTypes.DEFAULT_TYPE, message_id: in
     if msg_id_to_delete:
         try:
             await context.bot.delete_message(chat_id=chat_id, message_id=msg_id_to_delete)
-            logger.info(f"Видалено 'Головне' повідомлення {msg_id_to_delete}")
+            logger.info("Видалено 'Головне' повідомлення %s", msg_id_to_delete)
         except BadRequest as e:
-            logger.warning(f"Не вдалося видалити 'Головне' повідомлення {msg_id_to_delete}: {e}")
+            logger.warning("Не вдалося видалити 'Головне' повідомлення %s: %s", msg_id_to_delete, e)
     else:
         logger.info("Немає 'Головного' повідомлення для видалення.")
 
-async def edit_main_message(context: ContextTypes.DEFAULT_TYPE, text: str, reply_markup: InlineKeyboardMarkup = None, new_message: bool = False) -> None:
-    """Допоміжна функція для редагування/надсилання "Головного" повідомлення."""
+@tracing.traced("tg.edit_main_message")
+async def edit_main_message(context: ContextTypes.DEFAULT_TYPE, text, reply_markup: InlineKeyboardMarkup = None, new_message: bool = False) -> None:
+    """
+    Допоміжна функція для редагування/надсилання "Головного" повідомлення.
+    (v3.32) `text` — шаблон без полів (str) або `tg_format.Rich` з `tg_format.render`;
+    надсилається як текст + сутності, без parse_mode.
+    (v3.33) Задовгий текст згортається `tg_format.fit`; повний текст тоді
+    доступний кнопкою "Показати підсумок" (`show_main_summary`).
+    """
     message_id = context.user_data.get('main_message_id')
     chat_id = context._chat_id
     
@@ -405,53 +627,122 @@ async def edit_main_message(context: ContextTypes.DEFAULT_TYPE, text: str, reply
         await delete_main_message(context)
         message_id = None
 
+    full = (text if isinstance(text, tg_format.Rich) else tg_format.render(text)).strip()
+    view, collapsed = tg_format.fit(full)
+    if collapsed:
+        logger.info("Головне повідомлення згорнуто: %s -> %s символів.", len(full), len(view))
+        context.user_data['main_summary'] = {
+            'full': full.dump(),
+            'view': view.dump(),
+            'markup': reply_markup.to_dict() if reply_markup else None,
+        }
+        markup = _with_summary_button(reply_markup)
+    else:
+        context.user_data.pop('main_summary', None)
+        markup = reply_markup
+
     try:
         if not message_id or new_message:
             sent_message = await context.bot.send_message(
                 chat_id=chat_id,
-                text=text,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
+                reply_markup=markup,
+                **tg_format.message(view)
             )
             context.user_data['main_message_id'] = sent_message.message_id
         else:
             await context.bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=message_id,
-                text=text,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
+                reply_markup=markup,
+                **tg_format.message(view)
             )
     except BadRequest as e:
-        if "Message is not modified" in str(e):
+        # (v3.32) PTB пише опис помилки з великої літери ("Message to edit not found")
+        error = str(e).lower()
+        if "message is not modified" in error:
             logger.info("Повідомлення не змінено, пропуск редагування.")
-        elif "message to edit not found" in str(e):
-             logger.warning(f"Не вдалося знайти повідомлення {message_id} для редагування. Надсилаю нове.")
+        elif "message to edit not found" in error:
+             logger.warning("Не вдалося знайти повідомлення %s для редагування. Надсилаю нове.", message_id)
              await edit_main_message(context, text, reply_markup, new_message=True)
+        elif "can't parse entities" in error or "message is too long" in error:
+            # (v3.32) Той самий текст новим повідомленням теж не пройде — без повторів
+            logger.error("Telegram не прийняв текст повідомлення: %s", e)
         else:
-            logger.error(f"Помилка під час редагування/надсилання повідомлення: {e}", exc_info=True)
+            logger.error("Помилка під час редагування/надсилання повідомлення: %s", e, exc_info=True)
             if message_id and not new_message:
                 await edit_main_message(context, text, reply_markup, new_message=True)
     except Exception as e:
-        logger.error(f"Невідома помилка в edit_main_message: {e}", exc_info=True)
+        logger.error("Невідома помилка в edit_main_message: %s", e, exc_info=True)
+
+# === (v3.33) Повний підсумок згорнутого "Головного" повідомлення ===
+
+SUMMARY_BUTTON = "📋 Показати підсумок"
+
+def _with_summary_button(reply_markup: InlineKeyboardMarkup = None) -> InlineKeyboardMarkup:
+    """Клавіатура кроку + рядок "Показати підсумок"."""
+    rows = [list(row) for row in reply_markup.inline_keyboard] if reply_markup else []
+    rows.append([InlineKeyboardButton(SUMMARY_BUTTON, callback_data="sum_page:0")])
+    return InlineKeyboardMarkup(rows)
+
+@tracing.traced("tg.show_main_summary")
+async def show_main_summary(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    (v3.33) Сторінки повного тексту згорнутого "Головного" повідомлення
+    (кнопки "sum_page:N") і повернення до питання ("sum_back").
+    Стан розмови не змінюється (повертаємо None).
+    """
+    query = update.callback_query
+    await query.answer()
+    summary = context.user_data.get('main_summary')
+    if not summary or query.message.message_id != context.user_data.get('main_message_id'):
+        logger.info("Застаріла кнопка підсумку від user %s, пропуск.", query.from_user.id)
+        return None
+
+    if query.data == "sum_back":
+        view = tg_format.Rich.load(summary['view'])
+        markup = InlineKeyboardMarkup.de_json(summary['markup'], context.bot) if summary['markup'] else None
+        markup = _with_summary_button(markup)
+    else:
+        # Запас бюджету — на заголовок сторінки
+        pages = tg_format.paginate(tg_format.Rich.load(summary['full']), budget=tg_format.main_message_budget() - 128)
+        total = len(pages)
+        page = int(query.data.split(":")[1]) % total
+        view = tg_format.render("📋 **Підсумок ({number}/{total})**\n\n", number=page + 1, total=total) + pages[page]
+        rows = []
+        if total > 1:
+            rows.append([
+                InlineKeyboardButton("◀️", callback_data=f"sum_page:{(page - 1) % total}"),
+                InlineKeyboardButton(f"{page + 1}/{total}", callback_data=f"sum_page:{page}"),
+                InlineKeyboardButton("▶️", callback_data=f"sum_page:{(page + 1) % total}"),
+            ])
+        rows.append([InlineKeyboardButton("↩️ До питання", callback_data="sum_back")])
+        markup = InlineKeyboardMarkup(rows)
 
+    try:
+        await query.edit_message_text(reply_markup=markup, **tg_format.message(view))
+    except BadRequest as e:
+        if "message is not modified" not in str(e).lower():
+            logger.error("Не вдалося показати підсумок: %s", e)
+    return None
+
+@tracing.traced("tg.delete_user_text_reply")
 async def delete_user_text_reply(update: Update) -> None:
     """Видаляє повідомлення користувача (його текстову відповідь), щоб чат був чистим."""
     try:
         await update.message.delete()
     except BadRequest as e:
-        logger.warning(f"Не вдалося видалити текстову відповідь користувача: {e}")
+        logger.warning("Не вдалося видалити текстову відповідь користувача: %s", e)
 
 # === 2. (ОНОВЛЕНО v3.0) Логіка "Політики Конфіденційності" (Безшовний UX) ===
 
 def get_policy_template_data(data: dict) -> dict:
-    """Готує словник для шаблонів Політики."""
+    """Готує словник для шаблонів Політики (v3.32: відповіді як є — див. `tg_format`)."""
     return {
-        'project_name': html.escape(data.get('project_name', '...')),
-        'contact': html.escape(data.get('contact', '...')),
-        'data_collected': html.escape(data.get('data_collected', '...')),
-        'data_storage': html.escape(data.get('data_storage', '...')),
-        'delete_mechanism': html.escape(data.get('delete_mechanism', '...')),
+        'project_name': data.get('project_name', '...'),
+        'contact': data.get('contact', '...'),
+        'data_collected': data.get('data_collected', '...'),
+        'data_storage': data.get('data_storage', '...'),
+        'delete_mechanism': data.get('delete_mechanism', '...'),
     }
 
 async def start_policy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -460,16 +751,16 @@ async def start_policy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     await query.answer()
             
     clear_user_data(context)
-    logger.info(f"User {query.from_user.id} почав 'Політику'.") 
+    logger.info("User %s почав 'Політику'.", query.from_user.id) 
     context.user_data['policy'] = {}
     
     try:
         # Редагуємо головне меню, щоб почати воркфлоу
-        text = templates.POLICY_Q_PROJECT_NAME.format(**get_policy_template_data({}))
+        text = tg_format.render(templates.POLICY_Q_PROJECT_NAME, **get_policy_template_data({}))
         # new_message=True, щоб замінити меню, а не редагувати його
         await edit_main_message(context, text, new_message=True)
     except BadRequest as e:
-        logger.warning(f"start_policy: Помилка: {e}")
+        logger.warning("start_policy: Помилка: %s", e)
 
     # (v3.5) Зберігаємо поточний стан
     context.user_data['current_state'] = POLICY_Q_CONTACT
@@ -479,7 +770,7 @@ async def policy_q_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     context.user_data['policy']['project_name'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.POLICY_Q_CONTACT.format(**get_policy_template_data(context.user_data['policy']))
+    text = tg_format.render(templates.POLICY_Q_CONTACT, **get_policy_template_data(context.user_data['policy']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -490,7 +781,7 @@ async def policy_q_data_collected(update: Update, context: ContextTypes.DEFAULT_
     context.user_data['policy']['contact'] = update.message.text
     await delete_user_text_reply(update)
 
-    text = templates.POLICY_Q_DATA_COLLECTED.format(**get_policy_template_data(context.user_data['policy']))
+    text = tg_format.render(templates.POLICY_Q_DATA_COLLECTED, **get_policy_template_data(context.user_data['policy']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -501,7 +792,7 @@ async def policy_q_data_storage(update: Update, context: ContextTypes.DEFAULT_TY
     context.user_data['policy']['data_collected'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.POLICY_Q_DATA_STORAGE.format(**get_policy_template_data(context.user_data['policy']))
+    text = tg_format.render(templates.POLICY_Q_DATA_STORAGE, **get_policy_template_data(context.user_data['policy']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -512,67 +803,69 @@ async def policy_q_delete_mechanism(update: Update, context: ContextTypes.DEFAUL
     context.user_data['policy']['data_storage'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.POLICY_Q_DELETE_MECHANISM.format(**get_policy_template_data(context.user_data['policy']))
+    text = tg_format.render(templates.POLICY_Q_DELETE_MECHANISM, **get_policy_template_data(context.user_data['policy']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
     context.user_data['current_state'] = POLICY_GENERATE
     return POLICY_GENERATE
 
+@drainable_generation
+@single_flight_generation
 async def policy_generate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """(ОНОВЛЕНО v3.3) Генерує PDF Політики та показує "Етичне Нагадування"."""
     context.user_data['policy']['delete_mechanism'] = update.message.text
     user_id = update.effective_user.id
-    logger.info(f"User {user_id}: генерація PDF Політики.")
+    logger.info("User %s: генерація PDF Політики.", user_id)
 
     await delete_user_text_reply(update)
     await delete_main_message(context)
     
-    generating_msg = await update.message.reply_text("Дякую! Генерую ваш PDF...")
+    with tracing.span("tg.generating_message"):
+        generating_msg = await update.message.reply_text("Дякую! Генерую ваш PDF...")
+
+    # (v3.15) Посилання на відповіді беремо ДО очищення (сам словник не змінюється)
+    policy_data = context.user_data['policy']
 
-    data_dict = {
-        'project_name': html.escape(context.user_data['policy'].get('project_name', '[Назва Вашого Проєкту]')),
-        'contact': html.escape(context.user_data['policy'].get('contact', '[Ваш @username або email]')),
-        'data_collected': html.escape(context.user_data['policy'].get('data_collected', '[Дані, які ви збираєте]')),
-        'data_storage': html.escape(context.user_data['policy'].get('data_storage', '[Де ви зберігаєте дані]')),
-        'delete_mechanism': html.escape(context.user_data['policy'].get('delete_mechanism', '[Опишіть простий механізм]')),
-        'date': date.today().strftime("%d.%m.%Y"),
-    }
-    
     # (v3.0) Очищуємо дані ДО генерації
     clear_user_data(context)
 
     try:
-        filled_markdown = templates.POLICY_TEMPLATE.format(**data_dict)
-        
-        pdf_file_path = create_pdf_from_markdown(
-            content=filled_markdown,
-            is_html=False, 
-            output_filename=f"policy_{user_id}.pdf"
-        )
+        with tracing.span("doc.build_markdown", document="policy"):
+            filled_markdown = build_policy_markdown(policy_data)
         
-        await context.bot.send_document(chat_id=update.message.chat_id, document=open(pdf_file_path, 'rb'))
+        # (v3.26) Файл у спулі PDF: унікальне ім'я, квота, зникає після надсилання
+        async with SPOOL.file("policy") as pdf:
+            # (v3.11) Глибина "черги" генерацій для метрик
+            with metrics.GENERATION_QUEUE.track_inprogress():
+                # (v3.16) Рендер у пулі процесів; апдейти інших користувачів тим часом
+                # обробляються паралельно (`update_processor.py`)
+                await render_pdf_async(content=filled_markdown, output_filename=pdf.path)
+
+            with tracing.span("tg.send_document") as span:
+                document = pdf.open()
+                span.set(size_bytes=os.fstat(document.fileno()).st_size)
+                await context.bot.send_document(
+                    chat_id=update.message.chat_id, document=document, filename=f"policy_{user_id}.pdf"
+                )
         
         # (ОНОВЛЕНО v3.3) Надсилаємо "Етичне Нагадування"
-        await context.bot.send_message(
-            chat_id=update.message.chat_id,
-            text=templates.POST_POLICY_UPSELL, # (v3.3) Новий текст
-            reply_markup=get_policy_upsell_keyboard(), # (v3.3) Нові кнопки
-            parse_mode=ParseMode.MARKDOWN
-        )
-        clear_temp_file(pdf_file_path)
+        with tracing.span("tg.send_followup"):
+            await context.bot.send_message(
+                chat_id=update.message.chat_id,
+                **tg_format.message(templates.POST_POLICY_UPSELL), # (v3.3) Новий текст
+                reply_markup=get_policy_upsell_keyboard(), # (v3.3) Нові кнопки
+            )
 
     except Exception as e:
-        logger.error(f"PDF generation failed for user {user_id}: {e}", exc_info=True)
+        logger.error("PDF generation failed for user %s: %s", user_id, e, exc_info=True)
         await update.message.reply_text(f"Під час генерації PDF сталася помилка: {e}")
         # (v3.4) Викликаємо 'start' з фальшивим update
         await start(_FakeUpdate(update.message.chat.id, context.bot), context)
     
     finally:
-        try:
-            await generating_msg.delete()
-        except Exception as e:
-            logger.warning(f"Не вдалося видалити 'Генерую...' {e}")
+        # (v3.24) Видалення — у фоні, пакетом із рештою тимчасових повідомлень чату
+        EXPIRY.schedule_delete(generating_msg.chat_id, generating_msg.message_id)
             
         return ConversationHandler.END
 
@@ -582,33 +875,35 @@ async def policy_generate(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 def get_dpia_template_data(data: dict) -> dict:
     """Готує словник для шаблонів DPIA."""
     # Готуємо дані для мінімізації
-    minimization_text = ""
+    # (v3.32) Фрагменти з розміткою — `tg_format.Rich`, відповіді вставляються як текст
+    minimization_text = tg_format.Rich()
     minimization_data = data.get('minimization_data', [])
     if data.get('data_list') and not minimization_data:
         # Етап, коли список є, але цикл ще не почався
         for i, item in enumerate(data.get('data_list', [])):
-             minimization_text += f"\n**{i+1}. {html.escape(item)}:** [Очікує...] "
+             minimization_text += tg_format.render("\n**{n}. {item}:** [Очікує...] ", n=i + 1, item=item)
     else:
         # Етап, коли цикл триває
         for i, item_data in enumerate(minimization_data):
-            item = html.escape(item_data['item'])
-            reason = html.escape(item_data['reason'])
             if item_data['needed']:
-                minimization_text += f"\n**{i+1}. {item}:** ✅ **Так** (Навіщо: `{reason}`)"
+                line = "\n**{n}. {item}:** ✅ **Так** (Навіщо: `{reason}`)"
             else:
-                minimization_text += f"\n**{i+1}. {item}:** ❌ **Ні** (`{reason}`)"
+                line = "\n**{n}. {item}:** ❌ **Ні** (`{reason}`)"
+            minimization_text += tg_format.render(line, n=i + 1, item=item_data['item'], reason=item_data['reason'])
 
     return {
-        'project_name': html.escape(data.get('project_name', '...')),
-        'team': html.escape(data.get('team', '...')),
-        'goal': html.escape(data.get('goal', '...')),
-        'data_list': "\n".join([f"- `{html.escape(item)}`" for item in data.get('data_list', [])]),
+        'project_name': data.get('project_name', '...'),
+        'team': data.get('team', '...'),
+        'goal': data.get('goal', '...'),
+        'data_list': tg_format.Rich.join(
+            "\n", [tg_format.render("- `{item}`", item=item) for item in data.get('data_list', [])]
+        ),
         'minimization_summary': minimization_text.strip(),
-        'retention_period': html.escape(data.get('retention_period', '...')),
-        'retention_mechanism': html.escape(data.get('retention_mechanism', '...')),
-        'storage': html.escape(data.get('storage', '...')),
-        'risk': html.escape(data.get('risk', '...')),
-        'mitigation': html.escape(data.get('mitigation', '...')),
+        'retention_period': data.get('retention_period', '...'),
+        'retention_mechanism': data.get('retention_mechanism', '...'),
+        'storage': data.get('storage', '...'),
+        'risk': data.get('risk', '...'),
+        'mitigation': data.get('mitigation', '...'),
     }
 
 async def start_dpia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -617,15 +912,14 @@ async def start_dpia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await query.answer()
 
     clear_user_data(context)
-    logger.info(f"User {query.from_user.id} почав 'DPIA'.")
+    logger.info("User %s почав 'DPIA'.", query.from_user.id)
     
     context.user_data['dpia'] = {
         'minimization_data': [],
         'data_list': [],
-        'current_data_index': 0
     }
     
-    text = templates.DPIA_Q_PROJECT_NAME.format(**get_dpia_template_data({}))
+    text = tg_format.render(templates.DPIA_Q_PROJECT_NAME, **get_dpia_template_data({}))
     await edit_main_message(context, text, new_message=True)
     
     # (v3.5) Зберігаємо поточний стан
@@ -636,7 +930,7 @@ async def dpia_q_team(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data['dpia']['project_name'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.DPIA_Q_TEAM.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_TEAM, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -647,7 +941,7 @@ async def dpia_q_goal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data['dpia']['team'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.DPIA_Q_GOAL.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_GOAL, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -658,7 +952,7 @@ async def dpia_q_data_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     context.user_data['dpia']['goal'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.DPIA_Q_DATA_LIST.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_DATA_LIST, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -666,105 +960,195 @@ async def dpia_q_data_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return DPIA_Q_MINIMIZATION_START
 
 async def dpia_q_minimization_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Отримує список даних і запускає цикл мінімізації."""
+    """Отримує список даних і показує екран мінімізації (v3.20 - мультивибір)."""
     data_list = [item.strip() for item in update.message.text.split('\n') if item.strip()]
     await delete_user_text_reply(update)
 
     if not data_list:
-        text = templates.DPIA_Q_DATA_LIST_ERROR.format(**get_dpia_template_data(context.user_data['dpia']))
+        text = tg_format.render(templates.DPIA_Q_DATA_LIST_ERROR, **get_dpia_template_data(context.user_data['dpia']))
         await edit_main_message(context, text)
         # (v3.5) Зберігаємо поточний стан (залишаємось тут)
         context.user_data['current_state'] = DPIA_Q_MINIMIZATION_START
         return DPIA_Q_MINIMIZATION_START
 
     context.user_data['dpia']['data_list'] = data_list
-    context.user_data['dpia']['current_data_index'] = 0
     context.user_data['dpia']['minimization_data'] = []
+    _reset_minimization_selection(context.user_data['dpia'])
     
-    return await dpia_ask_minimization_status(context)
+    return await dpia_show_minimization_select(context)
 
-async def dpia_ask_minimization_status(context: ContextTypes.DEFAULT_TYPE) -> int:
-    """(v3.0) Динамічно ставить питання про статус для поточного пункту даних."""
-    index = context.user_data['dpia']['current_data_index']
-    data_list = context.user_data['dpia']['data_list']
-    
-    if index >= len(data_list):
-        return await dpia_minimization_finished(context)
+# --- (v3.20) Мінімізація одним екраном: мультивибір + обґрунтування одним повідомленням ---
+#
+# Раніше кожен пункт коштував 2-4 виклики Bot API (редагування, "Так/Ні",
+# відповідь, ще редагування). Тепер: один екран з кнопками-перемикачами
+# (по сторінках), далі одне повідомлення з обґрунтуваннями.
+
+DPIA_MIN_PAGE_SIZE = 10  # пунктів на сторінку клавіатури (ліміти Telegram на кнопки)
+DPIA_MIN_BUTTON_CHARS = 40
+
+# "3. Для входу", "3) ...", "3 - ..." — обґрунтування з явним номером
+_REASON_NUMBER_RE = re.compile(r"^\s*(\d{1,3})\s*[.):\-–—]\s*(.+)$")
+
+def _reset_minimization_selection(dpia: dict) -> None:
+    """За замовчуванням усі пункти "потрібні" — користувач знімає зайві."""
+    dpia['min_needed'] = [True] * len(dpia.get('data_list', []))
+    dpia['min_page'] = 0
+    dpia['min_reasons'] = [None] * len(dpia.get('data_list', []))
+
+def get_minimization_select_keyboard(dpia: dict) -> InlineKeyboardMarkup:
+    """(v3.20) Перемикачі ✅/❌ для пунктів поточної сторінки + навігація + "Готово"."""
+    data_list = dpia['data_list']
+    pages = max(1, -(-len(data_list) // DPIA_MIN_PAGE_SIZE))
+    page = min(dpia.get('min_page', 0), pages - 1)
+    first = page * DPIA_MIN_PAGE_SIZE
+
+    keyboard = []
+    for i in range(first, min(first + DPIA_MIN_PAGE_SIZE, len(data_list))):
+        label = data_list[i]
+        if len(label) > DPIA_MIN_BUTTON_CHARS:
+            label = label[:DPIA_MIN_BUTTON_CHARS - 1] + "…"
+        mark = "✅" if dpia['min_needed'][i] else "❌"
+        keyboard.append([InlineKeyboardButton(f"{mark} {i + 1}. {label}", callback_data=f"min_toggle:{i}")])
+    if pages > 1:
+        keyboard.append([
+            InlineKeyboardButton("◀️", callback_data=f"min_page:{(page - 1) % pages}"),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="min_noop"),
+            InlineKeyboardButton("▶️", callback_data=f"min_page:{(page + 1) % pages}"),
+        ])
+    keyboard.append([InlineKeyboardButton("Готово ➡️", callback_data="min_done")])
+    return InlineKeyboardMarkup(keyboard)
 
-    current_data_item = data_list[index]
-    context.user_data['dpia']['current_data_item'] = current_data_item # Зберігаємо для наступного кроку
-    
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ Так", callback_data="min_yes"),
-            InlineKeyboardButton("❌ Ні", callback_data="min_no"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    template_data = get_dpia_template_data(context.user_data['dpia'])
-    text = templates.DPIA_Q_MINIMIZATION_ASK.format(
-        **template_data,
-        count=f"{index + 1}/{len(data_list)}",
-        item=f"`{html.escape(current_data_item)}`"
+async def dpia_show_minimization_select(context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.20) Показує (або оновлює) екран мультивибору мінімізації."""
+    dpia = context.user_data['dpia']
+    text = tg_format.render(
+        templates.DPIA_Q_MINIMIZATION_SELECT,
+        **get_dpia_template_data(dpia),
+        kept=sum(dpia['min_needed']),
+        total=len(dpia['data_list']),
     )
+    await edit_main_message(context, text, get_minimization_select_keyboard(dpia))
 
-    await edit_main_message(context, text, reply_markup)
-    
     # (v3.5) Зберігаємо поточний стан
     context.user_data['current_state'] = DPIA_Q_MINIMIZATION_REASON
     return DPIA_Q_MINIMIZATION_REASON
 
-async def dpia_q_minimization_reason(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """(v3.0) Обробляє відповідь 'Так'/'Ні' (CallbackQuery)."""
+async def dpia_q_minimization_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.20) Кнопки екрану мінімізації: перемикач пункту, сторінка, "Готово"."""
     query = update.callback_query
     await query.answer()
-    
-    current_data_item = context.user_data['dpia'].get('current_data_item', '...')
-    
-    if query.data == "min_yes":
-        context.user_data['dpia']['minimization_data'].append({
-            "item": current_data_item,
-            "needed": True,
-            "reason": "" 
-        })
-        
-        template_data = get_dpia_template_data(context.user_data['dpia'])
-        text = templates.DPIA_Q_MINIMIZATION_REASON.format(
-            **template_data,
-            item=f"`{html.escape(current_data_item)}`"
-        )
+    dpia = context.user_data['dpia']
+
+    if 'min_needed' not in dpia:
+        # Сесія, збережена до v3.20 (кнопки "Так/Ні" по одному пункту) — починаємо вибір заново
+        dpia['minimization_data'] = []
+        _reset_minimization_selection(dpia)
+        return await dpia_show_minimization_select(context)
+
+    action, _, value = query.data.partition(":")
+    if action == "min_toggle" and value.isdigit() and int(value) < len(dpia['min_needed']):
+        index = int(value)
+        dpia['min_needed'][index] = not dpia['min_needed'][index]
+        dpia['min_page'] = index // DPIA_MIN_PAGE_SIZE
+    elif action == "min_page" and value.isdigit():
+        if int(value) == dpia.get('min_page', 0):
+            return DPIA_Q_MINIMIZATION_REASON
+        dpia['min_page'] = int(value)
+    elif action == "min_done":
+        return await dpia_ask_minimization_reasons(context)
+    else:
+        return DPIA_Q_MINIMIZATION_REASON
+
+    return await dpia_show_minimization_select(context)
+
+def _format_reason_items(dpia: dict, indices) -> tg_format.Rich:
+    kept = [i for i, needed in enumerate(dpia['min_needed']) if needed]
+    return tg_format.Rich.join("\n", [
+        tg_format.render("{n}. `{item}`", n=kept.index(i) + 1, item=dpia['data_list'][i]) for i in indices
+    ])
+
+async def dpia_ask_minimization_reasons(context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.20) Просить обґрунтування для всіх залишених пунктів одним повідомленням."""
+    dpia = context.user_data['dpia']
+    kept = [i for i, needed in enumerate(dpia['min_needed']) if needed]
+    if not kept:
+        return await _dpia_finish_minimization(context)
+
+    text = tg_format.render(
+        templates.DPIA_Q_MINIMIZATION_REASONS,
+        kept=len(kept),
+        total=len(dpia['data_list']),
+        items=_format_reason_items(dpia, kept),
+    )
+    await edit_main_message(context, text)
+
+    # (v3.5) Зберігаємо поточний стан
+    context.user_data['current_state'] = DPIA_Q_MINIMIZATION_STATUS
+    return DPIA_Q_MINIMIZATION_STATUS
+
+def parse_minimization_reasons(text: str, kept: list, reasons: list) -> None:
+    """
+    (v3.20) Розкладає багаторядкову відповідь по залишених пунктах (змінює `reasons`).
+    Рядок "N. ..." йде до N-го залишеного пункту, решта рядків — по черзі до
+    пунктів без обґрунтування. Якщо бракує лише одного — весь текст його.
+    """
+    missing = [i for i in kept if not reasons[i]]
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    numbered = [_REASON_NUMBER_RE.match(line) for line in lines]
+
+    if len(missing) == 1 and not any(numbered):
+        reasons[missing[0]] = text.strip()
+        return
+
+    queue = iter(missing)
+    for line, match in zip(lines, numbered):
+        if match and 1 <= int(match.group(1)) <= len(kept):
+            reasons[kept[int(match.group(1)) - 1]] = match.group(2).strip()
+            continue
+        for index in queue:
+            if not reasons[index]:
+                reasons[index] = line
+                break
+
+async def dpia_q_minimization_reasons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.20) Отримує обґрунтування (одне багаторядкове повідомлення)."""
+    dpia = context.user_data['dpia']
+    await delete_user_text_reply(update)
+
+    if 'min_needed' not in dpia:
+        # Сесія, збережена до v3.20 — показуємо новий екран вибору
+        dpia['minimization_data'] = []
+        _reset_minimization_selection(dpia)
+        return await dpia_show_minimization_select(context)
+
+    kept = [i for i, needed in enumerate(dpia['min_needed']) if needed]
+    parse_minimization_reasons(update.message.text, kept, dpia['min_reasons'])
+
+    missing = [i for i in kept if not dpia['min_reasons'][i]]
+    if missing:
+        text = tg_format.render(templates.DPIA_Q_MINIMIZATION_REASONS_MISSING, items=_format_reason_items(dpia, missing))
         await edit_main_message(context, text)
-        
-        # (v3.5) Зберігаємо поточний стан
         context.user_data['current_state'] = DPIA_Q_MINIMIZATION_STATUS
         return DPIA_Q_MINIMIZATION_STATUS
-        
-    elif query.data == "min_no":
-        context.user_data['dpia']['minimization_data'].append({
-            "item": current_data_item,
-            "needed": False,
-            "reason": "Відмовлено (мінімізовано)"
-        })
-        
-        context.user_data['dpia']['current_data_index'] += 1
-        return await dpia_ask_minimization_status(context)
 
-async def dpia_q_minimization_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """(v3.0) Отримує текстову причину для відповіді 'Так'."""
-    reason = update.message.text
-    await delete_user_text_reply(update)
-    
-    if context.user_data['dpia']['minimization_data']:
-        context.user_data['dpia']['minimization_data'][-1]['reason'] = reason
-    
-    context.user_data['dpia']['current_data_index'] += 1
-    return await dpia_ask_minimization_status(context)
+    return await _dpia_finish_minimization(context)
+
+async def _dpia_finish_minimization(context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.20) Перетворює вибір на minimization_data (формат, який очікують збирачі)."""
+    dpia = context.user_data['dpia']
+    dpia['minimization_data'] = [
+        {"item": item, "needed": True, "reason": reason} if needed
+        else {"item": item, "needed": False, "reason": "Відмовлено (мінімізовано)"}
+        for item, needed, reason in zip(dpia['data_list'], dpia['min_needed'], dpia['min_reasons'])
+    ]
+    for key in ('min_needed', 'min_page', 'min_reasons'):
+        dpia.pop(key, None)
+    return await dpia_minimization_finished(context)
 
 async def dpia_minimization_finished(context: ContextTypes.DEFAULT_TYPE) -> int:
     """Викликається, коли цикл мінімізації завершено."""
     
-    text = templates.DPIA_Q_RETENTION_PERIOD.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_RETENTION_PERIOD, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -775,7 +1159,7 @@ async def dpia_q_retention_mechanism(update: Update, context: ContextTypes.DEFAU
     context.user_data['dpia']['retention_period'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.DPIA_Q_RETENTION_MECHANISM.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_RETENTION_MECHANISM, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -786,7 +1170,7 @@ async def dpia_q_storage(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     context.user_data['dpia']['retention_mechanism'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.DPIA_Q_STORAGE.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_STORAGE, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -797,7 +1181,7 @@ async def dpia_q_risk(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data['dpia']['storage'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.DPIA_Q_RISK.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_RISK, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -808,7 +1192,7 @@ async def dpia_q_mitigation(update: Update, context: ContextTypes.DEFAULT_TYPE)
     context.user_data['dpia']['risk'] = update.message.text
     await delete_user_text_reply(update)
     
-    text = templates.DPIA_Q_MITIGATION.format(**get_dpia_template_data(context.user_data['dpia']))
+    text = tg_format.render(templates.DPIA_Q_MITIGATION, **get_dpia_template_data(context.user_data['dpia']))
     await edit_main_message(context, text)
     
     # (v3.5) Зберігаємо поточний стан
@@ -818,90 +1202,319 @@ async def dpia_q_mitigation(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def dpia_generate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """(ОНОВЛЕНО v3.1) Збирає останню відповідь і генерує PDF для DPIA."""
     context.user_data['dpia']['mitigation'] = update.message.text
-    user_id = update.effective_user.id
-    logger.info(f"User {user_id}: генерація PDF DPIA.")
-
     await delete_user_text_reply(update)
-    await delete_main_message(context)
-    
-    generating_msg = await update.message.reply_text("Дякую! Аудит завершено. Генерую ваш PDF...")
+    # (v3.21) У "Повному комплекті" після DPIA — контакт і Чек-ліст
+    if 'kit' in context.user_data:
+        return await kit_ask_contact(context)
+    return await _dpia_send_documents(context, update.message.chat_id, update.effective_user.id)
 
-    data = context.user_data['dpia']
-    
-    def get_data(key, default='[Не вказано]'):
-        return html.escape(data.get(key, default))
+@drainable_generation
+@single_flight_generation
+async def _dpia_send_documents(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> int:
+    """(v3.18) Генерує та надсилає DPIA (PDF + Excel). Спільне для розмови та імпорту з Excel."""
+    logger.info("User %s: генерація PDF DPIA.", user_id)
 
-    # Готуємо дані для PDF
-    table_rows = []
-    table_rows.append(f"| Назва проєкту: | {get_data('project_name')} |")
-    table_rows.append(f"| Керівник/Розробник: | {get_data('team')} |")
-    table_rows.append(f"| Мета: | {get_data('goal')} |")
+    await delete_main_message(context)
     
-    minimization_data = data.get('minimization_data', [])
-    if not minimization_data:
-        table_rows.append("| Дані: | [Не вказано] |")
-    else:
-        for i, item in enumerate(minimization_data):
-            data_name = f"Дані (пункт {i+1}):"
-            item_name = html.escape(item['item'])
-            item_reason = html.escape(item['reason'])
-            
-            if item['needed']:
-                data_value = f"{item_name} (✅ **Навіщо:** {item_reason})"
-            else:
-                data_value = f"~~{item_name}~~ (❌ **Відмовлено**)"
-            
-            table_rows.append(f"| {data_name} | {data_value} |")
+    with tracing.span("tg.generating_message"):
+        generating_msg = await context.bot.send_message(chat_id=chat_id, text="Дякую! Аудит завершено. Генерую ваш PDF...")
 
-    table_rows.append(f"| Строк Зберігання: | {get_data('retention_period')} |")
-    table_rows.append(f"| Механізм Видалення: | {get_data('retention_mechanism')} |")
-    table_rows.append(f"| Місце Зберігання: | {get_data('storage')} |")
-    table_rows.append(f"| Головний Ризик: | {get_data('risk')} |")
-    table_rows.append(f"| Мінімізація Ризику: | {get_data('mitigation')} |")
+    # (v3.15) Посилання на відповіді беремо ДО очищення (сам словник не змінюється)
+    dpia_data = context.user_data['dpia']
 
-    table_header = "| Питання | Відповідь |\n| :--- | :--- |\n"
-    dpia_table_string = table_header + "\n".join(table_rows)
-
-    data_dict = {
-        'project_name': get_data('project_name'),
-        'date': date.today().strftime("%d.%m.%Y"),
-        'dpia_table': dpia_table_string
-    }
-    
     # (v3.0) Очищуємо дані ДО генерації
     clear_user_data(context)
 
     try:
-        filled_markdown = templates.DPIA_TEMPLATE.format(**data_dict)
-        
-        pdf_file_path = create_pdf_from_markdown(
-            content=filled_markdown,
-            is_html=False, 
-            output_filename=f"dpia_{user_id}.pdf"
-        )
+        with tracing.span("doc.build_markdown", document="dpia"):
+            filled_markdown = build_dpia_markdown(dpia_data)
         
-        await context.bot.send_document(chat_id=update.message.chat_id, document=open(pdf_file_path, 'rb'))
+        # (v3.26) Файл у спулі PDF: унікальне ім'я, квота, зникає після надсилання
+        async with SPOOL.file("dpia") as pdf:
+            # (v3.11) Глибина "черги" генерацій для метрик
+            with metrics.GENERATION_QUEUE.track_inprogress():
+                # (v3.16) Рендер у пулі процесів; апдейти інших користувачів тим часом
+                # обробляються паралельно (`update_processor.py`)
+                await render_pdf_async(content=filled_markdown, output_filename=pdf.path)
+
+            with tracing.span("tg.send_document") as span:
+                document = pdf.open()
+                span.set(size_bytes=os.fstat(document.fileno()).st_size)
+                await context.bot.send_document(chat_id=chat_id, document=document, filename=f"dpia_{user_id}.pdf")
+
+        # (v3.17) Редагована Excel-версія: заповнення шаблону в пам'яті, без рендера
+        if xlsx_available():
+            try:
+                with tracing.span("doc.build_xlsx"):
+                    xlsx_bytes = await asyncio.to_thread(build_dpia_xlsx, dpia_data)
+                with tracing.span("tg.send_document", format="xlsx"):
+                    await context.bot.send_document(
+                        chat_id=chat_id, document=xlsx_bytes, filename="DPIA_Lite.xlsx"
+                    )
+            except Exception as e:
+                # PDF уже надіслано — Excel не критичний
+                logger.warning("Excel DPIA не вдалося створити для user %s: %s", user_id, e, exc_info=True)
         
         # (v3.2) Використовуємо helper-функцію
-        await context.bot.send_message(
-            chat_id=update.message.chat_id,
-            text="Ваш DPIA Lite готовий. Я видалив усі ваші відповіді зі своєї пам'яті.",
-            reply_markup=get_post_action_keyboard()
-        )
-        clear_temp_file(pdf_file_path)
+        with tracing.span("tg.send_followup"):
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="Ваш DPIA Lite готовий. Я видалив усі ваші відповіді зі своєї пам'яті.",
+                reply_markup=get_post_action_keyboard()
+            )
 
     except Exception as e:
-        logger.error(f"PDF DPIA generation failed for user {user_id}: {e}", exc_info=True)
-        await update.message.reply_text(f"Під час генерації PDF сталася помилка: {e}")
+        logger.error("PDF DPIA generation failed for user %s: %s", user_id, e, exc_info=True)
+        await context.bot.send_message(chat_id=chat_id, text=f"Під час генерації PDF сталася помилка: {e}")
         # (v3.4) Викликаємо 'start' з фальшивим update
-        await start(_FakeUpdate(update.message.chat.id, context.bot), context)
+        await start(_FakeUpdate(chat_id, context.bot), context)
     
     finally:
+        # (v3.24) Видалення — у фоні, пакетом із рештою тимчасових повідомлень чату
+        EXPIRY.schedule_delete(generating_msg.chat_id, generating_msg.message_id)
+            
+        return ConversationHandler.END
+
+
+# --- (v3.18) Імпорт заповненого 1_dpia_lite.xlsx ---
+
+DPIA_UPLOAD_MAX_BYTES = int(os.getenv("DPIA_UPLOAD_MAX_BYTES", 512 * 1024))
+DPIA_UPLOAD_MAX_ROWS = int(os.getenv("DPIA_UPLOAD_MAX_ROWS", 200))
+# Скільки символів кожного поля показувати на екрані підтвердження (ліміт Telegram — 4096)
+UPLOAD_PREVIEW_CHARS = 120
+
+def _preview(text: str, limit: int = UPLOAD_PREVIEW_CHARS) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def get_dpia_upload_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("📄 Згенерувати", callback_data="dpia_upload_generate"),
+        InlineKeyboardButton("❌ Скасувати", callback_data="dpia_upload_cancel"),
+    ]])
+
+async def dpia_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.18) Приймає заповнений .xlsx, розбирає його поза event loop і показує підсумок."""
+    document = update.message.document
+    user_id = update.effective_user.id
+    logger.info("User %s надіслав Excel DPIA (%s байт).", user_id, document.file_size)
+
+    error = None
+    if not xlsx_available():
+        error = "імпорт Excel зараз недоступний"
+    elif document.file_size and document.file_size > DPIA_UPLOAD_MAX_BYTES:
+        error = "файл завеликий"
+    else:
+        content = None
         try:
-            await generating_msg.delete()
+            telegram_file = await document.get_file()
+            content = await telegram_file.download_as_bytearray()
+            if len(content) > DPIA_UPLOAD_MAX_BYTES:
+                raise ValueError("файл завеликий")
+            with tracing.span("doc.parse_xlsx", size_bytes=len(content)):
+                dpia_data = await asyncio.to_thread(parse_dpia_xlsx, content, max_rows=DPIA_UPLOAD_MAX_ROWS)
+        except ValueError as e:
+            error = str(e)
         except Exception as e:
-            logger.warning(f"Не вдалося видалити 'Генерую...' {e}")
-            
+            logger.error("Не вдалося прочитати Excel DPIA від user %s: %s", user_id, e, exc_info=True)
+            error = "не вдалося завантажити файл"
+        finally:
+            # Вміст файлу більше не потрібен — не тримаємо його в пам'яті
+            content = None
+
+    await delete_user_text_reply(update)
+    if error:
+        await update.message.reply_text(
+            **tg_format.message(templates.DPIA_UPLOAD_ERROR, error=error, max_kb=DPIA_UPLOAD_MAX_BYTES // 1024)
+        )
+        return ConversationHandler.END
+
+    clear_user_data(context)
+    context.user_data['dpia'] = dpia_data
+
+    preview = {key: _preview(value) for key, value in dpia_data.items() if isinstance(value, str)}
+    preview['minimization_data'] = [
+        {**item, 'item': _preview(item['item'], 60), 'reason': _preview(item['reason'], 60)}
+        for item in dpia_data['minimization_data']
+    ]
+    text = tg_format.render(templates.DPIA_UPLOAD_SUMMARY, **get_dpia_template_data(preview))
+    await edit_main_message(context, text, get_dpia_upload_keyboard(), new_message=True)
+
+    # (v3.5) Зберігаємо поточний стан
+    context.user_data['current_state'] = DPIA_UPLOAD_CONFIRM
+    return DPIA_UPLOAD_CONFIRM
+
+async def dpia_upload_generate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.18) Кнопка "Згенерувати" на екрані підсумку імпорту."""
+    query = update.callback_query
+    await query.answer()
+    return await _dpia_send_documents(context, query.message.chat_id, query.from_user.id)
+
+
+# === (v3.21) "Повний комплект": три документи одним проходом ===
+
+KIT_DELIVERY = os.getenv("KIT_DELIVERY", "group")  # group | zip
+KIT_FILENAMES = {
+    'policy': "privacy_policy.pdf",
+    'dpia': "dpia_lite.pdf",
+    'checklist': "checklist.pdf",
+}
+KIT_BUILDERS = {
+    'policy': build_policy_markdown,
+    'dpia': build_dpia_markdown,
+    'checklist': build_checklist_markdown,
+}
+
+async def start_kit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.21) Починає "Повний комплект": спершу спільні питання DPIA."""
+    query = update.callback_query
+    await query.answer()
+
+    clear_user_data(context)
+    logger.info("User %s почав 'Повний комплект'.", query.from_user.id)
+
+    context.user_data['dpia'] = {
+        'minimization_data': [],
+        'data_list': [],
+    }
+    context.user_data['kit'] = {'checklist': {}}
+
+    await edit_main_message(context, templates.KIT_Q_PROJECT_NAME, new_message=True)
+
+    # (v3.5) Зберігаємо поточний стан
+    context.user_data['current_state'] = DPIA_Q_TEAM
+    return DPIA_Q_TEAM
+
+async def kit_ask_contact(context: ContextTypes.DEFAULT_TYPE) -> int:
+    text = tg_format.render(templates.KIT_Q_CONTACT, **get_dpia_template_data(context.user_data['dpia']))
+    await edit_main_message(context, text)
+
+    # (v3.5) Зберігаємо поточний стан
+    context.user_data['current_state'] = KIT_Q_CONTACT
+    return KIT_Q_CONTACT
+
+def get_kit_checklist_keyboard(statuses: dict) -> InlineKeyboardMarkup:
+    """(v3.21) 9 пунктів Чек-ліста як перемикачі "виконано" + кнопка генерації."""
+    keyboard = []
+    for _, items in CHECKLIST_CATEGORIES:
+        for key, label in items:
+            mark = "✅" if statuses.get(key) == "yes" else "⬜"
+            keyboard.append([InlineKeyboardButton(f"{mark} {label}", callback_data=f"kit_cl:{key}")])
+    keyboard.append([InlineKeyboardButton("📦 Згенерувати 3 документи", callback_data="kit_generate")])
+    return InlineKeyboardMarkup(keyboard)
+
+async def kit_show_checklist(context: ContextTypes.DEFAULT_TYPE) -> int:
+    kit = context.user_data['kit']
+    text = tg_format.render(
+        templates.KIT_Q_CHECKLIST,
+        project_name=context.user_data['dpia'].get('project_name', '...'),
+        contact=kit.get('contact', '...'),
+    )
+    await edit_main_message(context, text, get_kit_checklist_keyboard(kit['checklist']))
+
+    # (v3.5) Зберігаємо поточний стан
+    context.user_data['current_state'] = KIT_Q_CHECKLIST
+    return KIT_Q_CHECKLIST
+
+async def kit_q_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['kit']['contact'] = update.message.text
+    await delete_user_text_reply(update)
+    return await kit_show_checklist(context)
+
+async def kit_q_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.21) Перемикачі пунктів Чек-ліста та кнопка "Згенерувати"."""
+    query = update.callback_query
+    await query.answer()
+
+    if query.data == "kit_generate":
+        return await kit_send_documents(context, query.message.chat_id, query.from_user.id)
+
+    key = query.data.partition(":")[2]
+    statuses = context.user_data['kit']['checklist']
+    statuses[key] = "no" if statuses.get(key) == "yes" else "yes"
+    return await kit_show_checklist(context)
+
+def _build_kit_archive(files: dict) -> bytes:
+    """(v3.21) Zip у пам'яті: ім'я файлу -> байти."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+@drainable_generation
+@single_flight_generation
+async def kit_send_documents(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> int:
+    """
+    (v3.21) Рендерить три PDF ОДНОЧАСНО (пул процесів) — загальний час близький
+    до найповільнішого рендера, а не до суми — і надсилає їх одним повідомленням.
+    """
+    logger.info("User %s: генерація 'Повного комплекту'.", user_id)
+    await delete_main_message(context)
+
+    with tracing.span("tg.generating_message"):
+        generating_msg = await context.bot.send_message(
+            chat_id=chat_id, text="Дякую! Генерую Політику, DPIA та Чек-ліст..."
+        )
+
+    # (v3.15) Посилання на відповіді беремо ДО очищення
+    kit = context.user_data['kit']
+    records = build_kit_records(context.user_data['dpia'], kit.get('contact', '[Не вказано]'), kit['checklist'])
+
+    # (v3.0) Очищуємо дані ДО генерації
+    clear_user_data(context)
+
+    # (v3.26) Три файли у спулі PDF звільняються разом після надсилання
+    spool = contextlib.AsyncExitStack()
+    try:
+        with tracing.span("doc.build_markdown", document="kit"):
+            markdowns = {kind: KIT_BUILDERS[kind](records[kind]) for kind in KIT_FILENAMES}
+
+        pdfs = {kind: await spool.enter_async_context(SPOOL.file(f"kit_{kind}")) for kind in KIT_FILENAMES}
+        started = time.perf_counter()
+        with metrics.GENERATION_QUEUE.track_inprogress():
+            jobs = [
+                render_pdf_async(content=markdowns[kind], output_filename=pdfs[kind].path)
+                for kind in KIT_FILENAMES
+            ]
+            if xlsx_available():
+                jobs.append(asyncio.to_thread(build_dpia_xlsx, records['dpia']))
+            results = await asyncio.gather(*jobs)
+        logger.info("Комплект для user %s згенеровано за %.0f мс.", user_id, (time.perf_counter() - started) * 1000)
+
+        files = {KIT_FILENAMES[kind]: pdfs[kind].read() for kind in KIT_FILENAMES}
+        if len(results) > len(KIT_FILENAMES):
+            files["DPIA_Lite.xlsx"] = results[-1]
+
+        with tracing.span("tg.send_document", document="kit", delivery=KIT_DELIVERY) as span:
+            span.set(size_bytes=sum(len(content) for content in files.values()))
+            if KIT_DELIVERY == "zip":
+                await context.bot.send_document(
+                    chat_id=chat_id, document=_build_kit_archive(files), filename="privacy_kit.zip"
+                )
+            else:
+                await context.bot.send_media_group(
+                    chat_id=chat_id,
+                    media=[InputMediaDocument(media=content, filename=name) for name, content in files.items()],
+                )
+
+        with tracing.span("tg.send_followup"):
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="Ваш комплект готовий: Політика, DPIA Lite та Чек-ліст. Я видалив усі ваші відповіді зі своєї пам'яті.",
+                reply_markup=get_post_action_keyboard()
+            )
+
+    except Exception as e:
+        logger.error("Kit generation failed for user %s: %s", user_id, e, exc_info=True)
+        await context.bot.send_message(chat_id=chat_id, text=f"Під час генерації комплекту сталася помилка: {e}")
+        # (v3.4) Викликаємо 'start' з фальшивим update
+        await start(_FakeUpdate(chat_id, context.bot), context)
+
+    finally:
+        await spool.aclose()
+        # (v3.24) Видалення — у фоні, пакетом із рештою тимчасових повідомлень чату
+        EXPIRY.schedule_delete(generating_msg.chat_id, generating_msg.message_id)
+
         return ConversationHandler.END
 
 
@@ -926,29 +1539,29 @@ def get_skip_note_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_status_text_md(status: str) -> str:
+def get_status_text_md(status: str) -> tg_format.Rich:
     """(v2.8) Повертає текстовий статус (для Telegram UI)."""
     if status == "yes":
-        return "✅ **Виконано**"
+        return tg_format.render("✅ **Виконано**")
     elif status == "no":
-        return "❌ **Не виконано**"
+        return tg_format.render("❌ **Не виконано**")
     else:
-        return "" 
+        return tg_format.Rich()
 
-def get_note_text_md(note: str) -> str:
+def get_note_text_md(note: str) -> tg_format.Rich:
     """(v2.8) Повертає відформатовану нотатку (без ✅)."""
     if not note:
-        return ""
+        return tg_format.Rich()
     if note == "*Пропущено*":
-        return "Нотатка: *Пропущено*"
-    return f"Нотатка: `{html.escape(note)}`"
+        return tg_format.render("Нотатка: *Пропущено*")
+    return tg_format.render("Нотатка: `{note}`", note=note)
 
 # (НОВЕ v3.8) Ця функція будує історію відповідей для Чек-ліста
-def get_checklist_summary_text(cl_data: dict) -> str:
+def get_checklist_summary_text(cl_data: dict) -> tg_format.Rich:
     """(v3.8) Генерує 'безшовний' підсумок відповідей для Чек-ліста."""
     
     # (v3.8) Завжди показуємо назву проєкту
-    summary = f"✅ **Назва Проєкту:** `{html.escape(cl_data.get('project_name', '...'))}`\n\n"
+    summary = tg_format.render("✅ **Назва Проєкту:** `{name}`\n\n", name=cl_data.get('project_name', '...'))
     
     items = [
         ('c1_s1', "1.1. 2FA"),
@@ -976,13 +1589,13 @@ def get_checklist_summary_text(cl_data: dict) -> str:
             if category != last_category:
                 if last_category != "":
                     summary += "\n" # Додаємо відступ між категоріями
-                summary += f"**Категорія {category} (Контроль Доступу):**\n"
+                summary += tg_format.render("**Категорія {category} (Контроль Доступу):**\n", category=category)
                 last_category = category
 
             # Додаємо сам пункт
-            summary += f"**{name}:** {get_status_text_md(status_val)}\n"
+            summary += tg_format.render("**{name}:** {status}\n", name=name, status=get_status_text_md(status_val))
             if note_val:
-                summary += f"{get_note_text_md(note_val)}\n"
+                summary += get_note_text_md(note_val) + "\n"
                 
     return summary.strip()
 
@@ -992,9 +1605,9 @@ def get_checklist_template_data(cl_data: dict) -> dict:
     # (v3.8) Більшість ключів тепер генеруються в `get_checklist_summary_text`
     # Нам потрібні лише ключі для *поточного* питання, яке ми ставимо
     data = {
-        'project_name': html.escape(cl_data.get('project_name', '...')),
+        'project_name': cl_data.get('project_name', '...'),
         'summary_text': get_checklist_summary_text(cl_data),
-        'status': "", # Це заповнюється для шаблонів *_NOTE
+        'status': tg_format.Rich(), # Це заповнюється для шаблонів *_NOTE
     }
     return data
 
@@ -1004,7 +1617,7 @@ async def start_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
 
     clear_user_data(context)
-    logger.info(f"User {query.from_user.id} почав 'Чек-ліст'.")
+    logger.info("User %s почав 'Чек-ліст'.", query.from_user.id)
     context.user_data['cl'] = {} 
     
     # (v3.8) Крок 1: Питаємо "Назву Проєкту"
@@ -1026,7 +1639,7 @@ async def start_checklist_from_upsell(update: Update, context: ContextTypes.DEFA
     
     # Тепер коректно запускаємо воркфлоу чек-ліста
     clear_user_data(context)
-    logger.info(f"User {query.from_user.id} почав 'Чек-ліст' (з Нагадування).")
+    logger.info("User %s почав 'Чек-ліст' (з Нагадування).", query.from_user.id)
     context.user_data['cl'] = {} 
     
     # (v3.8) Крок 1: Питаємо "Назву Проєкту"
@@ -1046,7 +1659,7 @@ async def checklist_q_project_name(update: Update, context: ContextTypes.DEFAULT
     
     # Ставимо перше питання
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C1_S1_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C1_S1_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
     
     # (v3.8) Зберігаємо поточний стан
@@ -1066,7 +1679,7 @@ async def checklist_c1_s1_note(update: Update, context: ContextTypes.DEFAULT_TYP
     # (v3.8) Ми маємо передати 'status' окремо, оскільки 'summary_text' ще не містить його
     template_data['status'] = get_status_text_md(status_val) 
     
-    text = templates.CHECKLIST_C1_S1_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C1_S1_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
     
     # (v3.6) Зберігаємо поточний стан
@@ -1075,7 +1688,7 @@ async def checklist_c1_s1_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c1_s2_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C1_S2_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C1_S2_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1102,7 +1715,7 @@ async def checklist_c1_s2_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
 
-    text = templates.CHECKLIST_C1_S2_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C1_S2_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1111,7 +1724,7 @@ async def checklist_c1_s2_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c1_s3_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C1_S3_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C1_S3_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1138,7 +1751,7 @@ async def checklist_c1_s3_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
 
-    text = templates.CHECKLIST_C1_S3_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C1_S3_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1149,7 +1762,7 @@ async def checklist_c1_s3_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c2_s1_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C2_S1_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C2_S1_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1176,7 +1789,7 @@ async def checklist_c2_s1_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
     
-    text = templates.CHECKLIST_C2_S1_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C2_S1_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1185,7 +1798,7 @@ async def checklist_c2_s1_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c2_s2_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C2_S2_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C2_S2_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1212,7 +1825,7 @@ async def checklist_c2_s2_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
 
-    text = templates.CHECKLIST_C2_S2_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C2_S2_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1221,7 +1834,7 @@ async def checklist_c2_s2_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c2_s3_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C2_S3_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C2_S3_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1248,7 +1861,7 @@ async def checklist_c2_s3_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
 
-    text = templates.CHECKLIST_C2_S3_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C2_S3_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1259,7 +1872,7 @@ async def checklist_c2_s3_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c3_s1_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C3_S1_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C3_S1_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1286,7 +1899,7 @@ async def checklist_c3_s1_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
 
-    text = templates.CHECKLIST_C3_S1_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C3_S1_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1295,7 +1908,7 @@ async def checklist_c3_s1_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c3_s2_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C3_S2_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C3_S2_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1322,7 +1935,7 @@ async def checklist_c3_s2_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
 
-    text = templates.CHECKLIST_C3_S2_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C3_S2_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1331,7 +1944,7 @@ async def checklist_c3_s2_note(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def _ask_c3_s3_status(context: ContextTypes.DEFAULT_TYPE) -> int:
     template_data = get_checklist_template_data(context.user_data['cl'])
-    text = templates.CHECKLIST_C3_S3_STATUS.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C3_S3_STATUS, **template_data)
     await edit_main_message(context, text, get_checklist_status_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1358,7 +1971,7 @@ async def checklist_c3_s3_note(update: Update, context: ContextTypes.DEFAULT_TYP
     template_data = get_checklist_template_data(context.user_data['cl'])
     template_data['status'] = get_status_text_md(status_val)
 
-    text = templates.CHECKLIST_C3_S3_NOTE.format(**template_data)
+    text = tg_format.render(templates.CHECKLIST_C3_S3_NOTE, **template_data)
     await edit_main_message(context, text, get_skip_note_keyboard())
 
     # (v3.6) Зберігаємо поточний стан
@@ -1378,119 +1991,251 @@ async def checklist_generate_from_skip(update: Update, context: ContextTypes.DEF
     context.user_data['cl']['c3_s3_note'] = "*Пропущено*"
     return await checklist_generate(update, context)
 
+# --- (v3.19) Імпорт заповненого Чек-ліста (текст або файл) ---
+
+CHECKLIST_IMPORT_MAX_BYTES = int(os.getenv("CHECKLIST_IMPORT_MAX_BYTES", 64 * 1024))
+# Вставлений текст схожий на Чек-ліст: "- [x] ..." або рядок таблиці "| 1.1. ..."
+CHECKLIST_PASTE_PATTERN = r"(?m)^\s*(?:[-*+]\s+\[[ xXхХ✓✔]\]|\|?\s*[1-3]\.[1-3]\.\s)"
+
+async def checklist_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """(v3.19) Вставлений текстом або надісланий файлом Чек-ліст -> одразу PDF."""
+    user_id = update.effective_user.id
+    document = update.message.document
+
+    try:
+        if document:
+            logger.info("User %s надіслав файл Чек-ліста (%s байт).", user_id, document.file_size)
+            if document.file_size and document.file_size > CHECKLIST_IMPORT_MAX_BYTES:
+                raise ValueError("файл завеликий")
+            telegram_file = await document.get_file()
+            content = await telegram_file.download_as_bytearray()
+            if len(content) > CHECKLIST_IMPORT_MAX_BYTES:
+                raise ValueError("файл завеликий")
+            try:
+                text = content.decode("utf-8-sig")
+            except UnicodeDecodeError:
+                raise ValueError("файл має бути текстом у кодуванні UTF-8")
+            finally:
+                content = None
+        else:
+            logger.info("User %s вставив Чек-ліст текстом.", user_id)
+            text = update.message.text
+        # Як і Excel DPIA — розбір поза event loop, щоб довгий текст не гальмував інших
+        cl_data = await asyncio.to_thread(parse_checklist_markdown, text)
+    except ValueError as e:
+        await update.message.reply_text(
+            **tg_format.message(
+                "⚠️ Не вдалося розібрати Чек-ліст: {error}\n\n"
+                "Надішліть копію `3_minimization_checklist.md` з позначками `- [x]` або пройдіть Чек-ліст у меню.",
+                error=str(e),
+            )
+        )
+        return ConversationHandler.END
+    except Exception as e:
+        logger.error("Не вдалося завантажити Чек-ліст від user %s: %s", user_id, e, exc_info=True)
+        await update.message.reply_text("⚠️ Не вдалося завантажити файл. Спробуйте ще раз.")
+        return ConversationHandler.END
+
+    await delete_user_text_reply(update)
+    clear_user_data(context)
+    context.user_data['cl'] = cl_data
+    return await checklist_generate(update, context)
+
+@drainable_generation
+@single_flight_generation
 async def checklist_generate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """(ОНОВЛЕНО v3.8) Генерує PDF Чек-ліста та показує кнопку "Повернутись"."""
     user_id = context._user_id
-    logger.info(f"User {user_id}: генерація PDF Чек-ліста.")
+    logger.info("User %s: генерація PDF Чек-ліста.", user_id)
     
     await delete_main_message(context)
     
     # Визначаємо chat_id для відповіді
     chat_id = update.message.chat_id if update.message else update.callback_query.message.chat_id
     
-    generating_msg = await context.bot.send_message(
-        chat_id=chat_id,
-        text="Дякую! Аудит 9/9 завершено. Генерую ваш Чек-ліст PDF..."
-    )
-
-    data = context.user_data['cl']
-    
-    def get_status_md_text(status_key: str) -> str:
-        status = data.get(status_key)
-        if status == "yes":
-            return "Виконано"
-        elif status == "no":
-            return "Не виконано"
-        else:
-            return "Не заповнено"
-
-    def get_note_md_text_pdf(note_key: str) -> str:
-        note = data.get(note_key, "*Не заповнено*")
-        if note == "*Пропущено*":
-            return note
-        note_safe = html.escape(note)
-        # (v3.6) Замінюємо markdown-escape на html <br>
-        return note_safe.replace("\n", "<br>") 
-
-    table_header = "| Пункт | Статус | Ваші Нотатки (для себе) |\n| :--- | :--- | :--- |\n"
-    
-    cat_1_header = "### Категорія 1: Контроль Доступу\n\n"
-    cat_1_rows = [
-        f"| 1.1. 2FA (Двофакторна Автентифікація) | {get_status_md_text('c1_s1_status')} | {get_note_md_text_pdf('c1_s1_note')} |",
-        f"| 1.2. Принцип 'Найменших привілеїв' | {get_status_md_text('c1_s2_status')} | {get_note_md_text_pdf('c1_s2_note')} |",
-        f"| 1.3. БЕЗ ПУБЛІЧНИХ ПОСИЛАНЬ | {get_status_md_text('c1_s3_status')} | {get_note_md_text_pdf('c1_s3_note')} |",
-    ]
-    cat_1_table = cat_1_header + table_header + "\n".join(cat_1_rows)
-
-    cat_2_header = "\n\n### Категорія 2: Права Користувачів\n\n"
-    cat_2_rows = [
-        f"| 2.1. Публічна Політика | {get_status_md_text('c2_s1_status')} | {get_note_md_text_pdf('c2_s1_note')} |",
-        f"| 2.2. Механізм Видалення (Ст. 8) | {get_status_md_text('c2_s2_status')} | {get_note_md_text_pdf('c2_s2_note')} |",
-        f"| 2.3. Контакт для скарг | {get_status_md_text('c2_s3_status')} | {get_note_md_text_pdf('c2_s3_note')} |",
-    ]
-    cat_2_table = cat_2_header + table_header + "\n".join(cat_2_rows)
-
-    cat_3_header = "\n\n### Категорія 3: Технічна Гігієна\n\n"
-    cat_3_rows = [
-        f"| 3.1. Безпека Токенів | {get_status_md_text('c3_s1_status')} | {get_note_md_text_pdf('c3_s1_note')} |",
-        f"| 3.2. Планування Строків (Retention) | {get_status_md_text('c3_s2_status')} | {get_note_md_text_pdf('c3_s2_note')} |",
-        f"| 3.3. Шифрування (Якщо є паролі) | {get_status_md_text('c3_s3_status')} | {get_note_md_text_pdf('c3_s3_note')} |",
-    ]
-    cat_3_table = cat_3_header + table_header + "\n".join(cat_3_rows)
+    with tracing.span("tg.generating_message"):
+        generating_msg = await context.bot.send_message(
+            chat_id=chat_id,
+            text="Дякую! Аудит 9/9 завершено. Генерую ваш Чек-ліст PDF..."
+        )
 
-    checklist_content = f"{cat_1_table}{cat_2_table}{cat_3_table}"
+    # (v3.15) Посилання на відповіді беремо ДО очищення (сам словник не змінюється)
+    cl_data = context.user_data['cl']
 
-    # (v3.8) КРИТИЧНИЙ ФІКС: Додаємо 'project_name'
-    data_dict = {
-        'project_name': html.escape(data.get('project_name', '[Назва Проєкту]')),
-        'date': date.today().strftime("%d.%m.%Y"),
-        'checklist_content': checklist_content 
-    }
-    
     # (v3.0) Очищуємо дані ДО генерації
     clear_user_data(context)
 
     try:
-        # (v3.8) Тепер .format() отримає 'project_name'
-        filled_markdown = templates.CHECKLIST_TEMPLATE_PDF.format(**data_dict)
-        
-        pdf_file_path = create_pdf_from_markdown(
-            content=filled_markdown,
-            is_html=False, 
-            output_filename=f"checklist_{user_id}.pdf"
-        )
+        with tracing.span("doc.build_markdown", document="checklist"):
+            filled_markdown = build_checklist_markdown(cl_data)
         
-        await generating_msg.delete()
-        
-        await context.bot.send_document(chat_id=chat_id, document=open(pdf_file_path, 'rb'))
+        # (v3.26) Файл у спулі PDF: унікальне ім'я, квота, зникає після надсилання
+        async with SPOOL.file("checklist") as pdf:
+            # (v3.11) Глибина "черги" генерацій для метрик
+            with metrics.GENERATION_QUEUE.track_inprogress():
+                # (v3.16) Рендер у пулі процесів; апдейти інших користувачів тим часом
+                # обробляються паралельно (`update_processor.py`)
+                await render_pdf_async(content=filled_markdown, output_filename=pdf.path)
+
+            with tracing.span("tg.send_document") as span:
+                document = pdf.open()
+                span.set(size_bytes=os.fstat(document.fileno()).st_size)
+                await context.bot.send_document(
+                    chat_id=chat_id, document=document, filename=f"checklist_{user_id}.pdf"
+                )
         
         # (v3.2) Використовуємо helper-функцію
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="Ваш детальний Чек-ліст готовий. Я видалив усі ваші відповіді зі своєї пам'яті.",
-            reply_markup=get_post_action_keyboard()
-        )
-        clear_temp_file(pdf_file_path)
+        with tracing.span("tg.send_followup"):
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="Ваш детальний Чек-ліст готовий. Я видалив усі ваші відповіді зі своєї пам'яті.",
+                reply_markup=get_post_action_keyboard()
+            )
 
     except Exception as e:
-        logger.error(f"PDF Checklist generation failed for user {user_id}: {e}", exc_info=True)
-        try:
-            await generating_msg.delete()
-        except Exception:
-            pass
+        logger.error("PDF Checklist generation failed for user %s: %s", user_id, e, exc_info=True)
         await context.bot.send_message(chat_id=chat_id, text=f"Під час генерації PDF сталася помилка: {e}")
         # (v3.4) Викликаємо 'start' з фальшивим update
         await start(_FakeUpdate(chat_id, context.bot), context)
     
     finally:
+        # (v3.24) Видалення — у фоні, пакетом із рештою тимчасових повідомлень чату
+        EXPIRY.schedule_delete(generating_msg.chat_id, generating_msg.message_id)
         return ConversationHandler.END
 
 
 # === 5. Налаштування та Запуск Бота ===
 
+def _warm_up_documents() -> None:
+    """(v3.14) Фаза 2 старту: перевіряє шаблони документів і прогріває рендер (у потоці)."""
+    try:
+        samples = []
+        for template in (templates.POLICY_TEMPLATE, templates.DPIA_TEMPLATE, templates.CHECKLIST_TEMPLATE_PDF):
+            fields = {name for _, name, _, _ in string.Formatter().parse(template) if name}
+            samples.append(template.format(**{name: "..." for name in fields}))
+        warm_up_render_pool(sample_markdown="\n\n".join(samples))
+        # (v3.17) Шаблон Excel DPIA розбираємо один раз, до першого запиту
+        if xlsx_available():
+            load_dpia_template()
+    except Exception as e:
+        # Не фатально: перший справжній рендер просто буде повільнішим
+        logger.warning("Прогрів рендера не вдався: %s", e, exc_info=True)
+
+
+# (v3.14) Пауза після старту polling: перші апдейти обробляються без конкуренції за GIL
+WARM_UP_DELAY_SECONDS = 0.5
+_warm_up_task = None
+
+async def _warm_up_when_polling(application: Application) -> None:
+    # (v3.28) Воркер диспетчера не має Updater — чекаємо на запуск Application
+    while not (application.updater.running if application.updater else application.running):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(WARM_UP_DELAY_SECONDS)
+    await asyncio.to_thread(_warm_up_documents)
+
+_http_api_runner = None
+
+# (v3.27) Блокуючі виклики в хендлерах -> WARNING зі стеком + метрика
+LOOP_MONITOR = LoopLagMonitor()
+
+async def post_init(application: Application) -> None:
+    """(v3.14) Запускає прогрів у фоні й одразу повертається — polling стартує без очікування."""
+    global _warm_up_task, _http_api_runner
+    LOOP_MONITOR.start()
+    # (v3.24) "Підмітальник" тимчасових повідомлень
+    EXPIRY.start(application.bot)
+    # (v3.25) Тимчасові PDF старих версій у робочому каталозі
+    await asyncio.to_thread(sweep_temp_pdfs)
+    # (v3.26) "Сироти" у спулі PDF — зараз і далі періодично
+    SPOOL.start_sweeper()
+
+    # (v3.16) HTTP API генерації в тому ж процесі (спільний пул рендера)
+    http_api_port = os.getenv("HTTP_API_PORT")
+    if http_api_port:
+        from http_api import start_http_api
+        _http_api_runner = await start_http_api(os.getenv("HTTP_API_HOST", "127.0.0.1"), int(http_api_port))
+
+    if os.getenv("RENDER_WARM_UP", "1") == "0":
+        return
+    _warm_up_task = asyncio.get_running_loop().create_task(_warm_up_when_polling(application))
+
+async def post_stop(application: Application) -> None:
+    """(v3.24) Бот ще може ходити в API: прибираємо тимчасові повідомлення."""
+    await EXPIRY.stop(flush=True)
+
+async def post_shutdown(application: Application) -> None:
+    """(v3.16) Зупиняє HTTP API та пул рендера."""
+    if _http_api_runner:
+        await _http_api_runner.cleanup()
+    await SPOOL.stop_sweeper()
+    await LOOP_MONITOR.stop()
+    await close_render_client()
+    await asyncio.to_thread(shutdown_render_pool)
+
+
+class PrivacySentryApplication(Application):
+    """(v3.12) Application, що відкриває кореневий спан трасування для кожного апдейту."""
+    # (v3.22) ...і позначає апдейт обробленим для фільтра дублікатів
+    # (v3.25) ...і коректно зупиняється (див. shutdown.py)
+
+    async def stop(self) -> None:
+        """(v3.25) Спершу "зливаємо" генерації (з дедлайном), потім стандартна зупинка PTB."""
+        if self.running:
+            await SHUTDOWN.drain(self.bot)
+        await super().stop()
+
+    async def process_update(self, update: object) -> None:
+        kind = "callback_query" if getattr(update, "callback_query", None) else "message"
+        try:
+            with tracing.trace("update", kind=kind):
+                await super().process_update(update)
+        finally:
+            # (v3.22) Вікно подвійного натискання — від ЗАВЕРШЕННЯ обробки
+            DEDUPLICATOR.mark_processed(update)
+
+
 def main() -> None: # (v3.1.2) Повернено до СИНХРОННОЇ
     """Запускає бота."""
-    application = Application.builder().token(BOT_TOKEN).build()
+    configure_logging()
+    # (v3.9) Якщо задано SESSION_STORE_PATH, незавершені сесії переживуть рестарт
+    persistence = build_session_persistence()
+    # (v3.12) Трасування вмикається змінною TRACE_EXPORT (див. tracing.py)
+    tracing.configure()
+
+    # (v3.11) Кожен виклик Bot API міряється (метод + статус, без токена)
+    InstrumentedRequest = metrics.instrumented_request_class()
+    builder = (
+        Application.builder()
+        .application_class(PrivacySentryApplication)
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        # (v3.24) Тимчасові повідомлення видаляє EXPIRY — APScheduler не потрібен
+        .job_queue(None)
+        # (v3.16) Користувачі обробляються паралельно, апдейти одного — по черзі
+        # (v3.22) ...крім тих, що фільтр дублікатів відкине як "генерація триває"
+        .concurrent_updates(PerUserUpdateProcessor(skip_queue=DEDUPLICATOR.skips_queue))
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest())
+    )
+    # (v3.10) Для офлайн-тестів: бот ходить у фейковий Bot API (fake_bot_api.py)
+    api_base_url = os.getenv("TELEGRAM_API_BASE_URL")
+    if api_base_url:
+        logger.warning("Використовую нестандартний Bot API: %s", api_base_url)
+        builder = builder.base_url(api_base_url)
+        # (v3.18) Файли (імпорт Excel) завантажуються з того ж сервера
+        default_file_url = api_base_url[:-len("/bot")] + "/file/bot" if api_base_url.endswith("/bot") else None
+        base_file_url = os.getenv("TELEGRAM_API_BASE_FILE_URL", default_file_url)
+        if base_file_url:
+            builder = builder.base_file_url(base_file_url)
+    if persistence:
+        builder = builder.persistence(persistence)
+    # (v3.28) Воркер диспетчера (dispatcher.py): апдейти приходять від диспетчера
+    worker_port = os.getenv("BOT_WORKER_PORT")
+    if worker_port:
+        builder = builder.updater(None)
+    application = builder.build()
 
     # (v3.2) СТВОРЮЄМО ОДИН ЄДИНИЙ ОБРОБНИК РОЗМОВ
     main_conv_handler = ConversationHandler(
@@ -1498,8 +2243,18 @@ def main() -> None: # (v3.1.2) Повернено до СИНХРОННОЇ
             CallbackQueryHandler(start_policy, pattern="^start_policy$"),
             CallbackQueryHandler(start_dpia, pattern="^start_dpia$"),
             CallbackQueryHandler(start_checklist, pattern="^start_checklist$"),
+            CallbackQueryHandler(start_kit, pattern="^start_kit$"),
             # (НОВЕ v3.4) Вхідна точка для "Етичного Нагадування"
-            CallbackQueryHandler(start_checklist_from_upsell, pattern="^start_checklist_upsell$")
+            CallbackQueryHandler(start_checklist_from_upsell, pattern="^start_checklist_upsell$"),
+            # (v3.18) Надісланий заповнений 1_dpia_lite.xlsx
+            MessageHandler(filters.Document.FileExtension("xlsx"), dpia_upload),
+            # (v3.19) Заповнений Чек-ліст: файл .md/.txt або вставлений текст
+            MessageHandler(
+                filters.Document.FileExtension("md") | filters.Document.FileExtension("txt"), checklist_import
+            ),
+            MessageHandler(
+                filters.TEXT & ~filters.COMMAND & filters.Regex(CHECKLIST_PASTE_PATTERN), checklist_import
+            )
         ],
         states={
             # --- Стани "Політики" (10-14) ---
@@ -1514,13 +2269,25 @@ def main() -> None: # (v3.1.2) Повернено до СИНХРОННОЇ
             DPIA_Q_GOAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_goal)],
             DPIA_Q_DATA_LIST: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_data_list)],
             DPIA_Q_MINIMIZATION_START: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_minimization_start)],
-            DPIA_Q_MINIMIZATION_REASON: [CallbackQueryHandler(dpia_q_minimization_reason, pattern="^min_(yes|no)$")],
-            DPIA_Q_MINIMIZATION_STATUS: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_minimization_status)],
+            # (v3.20) Екран мультивибору (min_yes/min_no — кнопки сесій до v3.20)
+            DPIA_Q_MINIMIZATION_REASON: [
+                CallbackQueryHandler(dpia_q_minimization_select, pattern="^min_(toggle|page|noop|done|yes|no)")
+            ],
+            DPIA_Q_MINIMIZATION_STATUS: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_minimization_reasons)],
             DPIA_Q_RETENTION_MECHANISM: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_retention_mechanism)],
             DPIA_Q_STORAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_storage)],
             DPIA_Q_RISK: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_risk)],
             DPIA_Q_MITIGATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_q_mitigation)],
             DPIA_GENERATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, dpia_generate)],
+            # (v3.18) Імпорт з Excel
+            DPIA_UPLOAD_CONFIRM: [
+                CallbackQueryHandler(dpia_upload_generate, pattern="^dpia_upload_generate$"),
+                CallbackQueryHandler(cancel, pattern="^dpia_upload_cancel$")
+            ],
+
+            # --- Стани "Повного комплекту" (60-61) --- (v3.21)
+            KIT_Q_CONTACT: [MessageHandler(filters.TEXT & ~filters.COMMAND, kit_q_contact)],
+            KIT_Q_CHECKLIST: [CallbackQueryHandler(kit_q_checklist, pattern="^kit_(cl:c[1-3]_s[1-3]|generate)$")],
 
             # --- Стани "Чек-ліста" (40-58) --- (v3.8)
             # (v3.8) НОВИЙ СТАН
@@ -1584,17 +2351,34 @@ def main() -> None: # (v3.1.2) Повернено до СИНХРОННОЇ
             # (НОВЕ v3.4) "Блокувальник"
             CallbackQueryHandler(
                 block_workflow_switch, 
-                pattern="^start_policy$|^start_dpia$|^start_checklist$"
+                pattern="^start_policy$|^start_dpia$|^start_checklist$|^start_kit$"
             ),
             # (НОВЕ v3.4) Кнопка "Скасувати" з "Блокувальника"
             CallbackQueryHandler(cancel_from_block, pattern="^cancel_from_block$"),
+            # (v3.33) Сторінки повного підсумку (стан розмови не змінюється)
+            CallbackQueryHandler(show_main_summary, pattern=r"^sum_(page:\d+|back)$"),
             
             # Стандартний /cancel
             CommandHandler("cancel", cancel)
         ],
         # (v3.4) ВИДАЛЕНО 'allow_reentry=True'. Тепер бот "блокується".
+        # (v3.9) Стан розмови зберігається разом із user_data (якщо є сховище)
+        name="main_conversation",
+        persistent=persistence is not None,
     )
 
+    # (v3.22) Дублікати відкидаються першими (група -3) і рахуються окремо
+    application.add_handler(TypeHandler(Update, DEDUPLICATOR.handle), group=-3)
+    # (v3.23) Потім ліміт частоти на користувача (token bucket)
+    throttle = UpdateThrottle()
+    if throttle.enabled:
+        application.add_handler(TypeHandler(Update, throttle.handle), group=-2)
+
+    # (v3.11) Метрики: лічильник апдейтів (група -1, до розмови)
+    # та латентність кожного кроку розмови за станом
+    application.add_handler(TypeHandler(Update, metrics.count_update), group=-1)
+    metrics.instrument_conversation(main_conv_handler, STATE_NAMES)
+
     application.add_handler(main_conv_handler)
     
     # Головні команди та кнопки меню (вони поза розмовою)
@@ -1613,11 +2397,29 @@ def main() -> None: # (v3.1.2) Повернено до СИНХРОННОЇ
     # (v3.2) Цей 'cancel' обробляється, лише якщо ми НЕ в 'main_conv_handler'
     application.add_handler(CommandHandler("cancel", cancel)) 
 
+    # (v3.11) Хендлери поза розмовою теж міряємо (стан "GLOBAL")
+    metrics.instrument_handlers(
+        [h for h in application.handlers[0] if h is not main_conv_handler], "GLOBAL"
+    )
+    metrics.ACTIVE_SESSIONS.set_function(metrics.active_sessions_callback(application, FLOW_KEYS))
+
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        metrics.start_metrics_server(int(metrics_port), os.getenv("METRICS_HOST", "127.0.0.1"))
+
     # (v3.1.2) Ми не можемо отримати username до запуску run_polling(),
     # тому що run_polling() - це синхронний блокуючий виклик.
     # ЛОГ про username з'явиться автоматично ПІСЛЯ запуску.
     logger.info("Бот запускається...")
     
+    # (v3.27) USE_UVLOOP=1 — цикл uvloop (run_polling створює цикл за політикою)
+    install_uvloop()
+
+    if worker_port:
+        from dispatcher import run_worker
+        asyncio.run(run_worker(application, int(worker_port), os.getenv("BOT_WORKER_SECRET", "")))
+        return
+
     # (v3.1.2) run_polling() - це блокуюча, синхронна функція.
     application.run_polling() 
 
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.28) Горизонтальне масштабування: вебхук-диспетчер + N процесів-воркерів.
+
+Один процес Python — це одне ядро для роботи хендлерів. У цьому режимі
+легкий диспетчер (лише aiohttp, без PTB) приймає вебхук Telegram і розкладає
+апдейти по N воркерах — кожен воркер це звичайний `bot.py` (той самий
+`Application`), запущений з BOT_WORKER_PORT, що отримує апдейти від
+диспетчера замість getUpdates.
+
+  - Шардування за user_id консистентним хешуванням (`HashRing`, DISPATCHER_VNODES
+    віртуальних вузлів на воркер): усі апдейти користувача потрапляють до
+    одного воркера, тож стан розмови (`user_data`) лишається локальним.
+  - Диспетчер відповідає Telegram одразу; кожен воркер отримує апдейти
+    пачками (до FORWARD_BATCH) у порядку надходження — одна POST /updates
+    за раз на воркер.
+  - Перевірка здоров'я кожні DISPATCHER_HEALTH_INTERVAL секунд (2): процес живий
+    і GET /healthz відповідає. Після DISPATCHER_UNHEALTHY_AFTER (2) невдач воркер
+    виходить з кільця — його користувачі (~1/N) переходять до сусідів, решта
+    не рухається; черга воркера перенаправляється. Впалий процес
+    перезапускається (з паузою до 30 с), і щойно він здоровий — повертається в
+    кільце і отримує назад ТИХ САМИХ користувачів (ребалансування).
+  - Кожен воркер має власні SESSION_STORE_PATH (`<шлях>.<номер>`), METRICS_PORT
+    (`порт + 1 + номер`) і частку RENDER_WORKERS; HTTP API запускайте окремо
+    (`python http_api.py`).
+
+Змінні оточення:
+  DISPATCHER_WORKERS      — кількість воркерів (кількість ядер)
+  WEBHOOK_HOST/WEBHOOK_PORT/WEBHOOK_PATH — де слухати (127.0.0.1:8443/telegram)
+  WEBHOOK_URL             — публічна адреса; якщо задано, викликається setWebhook
+  WEBHOOK_SECRET          — secret_token вебхука (заголовок X-Telegram-Bot-Api-Secret-Token)
+  DISPATCHER_WORKER_BASE_PORT — перший порт воркерів на 127.0.0.1 (8700)
+
+Запуск:
+    python dispatcher.py --workers 4
+Офлайн-тест проти фейкового Bot API:
+    python loadtest.py --dispatcher-workers 3 --users 300 --concurrency 60
+"""
+
+import argparse
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+
+from logging_setup import configure_logging
+
+logger = logging.getLogger("dispatcher")
+logger.setLevel(logging.INFO)
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+TELEGRAM_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Спільний секрет диспетчера й воркерів (генерується на кожен запуск)
+WORKER_SECRET_HEADER = "X-Worker-Secret"
+# Скільки апдейтів максимум в одному POST /updates до воркера
+FORWARD_BATCH = 100
+# Максимальна пауза перед повторним запуском впалого воркера, с
+MAX_RESTART_BACKOFF = 30.0
+
+
+def shard_key(update: Dict[str, Any]) -> int:
+    """Ключ шардування: id користувача (from/user), інакше чату, інакше update_id."""
+    for payload in update.values():
+        if not isinstance(payload, dict):
+            continue
+        user = payload.get("from") or payload.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return int(user["id"])
+        chat = payload.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return int(update.get("update_id", 0))
+
+
+class HashRing:
+    """Консистентне хешування: вихід/повернення вузла переносить лише його частку ключів."""
+
+    def __init__(self, vnodes: Optional[int] = None):
+        self.vnodes = int(os.getenv("DISPATCHER_VNODES", 160)) if vnodes is None else vnodes
+        self._points: Dict[int, int] = {}  # Точка на кільці -> вузол
+        self._hashes: List[int] = []
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def __contains__(self, node: int) -> bool:
+        return node in self.nodes
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def nodes(self) -> set:
+        return set(self._points.values())
+
+    def add(self, node: int) -> None:
+        for replica in range(self.vnodes):
+            self._points[self._hash(f"worker-{node}#{replica}")] = node
+        self._hashes = sorted(self._points)
+
+    def remove(self, node: int) -> None:
+        self._points = {point: owner for point, owner in self._points.items() if owner != node}
+        self._hashes = sorted(self._points)
+
+    def node_for(self, key: int) -> Optional[int]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(str(key))) % len(self._hashes)
+        return self._points[self._hashes[index]]
+
+    def share(self, node: int) -> float:
+        """Частка простору ключів, що належить вузлу (0..1)."""
+        if not self._hashes:
+            return 0.0
+        total = 2 ** 64
+        owned = 0
+        for i, point in enumerate(self._hashes):
+            if self._points[point] == node:
+                # Точка володіє дугою від попередньої точки (не включно) до себе
+                previous = self._hashes[i - 1] if i else self._hashes[-1] - total
+                owned += point - previous
+        return owned / total
+
+
+class Worker:
+    """Процес `bot.py` у режимі воркера + черга апдейтів для нього."""
+
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.process: Optional[subprocess.Popen] = None
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.failures = 0
+        self.restarts = 0
+        self.next_start = 0.0
+        self.forwarded = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class Dispatcher:
+    """Приймає вебхук, шардує апдейти по воркерах, стежить за їх здоров'ям."""
+
+    def __init__(self, workers: int, base_port: int, secret: str = ""):
+        self.secret = secret
+        self.health_interval = float(os.getenv("DISPATCHER_HEALTH_INTERVAL", 2))
+        self.unhealthy_after = int(os.getenv("DISPATCHER_UNHEALTHY_AFTER", 2))
+        self.worker_secret = secrets.token_urlsafe(16)
+        self.workers = [Worker(index, base_port + index) for index in range(workers)]
+        self.ring = HashRing()
+        # Апдейти, які нікуди відправити (усі воркери поза кільцем)
+        self._held: List[Dict[str, Any]] = []
+        self._session: Optional[ClientSession] = None
+        self._health: Optional[asyncio.Task] = None
+        self._forwarders: List[asyncio.Task] = []
+
+        self.app = web.Application()
+        self.app.router.add_post(os.getenv("WEBHOOK_PATH", "/telegram"), self._webhook)
+        self.app.router.add_get("/healthz", self._healthz)
+
+    # === Воркери ===
+
+    def _worker_env(self, worker: Worker) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["BOT_WORKER_PORT"] = str(worker.port)
+        env["BOT_WORKER_SECRET"] = self.worker_secret
+        # Ядра ділимо між воркерами (у кожного свій пул рендера)
+        env.setdefault("RENDER_WORKERS", str(max(1, (os.cpu_count() or 1) // len(self.workers))))
+        # (v3.26) Спул PDF спільний: квота ділиться між воркерами (і демоном рендера, якщо він є)
+        env.setdefault("PDF_SPOOL_PROCESSES", str(len(self.workers) + (1 if env.get("RENDER_SOCKET") else 0)))
+        # Стан, що має бути окремим для кожного процесу
+        if env.get("SESSION_STORE_PATH"):
+            env["SESSION_STORE_PATH"] = f"{env['SESSION_STORE_PATH']}.{worker.index}"
+        if env.get("METRICS_PORT"):
+            env["METRICS_PORT"] = str(int(env["METRICS_PORT"]) + 1 + worker.index)
+        env.pop("HTTP_API_PORT", None)
+        return env
+
+    def _spawn(self, worker: Worker) -> None:
+        # Власна група процесів: пул рендера впалого воркера прибирається разом з ним
+        worker.process = subprocess.Popen(
+            [sys.executable, BOT_PATH], env=self._worker_env(worker), start_new_session=True
+        )
+        worker.failures = 0
+        logger.info("Воркер %s запущено (pid %s, порт %s).", worker.index, worker.process.pid, worker.port)
+
+    def _mark_up(self, worker: Worker) -> None:
+        self.ring.add(worker.index)
+        logger.info(
+            "Воркер %s у строю: у кільці %s з %s, його частка користувачів %.0f%%.",
+            worker.index, len(self.ring), len(self.workers), self.ring.share(worker.index) * 100,
+        )
+        held, self._held = self._held, []
+        self._reroute(held)
+
+    def _mark_down(self, worker: Worker, reason: str, unsent: Sequence[Dict[str, Any]] = ()) -> None:
+        """Виводить воркера з кільця; `unsent` — пачка, яку він не прийняв (старша за його чергу)."""
+        if worker.index in self.ring:
+            share = self.ring.share(worker.index)
+            self.ring.remove(worker.index)
+            logger.warning(
+                "Воркер %s виведено з кільця (%s): %.0f%% користувачів переходять до %s інших.",
+                worker.index, reason, share * 100, len(self.ring),
+            )
+        # Неприйнята пачка, за нею черга впалого воркера — сусідам за кільцем у тому ж порядку
+        pending = list(unsent)
+        while not worker.queue.empty():
+            pending.append(worker.queue.get_nowait())
+            worker.queue.task_done()
+        self._reroute(pending)
+
+    @staticmethod
+    def _kill_group(worker: Worker) -> None:
+        """SIGKILL усій групі процесів воркера (сам воркер і його пул рендера)."""
+        with contextlib.suppress(ProcessLookupError, PermissionError):
+            os.killpg(worker.process.pid, signal.SIGKILL)
+
+    async def _check(self, worker: Worker) -> None:
+        code = worker.process.poll() if worker.process else None
+        if code is not None:
+            self._mark_down(worker, f"процес завершився з кодом {code}")
+            self._kill_group(worker)
+            if time.monotonic() >= worker.next_start:
+                worker.restarts += 1
+                worker.next_start = time.monotonic() + min(MAX_RESTART_BACKOFF, 2.0 ** min(worker.restarts, 5))
+                self._spawn(worker)
+            return
+        try:
+            timeout = ClientTimeout(total=self.health_interval)
+            async with self._session.get(f"{worker.url}/healthz", timeout=timeout) as resp:
+                healthy = resp.status == 200
+        except (ClientError, asyncio.TimeoutError):
+            healthy = False
+        if healthy:
+            worker.failures = 0
+            if worker.index not in self.ring:
+                self._mark_up(worker)
+            return
+        worker.failures += 1
+        if worker.failures >= self.unhealthy_after:
+            self._mark_down(worker, f"{worker.failures} невдалих перевірок здоров'я")
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check(worker) for worker in self.workers))
+            await asyncio.sleep(self.health_interval)
+
+    # === Апдейти ===
+
+    def route(self, update: Dict[str, Any]) -> bool:
+        """Ставить апдейт у чергу воркера за кільцем; False — жодного воркера в строю."""
+        node = self.ring.node_for(shard_key(update))
+        if node is None:
+            return False
+        self.workers[node].queue.put_nowait(update)
+        return True
+
+    def _reroute(self, updates: List[Dict[str, Any]]) -> None:
+        # Уже прийняті від Telegram апдейти не губимо: без воркерів — чекають повернення
+        for update in updates:
+            if not self.route(update):
+                self._held.append(update)
+
+    async def _forward(self, worker: Worker) -> None:
+        """Пачками пересилає чергу воркера (по одному запиту за раз — порядок зберігається)."""
+        while True:
+            batch = [await worker.queue.get()]
+            while len(batch) < FORWARD_BATCH and not worker.queue.empty():
+                batch.append(worker.queue.get_nowait())
+            try:
+                async with self._session.post(
+                    f"{worker.url}/updates", json=batch,
+                    headers={WORKER_SECRET_HEADER: self.worker_secret}, timeout=ClientTimeout(total=10),
+                ) as resp:
+                    if resp.status != 200:
+                        raise ClientError(f"HTTP {resp.status}")
+                worker.forwarded += len(batch)
+            except (ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Воркер %s не прийняв %s апдейтів: %s", worker.index, len(batch), e)
+                self._mark_down(worker, "помилка пересилання", unsent=batch)
+            finally:
+                for _ in batch:
+                    worker.queue.task_done()
+
+    async def _webhook(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(TELEGRAM_SECRET_HEADER, ""), self.secret):
+            raise web.HTTPUnauthorized()
+        try:
+            update = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest()
+        if not self.route(update):
+            # Жодного воркера в строю — Telegram повторить доставку пізніше
+            raise web.HTTPServiceUnavailable()
+        return web.Response()
+
+    async def _healthz(self, request: web.Request) -> web.Response:
+        workers = [
+            {
+                "index": worker.index,
+                "pid": worker.process.pid if worker.process else None,
+                "in_ring": worker.index in self.ring,
+                "share": round(self.ring.share(worker.index), 3),
+                "queued": worker.queue.qsize(),
+                "forwarded": worker.forwarded,
+                "restarts": worker.restarts,
+            }
+            for worker in self.workers
+        ]
+        status = 200 if len(self.ring) else 503
+        return web.json_response({"workers": workers, "held": len(self._held)}, status=status)
+
+    # === Життєвий цикл ===
+
+    async def _set_webhook(self, url: str) -> None:
+        base = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+        params = {"url": url}
+        if self.secret:
+            params["secret_token"] = self.secret
+        async with self._session.post(f"{base}{os.getenv('BOT_TOKEN', '')}/setWebhook", json=params) as resp:
+            body = await resp.json()
+        if not body.get("ok"):
+            raise RuntimeError(f"setWebhook не вдався: {body.get('description')}")
+        logger.info("Вебхук встановлено.")
+
+    async def run(self, host: str, port: int, webhook_url: Optional[str], stop: asyncio.Event) -> None:
+        self._session = ClientSession()
+        for worker in self.workers:
+            self._spawn(worker)
+        loop = asyncio.get_running_loop()
+        self._health = loop.create_task(self._health_loop())
+        self._forwarders = [loop.create_task(self._forward(worker)) for worker in self.workers]
+
+        runner = web.AppRunner(self.app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Диспетчер слухає http://%s:%s, воркерів: %s.", host, port, len(self.workers))
+        try:
+            if webhook_url:
+                # Вебхук — коли всі воркери в строю (або за 60 с — скільки є)
+                deadline = time.monotonic() + 60
+                while len(self.ring) < len(self.workers) and time.monotonic() < deadline and not stop.is_set():
+                    await asyncio.sleep(0.1)
+                await self._set_webhook(webhook_url)
+            await stop.wait()
+        finally:
+            await self._shutdown(runner)
+
+    async def _shutdown(self, runner: web.AppRunner) -> None:
+        # Спершу перевірки здоров'я: воркери, що зупиняються, не мають перезапускатися
+        self._health.cancel()
+        # Нові апдейти не приймаємо (Telegram повторить їх після рестарту)
+        await runner.cleanup()
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(asyncio.gather(*(worker.queue.join() for worker in self.workers)), 5)
+        for task in self._forwarders:
+            task.cancel()
+        await asyncio.gather(self._health, *self._forwarders, return_exceptions=True)
+        # Воркери самі "зливають" генерації (SHUTDOWN_DEADLINE) — даємо їм час
+        for worker in self.workers:
+            if worker.process and worker.process.poll() is None:
+                worker.process.terminate()
+        deadline = time.monotonic() + float(os.getenv("SHUTDOWN_DEADLINE", 20)) + 10
+        while any(w.process and w.process.poll() is None for w in self.workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for worker in self.workers:
+            if worker.process and worker.process.poll() is None:
+                logger.warning("Воркер %s не зупинився вчасно — kill.", worker.index)
+            if worker.process:
+                self._kill_group(worker)
+        await self._session.close()
+        logger.info("Диспетчер зупинено.")
+
+
+# === Бік воркера (bot.py з BOT_WORKER_PORT) ===
+
+async def run_worker(application, port: int, secret: str) -> None:
+    """
+    Життєвий цикл `Application` без Updater (як у run_polling: post_init,
+    start, ... stop, post_stop, shutdown, post_shutdown) + приймач апдейтів
+    від диспетчера на 127.0.0.1:<port>.
+    """
+    # PTB потрібен лише воркерам — сам диспетчер його не імпортує
+    from telegram import Update
+
+    async def receive(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(WORKER_SECRET_HEADER, ""), secret):
+            raise web.HTTPUnauthorized()
+        for data in await request.json():
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        return web.Response()
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"running": application.running, "queued": application.update_queue.qsize()},
+            status=200 if application.running else 503,
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post("/updates", receive)
+    app.router.add_get("/healthz", healthz)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    logger.info("Воркер (pid %s) приймає апдейти на 127.0.0.1:%s.", os.getpid(), port)
+    try:
+        await stop.wait()
+    finally:
+        # Спершу перестаємо приймати — диспетчер перенаправить нові апдейти
+        await runner.cleanup()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Вебхук-диспетчер Privacy Sentry на N воркерів.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("DISPATCHER_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.getenv("WEBHOOK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEBHOOK_PORT", 8443)))
+    parser.add_argument("--worker-base-port", type=int, default=int(os.getenv("DISPATCHER_WORKER_BASE_PORT", 8700)))
+    parser.add_argument("--webhook-url", default=os.getenv("WEBHOOK_URL"))
+    args = parser.parse_args()
+
+    configure_logging()
+    dispatcher = Dispatcher(args.workers, args.worker_base_port, os.getenv("WEBHOOK_SECRET", ""))
+
+    async def serve() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await dispatcher.run(args.host, args.port, args.webhook_url, stop)
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.15) Чисті "збирачі" документів: відповіді -> Markdown для `pdf_utils`.
+
+Раніше ця логіка жила всередині `policy_generate` / `dpia_generate` /
+`checklist_generate` у bot.py. Тепер її спільно використовують бот,
+пакетна генерація (`batch_cli.py`) та HTTP API (`http_api.py`), тож
+документ з Telegram, CLI чи API однаковий до байта.
+
+Вхід — словник у тих самих полях, що збирає бот:
+  - Політика: project_name, contact, data_collected, data_storage, delete_mechanism
+  - DPIA:     project_name, team, goal, minimization_data [{item, needed, reason}],
+              retention_period, retention_mechanism, storage, risk, mitigation
+  - Чек-ліст: project_name, cN_sM_status ("yes"/"no"), cN_sM_note
+
+(v3.21) `build_kit_records` — "Повний комплект": Політика та Чек-ліст
+виводяться з відповідей DPIA (+ контакт і статуси пунктів), тож спільні
+факти (назва, дані, сховище, видалення) користувач вводить один раз.
+
+(v3.31) Відповіді користувача потрапляють у шаблони лише через
+`sanitize` (ліміт довжини за питанням, без метасимволів Markdown).
+
+(v3.19) Зворотний напрям для Чек-ліста — `parse_checklist_markdown`:
+заповнена копія `artifacts/3_minimization_checklist.md` або таблиця з
+PDF -> ті самі поля cN_sM_*.
+"""
+
+import html
+import os
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import sanitize
+import templates
+
+DOCUMENT_TYPES = ("policy", "dpia", "checklist")
+_TRUE_VALUES = {"1", "true", "yes", "так", "+"}
+
+# (v3.8) Пункти Чек-ліста по категоріях: (ключ, назва в PDF)
+CHECKLIST_CATEGORIES = (
+    ("Категорія 1: Контроль Доступу", (
+        ("c1_s1", "1.1. 2FA (Двофакторна Автентифікація)"),
+        ("c1_s2", "1.2. Принцип 'Найменших привілеїв'"),
+        ("c1_s3", "1.3. БЕЗ ПУБЛІЧНИХ ПОСИЛАНЬ"),
+    )),
+    ("Категорія 2: Права Користувачів", (
+        ("c2_s1", "2.1. Публічна Політика"),
+        ("c2_s2", "2.2. Механізм Видалення (Ст. 8)"),
+        ("c2_s3", "2.3. Контакт для скарг"),
+    )),
+    ("Категорія 3: Технічна Гігієна", (
+        ("c3_s1", "3.1. Безпека Токенів"),
+        ("c3_s2", "3.2. Планування Строків (Retention)"),
+        ("c3_s3", "3.3. Шифрування (Якщо є паролі)"),
+    )),
+)
+
+
+def _today(today: Optional[date]) -> str:
+    return (today or date.today()).strftime("%d.%m.%Y")
+
+
+def build_policy_markdown(data: dict, today: Optional[date] = None) -> str:
+    """Markdown Політики Конфіденційності."""
+    data_dict = {
+        'project_name': sanitize.answer(data, 'project_name', '[Назва Вашого Проєкту]'),
+        'contact': sanitize.answer(data, 'contact', '[Ваш @username або email]'),
+        'data_collected': sanitize.answer(data, 'data_collected', '[Дані, які ви збираєте]'),
+        'data_storage': sanitize.answer(data, 'data_storage', '[Де ви зберігаєте дані]'),
+        'delete_mechanism': sanitize.answer(data, 'delete_mechanism', '[Опишіть простий механізм]'),
+        'date': _today(today),
+    }
+    return templates.POLICY_TEMPLATE.format(**data_dict)
+
+
+def build_dpia_markdown(data: dict, today: Optional[date] = None) -> str:
+    """Markdown DPIA Lite (таблиця "Питання | Відповідь")."""
+    def get_data(key, default='[Не вказано]'):
+        return sanitize.answer(data, key, default)
+
+    table_rows = []
+    table_rows.append(f"| Назва проєкту: | {get_data('project_name')} |")
+    table_rows.append(f"| Керівник/Розробник: | {get_data('team')} |")
+    table_rows.append(f"| Мета: | {get_data('goal')} |")
+
+    minimization_data = data.get('minimization_data', [])
+    if not minimization_data:
+        table_rows.append("| Дані: | [Не вказано] |")
+    else:
+        for i, item in enumerate(minimization_data):
+            data_name = f"Дані (пункт {i+1}):"
+            item_name = sanitize.clean_text(item['item'], 'item')
+            item_reason = sanitize.clean_text(item['reason'], 'reason')
+
+            if item['needed']:
+                data_value = f"{item_name} (✅ **Навіщо:** {item_reason})"
+            else:
+                data_value = f"~~{item_name}~~ (❌ **Відмовлено**)"
+
+            table_rows.append(f"| {data_name} | {data_value} |")
+
+    table_rows.append(f"| Строк Зберігання: | {get_data('retention_period')} |")
+    table_rows.append(f"| Механізм Видалення: | {get_data('retention_mechanism')} |")
+    table_rows.append(f"| Місце Зберігання: | {get_data('storage')} |")
+    table_rows.append(f"| Головний Ризик: | {get_data('risk')} |")
+    table_rows.append(f"| Мінімізація Ризику: | {get_data('mitigation')} |")
+
+    table_header = "| Питання | Відповідь |\n| :--- | :--- |\n"
+    data_dict = {
+        'project_name': get_data('project_name'),
+        'date': _today(today),
+        'dpia_table': table_header + "\n".join(table_rows),
+    }
+    return templates.DPIA_TEMPLATE.format(**data_dict)
+
+
+def build_checklist_markdown(data: dict, today: Optional[date] = None) -> str:
+    """Markdown Чек-ліста (3 категорії x 3 пункти)."""
+    def get_status_md_text(status_key: str) -> str:
+        status = data.get(status_key)
+        if status == "yes":
+            return "Виконано"
+        elif status == "no":
+            return "Не виконано"
+        else:
+            return "Не заповнено"
+
+    def get_note_md_text_pdf(note_key: str) -> str:
+        note = data.get(note_key, "*Не заповнено*")
+        if note in ("*Не заповнено*", "*Пропущено*"):
+            return note
+        # (v3.31) Переноси рядків -> <br> (v3.6) і без розмітки всередині клітинки
+        return sanitize.clean_text(note, note_key)
+
+    table_header = "| Пункт | Статус | Ваші Нотатки (для себе) |\n| :--- | :--- | :--- |\n"
+
+    tables = []
+    for title, items in CHECKLIST_CATEGORIES:
+        rows = [
+            f"| {label} | {get_status_md_text(f'{key}_status')} | {get_note_md_text_pdf(f'{key}_note')} |"
+            for key, label in items
+        ]
+        tables.append(f"### {title}\n\n" + table_header + "\n".join(rows))
+
+    data_dict = {
+        'project_name': sanitize.answer(data, 'project_name', '[Назва Проєкту]'),
+        'date': _today(today),
+        'checklist_content': "\n\n".join(tables),
+    }
+    return templates.CHECKLIST_TEMPLATE_PDF.format(**data_dict)
+
+
+# === (v3.21) Повний комплект ===
+
+def build_kit_records(dpia: dict, contact: str, checklist_status: Dict[str, str]) -> Dict[str, dict]:
+    """
+    Три набори відповідей (policy, dpia, checklist) з однієї сесії "Повного комплекту".
+    `checklist_status`: ключ пункту (c1_s1, ...) -> "yes" / "no".
+    """
+    project_name = dpia.get('project_name', '[Назва Проєкту]')
+    kept = [item['item'] for item in dpia.get('minimization_data', []) if item['needed']]
+    retention = dpia.get('retention_mechanism', '[Не вказано]')
+    if dpia.get('retention_period'):
+        retention = f"{retention} (строк: {dpia['retention_period']})"
+
+    policy = {
+        'project_name': project_name,
+        'contact': contact,
+        'data_collected': ", ".join(kept) or '[Не вказано]',
+        'data_storage': dpia.get('storage', '[Не вказано]'),
+        'delete_mechanism': dpia.get('retention_mechanism', '[Не вказано]'),
+    }
+
+    checklist = {'project_name': project_name}
+    for key in CHECKLIST_KEYS:
+        if key in checklist_status:
+            checklist[f"{key}_status"] = checklist_status[key]
+    # Нотатки, які вже відомі з відповідей DPIA
+    checklist['c1_s3_note'] = f"Сховище: {policy['data_storage']}"
+    checklist['c2_s2_note'] = retention
+    checklist['c2_s3_note'] = f"Контакт: {contact}"
+    checklist['c3_s2_note'] = retention
+    if dpia.get('mitigation'):
+        checklist['c3_s1_note'] = f"Захист: {dpia['mitigation']}"
+
+    return {'policy': policy, 'dpia': dpia, 'checklist': checklist}
+
+
+# === (v3.19) Імпорт заповненого Чек-ліста ===
+
+CHECKLIST_ARTIFACT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artifacts", "3_minimization_checklist.md"
+)
+CHECKLIST_KEYS = [key for _, items in CHECKLIST_CATEGORIES for key, _ in items]
+
+# "- [x] **2FA (...):** нотатка" (рядок артефакту; вкладені пункти з відступом ігноруються)
+_CHECKBOX_RE = re.compile(r"^[-*+]\s+\[([ xXхХ✓✔])\]\s*(?:\*\*(.+?)\*\*)?\s*(.*)$")
+# "| 1.1. 2FA (...) | Виконано | нотатка |" (таблиця з PDF; також через таби/пробіли).
+# Клітинки ділимо str.split, а не одним регулярним виразом: "(.*?)" перед
+# роздільником "\s*[|\t]\s*|\s+" давав катастрофічний бектрекінг на довгих
+# рядках пробілів (20 тис. пробілів — ~13 с на event loop).
+_TABLE_ROW_START_RE = re.compile(r"^\|?\s*([1-3])\.([1-3])\.")
+# Рядок без | і табів (скопійований з PDF): статус між пробілами
+_TABLE_STATUS_RE = re.compile(r"(?:^|\s)(не виконано|виконано|не заповнено)(?=\s|$)", re.IGNORECASE)
+_TABLE_STATUS = {"виконано": "yes", "не виконано": "no"}
+_TABLE_STATUSES = set(_TABLE_STATUS) | {"не заповнено"}
+_PROJECT_RES = (
+    re.compile(r"^#\s+(.+?)\s+[–-]\s+Технічний Чек-ліст", re.IGNORECASE),
+    re.compile(r"^\**(?:Проєкт|Назва проєкту)\s*:?\**\s*:?\s*(.+)$", re.IGNORECASE),
+    re.compile(r"^#\s+.*?Чек-ліст для\s+(.+)$", re.IGNORECASE),
+)
+_EMPTY_NOTES = {"", "*не заповнено*", "не заповнено"}
+
+_artifact_descriptions: Optional[List[str]] = None
+
+
+def _split_table_row(line: str) -> Optional[Tuple[str, str, str]]:
+    """"| 1.1. ... | Виконано | нотатка |" -> ("c1_s1", "Виконано", "нотатка"); None — не рядок таблиці."""
+    start = _TABLE_ROW_START_RE.match(line)
+    if not start:
+        return None
+    key = f"c{start.group(1)}_s{start.group(2)}"
+    rest = line[start.end():]
+    if "|" in rest or "\t" in rest:
+        cells = [cell.strip() for cell in rest.replace("\t", "|").split("|")]
+        # Перша клітинка — опис пункту; статус — перша клітинка-статус після неї
+        for i in range(1, len(cells)):
+            if cells[i].lower() in _TABLE_STATUSES:
+                return key, cells[i], "|".join(cells[i + 1:]).strip(" |")
+    status = _TABLE_STATUS_RE.search(rest)
+    if not status:
+        return None
+    return key, status.group(1), rest[status.end():].strip(" \t|")
+
+
+def _checklist_artifact_descriptions() -> List[str]:
+    """Описи пунктів із порожнього артефакту: якщо "нотатка" збігається з описом — її не заповнили."""
+    global _artifact_descriptions
+    if _artifact_descriptions is None:
+        try:
+            with open(CHECKLIST_ARTIFACT_PATH, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            _artifact_descriptions = [m.group(3).strip() for m in map(_CHECKBOX_RE.match, lines) if m]
+        except OSError:
+            _artifact_descriptions = []
+    return _artifact_descriptions
+
+
+def parse_checklist_markdown(
+    text: str,
+    max_chars: int = 20000,
+    max_note_chars: int = sanitize.NOTE_LIMIT,
+    max_line_chars: int = 4 * sanitize.NOTE_LIMIT,
+) -> Dict[str, str]:
+    """
+    Розбирає заповнений Чек-ліст у полях сесії `cl`. Розуміє:
+      - Markdown артефакту: "- [x]" = виконано, "- [ ]" = не виконано, текст після
+        "**Назва:**" — нотатка (9 пунктів по порядку);
+      - таблицю з PDF бота: "| 1.1. ... | Виконано | нотатка |".
+    Піднімає ValueError, якщо жодного пункту не знайдено або рядок довший за
+    `max_line_chars` (нотатка з екрануванням і <br> плюс опис пункту).
+    """
+    if len(text) > max_chars:
+        raise ValueError(f"текст довший за {max_chars} символів")
+
+    data: Dict[str, str] = {}
+    descriptions = _checklist_artifact_descriptions()
+    checkbox_index = 0
+    for number, raw_line in enumerate(text.splitlines(), 1):
+        if len(raw_line) > max_line_chars:
+            raise ValueError(f"рядок {number} довший за {max_line_chars} символів")
+        line = raw_line.strip()
+        if "project_name" not in data:
+            # Пробіли стиснуто: "\s+" поруч із "(.+?)" не бектрекує на довгих проміжках
+            compact = " ".join(line.split())
+            for regex in _PROJECT_RES:
+                match = regex.match(compact)
+                if match:
+                    data["project_name"] = match.group(1).strip(" *")
+                    break
+
+        note = None
+        checkbox = _CHECKBOX_RE.match(raw_line.rstrip())
+        if checkbox:
+            if checkbox_index >= len(CHECKLIST_KEYS):
+                continue
+            key = CHECKLIST_KEYS[checkbox_index]
+            description_index = checkbox_index
+            checkbox_index += 1
+            data[f"{key}_status"] = "no" if checkbox.group(1) == " " else "yes"
+            note = checkbox.group(3).strip()
+            if description_index < len(descriptions) and note == descriptions[description_index]:
+                note = ""
+        else:
+            row = _split_table_row(line)
+            if not row:
+                continue
+            key, status_text, note = row
+            status = _TABLE_STATUS.get(status_text.lower())
+            if status:
+                data[f"{key}_status"] = status
+            # Нотатка в PDF екранована і з <br> замість переносів
+            note = html.unescape(note.replace("<br>", "\n")).strip()
+
+        if note.lower() in _EMPTY_NOTES:
+            continue
+        if len(note) > max_note_chars:
+            raise ValueError(f"нотатка до пункту {key[1]}.{key[4]} довша за {max_note_chars} символів")
+        data[f"{key}_note"] = note
+
+    if not any(key.endswith("_status") for key in data):
+        raise ValueError("не знайдено жодного пункту Чек-ліста (- [x] ... або | 1.1. ... |)")
+    return data
+
+
+def normalize_record(
+    raw: Any,
+    default_type: Optional[str] = None,
+    max_field_chars: Optional[int] = None,
+    max_items: Optional[int] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    (v3.15) Перевіряє запис (batch_cli, http_api) і приводить значення до
+    вигляду, який очікують збирачі. Піднімає ValueError з поясненням.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("запис має бути об'єктом (словником)")
+    data = {key: value for key, value in raw.items() if key != "type"}
+    doc_type = raw.get("type") or default_type
+    if doc_type not in DOCUMENT_TYPES:
+        raise ValueError(f"невідомий type '{doc_type}' (очікується {', '.join(DOCUMENT_TYPES)})")
+
+    for key, value in list(data.items()):
+        if key != "minimization_data" and not isinstance(value, str):
+            data[key] = value = str(value)
+        if max_field_chars and key != "minimization_data" and len(value) > max_field_chars:
+            raise ValueError(f"поле '{key}' довше за {max_field_chars} символів")
+
+    if doc_type == "dpia":
+        raw_items = data.get("minimization_data") or []
+        if not isinstance(raw_items, list):
+            raise ValueError("minimization_data має бути списком")
+        if max_items and len(raw_items) > max_items:
+            raise ValueError(f"minimization_data: більше {max_items} пунктів")
+        items = []
+        for item in raw_items:
+            if isinstance(item, str):
+                item = {"item": item, "needed": True}
+            if not isinstance(item, dict):
+                raise ValueError("пункт minimization_data має бути рядком або об'єктом")
+            needed = item.get("needed", True)
+            if isinstance(needed, str):
+                needed = needed.strip().lower() in _TRUE_VALUES
+            entry = {
+                "item": str(item.get("item", "")),
+                "needed": bool(needed),
+                "reason": str(item.get("reason", "")) if needed else "Відмовлено",
+            }
+            if max_field_chars and max(len(entry["item"]), len(entry["reason"])) > max_field_chars:
+                raise ValueError(f"пункт minimization_data довший за {max_field_chars} символів")
+            items.append(entry)
+        data["minimization_data"] = items
+    return doc_type, data
+
+
+BUILDERS = {
+    "policy": build_policy_markdown,
+    "dpia": build_dpia_markdown,
+    "checklist": build_checklist_markdown,
+}
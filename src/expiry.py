@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.24) Легкий сервіс відкладеного видалення тимчасових повідомлень.
+
+Раніше кожен "блокувальник" означав окрему задачу APScheduler
+(`job_queue.run_once`) з власними блокуваннями та пробудженнями. Тепер усі
+тимчасові повідомлення ("⚠️ Ви вже заповнюєте...", "Генерую ваш PDF...")
+ставляться в ОДНУ купу (heap) через `schedule_delete(chat_id, message_id, delay)`,
+а розбирає її одна фонова asyncio-задача:
+
+  - повторний `schedule_delete` для того ж повідомлення просто переносить
+    термін (старий запис у купі стає "мертвим" і пропускається);
+  - `cancel()` скасовує видалення (напр., повідомлення вже видалено вручну);
+  - (v3.23) `tag` позначає роль повідомлення в чаті (напр., "blocker"):
+    `tagged(chat_id, tag)` знаходить його, поки видалення ще чекає; після
+    видалення чи `cancel()` позначка зникає разом із записом;
+  - усе, що настало протягом EXPIRY_BATCH_SLACK секунд (0.2), видаляється
+    пакетом — один `deleteMessages` на чат (до 100 повідомлень);
+  - під час зупинки (`stop(flush=True)`) незавершені видалення виконуються
+    одразу, щоб тимчасові повідомлення не лишалися в чатах.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from telegram.error import TelegramError
+
+logger = logging.getLogger("expiry")
+logger.setLevel(logging.INFO)
+
+# Обмеження Bot API для deleteMessages
+MAX_BATCH = 100
+
+
+class ExpiryService:
+    """Купа термінів (due, seq, chat_id, message_id) + одна задача-"підмітальник"."""
+
+    def __init__(self, slack: Optional[float] = None):
+        self.slack = float(os.getenv("EXPIRY_BATCH_SLACK", 0.2)) if slack is None else slack
+        self._heap: List[Tuple[float, int, int, int]] = []
+        # Актуальний термін для кожного повідомлення; записи купи з іншим терміном — мертві
+        self._due: Dict[Tuple[int, int], float] = {}
+        # (v3.23) (chat_id, tag) -> message_id та навпаки — лише для повідомлень, що чекають
+        self._tagged: Dict[Tuple[int, Hashable], int] = {}
+        self._tags: Dict[Tuple[int, int], Hashable] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._bot = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule_delete(self, chat_id: int, message_id: int, delay: float = 0.0, tag: Optional[Hashable] = None) -> None:
+        """Видалити повідомлення через `delay` секунд (повторний виклик переносить термін)."""
+        due = time.monotonic() + delay
+        self._due[(chat_id, message_id)] = due
+        if tag is not None:
+            self._tagged[(chat_id, tag)] = message_id
+            self._tags[(chat_id, message_id)] = tag
+        heapq.heappush(self._heap, (due, next(self._seq), chat_id, message_id))
+        if self._heap[0][0] == due:
+            # Новий найближчий термін — будимо "підмітальника"
+            self._wakeup.set()
+
+    def _forget(self, key: Tuple[int, int]) -> Optional[float]:
+        tag = self._tags.pop(key, None)
+        if tag is not None and self._tagged.get((key[0], tag)) == key[1]:
+            del self._tagged[(key[0], tag)]
+        return self._due.pop(key, None)
+
+    def cancel(self, chat_id: int, message_id: int) -> bool:
+        return self._forget((chat_id, message_id)) is not None
+
+    def pending(self, chat_id: int, message_id: int) -> bool:
+        return (chat_id, message_id) in self._due
+
+    def tagged(self, chat_id: int, tag: Hashable) -> Optional[int]:
+        """(v3.23) message_id повідомлення з позначкою `tag`, що ще чекає на видалення."""
+        return self._tagged.get((chat_id, tag))
+
+    def _pop_due(self, horizon: float) -> Dict[int, List[int]]:
+        batches: Dict[int, List[int]] = defaultdict(list)
+        while self._heap and self._heap[0][0] <= horizon:
+            due, _, chat_id, message_id = heapq.heappop(self._heap)
+            key = (chat_id, message_id)
+            if self._due.get(key) != due:
+                continue  # Скасовано або перенесено
+            self._forget(key)
+            batches[chat_id].append(message_id)
+        return batches
+
+    async def _delete(self, chat_id: int, message_ids: List[int]) -> None:
+        for start in range(0, len(message_ids), MAX_BATCH):
+            chunk = message_ids[start:start + MAX_BATCH]
+            try:
+                if len(chunk) == 1:
+                    await self._bot.delete_message(chat_id=chat_id, message_id=chunk[0])
+                else:
+                    await self._bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+            except TelegramError as e:
+                logger.warning("Не вдалося видалити тимчасові повідомлення (%s шт.): %s", len(chunk), e)
+
+    async def _flush(self, horizon: float) -> None:
+        batches = self._pop_due(horizon)
+        if batches:
+            await asyncio.gather(*(self._delete(chat_id, ids) for chat_id, ids in batches.items()))
+
+    async def _run(self) -> None:
+        while True:
+            await self._flush(time.monotonic() + self.slack)
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            if timeout is None or timeout > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    def start(self, bot) -> None:
+        """Запускає "підмітальника" в поточному event loop."""
+        self._bot = bot
+        # Подія могла бути створена поза циклом — пересоздаємо, зберігши "дзвінок"
+        pending = self._wakeup.is_set() or bool(self._heap)
+        self._wakeup = asyncio.Event()
+        if pending:
+            self._wakeup.set()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, flush: bool = True) -> None:
+        """Зупиняє задачу; з `flush=True` одразу видаляє все, що ще чекає."""
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if flush and self._bot and self._due:
+            logger.info("Видаляю %s тимчасових повідомлень перед зупинкою.", len(self._due))
+            await self._flush(float("inf"))
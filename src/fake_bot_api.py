@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.10) Локальний "фейковий" Telegram Bot API сервер для навантажувального тестування.
+
+Реалізує лише ті методи, які використовує наш бот:
+  getMe, getUpdates / setWebhook / deleteWebhook (доставка апдейтів;
+  v3.28 — вебхук з secret_token і повторною доставкою, як у Telegram),
+  sendMessage, editMessageText, deleteMessage, sendDocument, answerCallbackQuery,
+  (v3.24) deleteMessages (пакетне видалення; відсутні повідомлення пропускаються),
+  (v3.21) sendMediaGroup (кожен документ групи — окрема подія sendDocument),
+  (v3.18) getFile + завантаження файлу (/file/bot<token>/<path>) для документів,
+  які "надсилає" користувач (`add_file`).
+Невідомі методи відповідають `{"ok": true, "result": true}`.
+
+Можливості:
+  - Налаштовувана затримка (latency + jitter) для кожного виклику.
+  - Ін'єкція помилок: 429 (Too Many Requests) та
+    "message to edit not found" для editMessageText.
+  - (v3.32) Розмітка перевіряється, як у Telegram: legacy `parse_mode=Markdown`
+    з незакритою сутністю або `entities` за межами тексту -> 400
+    "can't parse entities" (лічильник `<метод>:parse_error`).
+  - (v3.33) Текст довший за 4096 одиниць UTF-16 (після розбору розмітки) ->
+    400 "message is too long" (лічильник `<метод>:too_long`).
+  - Події (що бот надіслав/відредагував) публікуються в черги по chat_id,
+    щоб сценарний драйвер (`loadtest.py`) міг чекати на відповідь бота.
+
+Запуск окремо:
+    python fake_bot_api.py --port 8081 --latency-ms 30 --rate-429 0.01
+Бот підключається через TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, web
+
+logger = logging.getLogger("fake_bot_api")
+logger.setLevel(logging.INFO)
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "Privacy Sentry (fake)", "username": "fake_privacy_bot"}
+
+# Методи, на яких НЕ інжектимо помилки (інакше бот просто не стартує)
+_NO_FAULT_METHODS = {"getme", "getupdates", "deletewebhook", "setwebhook", "getwebhookinfo", "close", "logout"}
+
+# (v3.28) Повторна доставка апдейту на вебхук: спроб і пауза між ними, с
+WEBHOOK_ATTEMPTS = 20
+WEBHOOK_RETRY_DELAY = 0.5
+
+# (v3.33) Ліміт тексту повідомлення, одиниць UTF-16
+MAX_MESSAGE_LENGTH = 4096
+# (v3.32) Типи сутностей, які приймає Bot API
+ENTITY_TYPES = {
+    "mention", "hashtag", "cashtag", "bot_command", "url", "email", "phone_number", "bold", "italic",
+    "underline", "strikethrough", "spoiler", "blockquote", "expandable_blockquote", "code", "pre",
+    "text_link", "text_mention", "custom_emoji",
+}
+_LEGACY_ENTITY_END = {b"*": b"*", b"_": b"_", b"`": b"`", b"[": b"]"}
+
+
+def parse_legacy_markdown(text: str) -> Tuple[str, Optional[str]]:
+    """
+    (v3.32) Розбір legacy `parse_mode=Markdown`: (текст без розмітки, помилка або None).
+    Повторює парсер Telegram: сутність триває до такого ж символу ("]" для "["),
+    вкладення немає, "\\" екранує лише _ * ` [, зсув у помилці — в байтах UTF-8.
+    """
+    data = text.encode("utf-8")
+    result = bytearray()
+    i, size = 0, len(data)
+    while i < size:
+        char = data[i:i + 1]
+        if char == b"\\" and data[i + 1:i + 2] in _LEGACY_ENTITY_END:
+            result += data[i + 1:i + 2]
+            i += 2
+            continue
+        if char not in _LEGACY_ENTITY_END:
+            result += char
+            i += 1
+            continue
+        begin, end = i, _LEGACY_ENTITY_END[char]
+        i += 1
+        is_pre = char == b"`" and data[i:i + 2] == b"``"
+        if is_pre:
+            i += 2
+            # ```python — мова блоку коду (не текст); один перенос рядка після неї пропускається
+            language_end = i
+            while language_end < size and data[language_end:language_end + 1] not in (b" ", b"\n", b"\t", b"`"):
+                language_end += 1
+            if language_end != i and language_end < size and data[language_end:language_end + 1] != b"`":
+                i = language_end
+            if data[i:i + 1] in (b"\n", b"\r"):
+                i += 1
+        while i < size and (data[i:i + 1] != end or (is_pre and data[i + 1:i + 3] != b"``")):
+            result += data[i:i + 1]
+            i += 1
+        if i >= size:
+            error = f"Bad Request: can't parse entities: Can't find end of the entity starting at byte offset {begin}"
+            return text, error
+        if char == b"[" and data[i + 1:i + 2] == b"(":
+            i += 2
+            while i < size and data[i:i + 1] != b")":
+                i += 1
+        i += 3 if is_pre else 1
+    return result.decode("utf-8", "replace"), None
+
+
+def legacy_markdown_error(text: str) -> Optional[str]:
+    """(v3.32) Помилка, з якою Telegram відхилить текст з `parse_mode=Markdown` (None — прийме)."""
+    return parse_legacy_markdown(text)[1]
+
+
+def entities_error(text: str, entities: List[Dict[str, Any]]) -> Optional[str]:
+    """(v3.32) Перевірка `entities`: відомий тип, зсув і довжина в межах тексту (UTF-16)."""
+    total = len(text.encode("utf-16-le")) // 2
+    for entity in entities:
+        offset, length = entity.get("offset"), entity.get("length")
+        if entity.get("type") not in ENTITY_TYPES:
+            return f"Bad Request: can't parse entities: unsupported entity type {entity.get('type')!r}"
+        if not isinstance(offset, int) or not isinstance(length, int) or offset < 0 or length <= 0:
+            return "Bad Request: can't parse entities: wrong entity offset or length"
+        if offset + length > total:
+            return f"Bad Request: can't parse entities: entity ends at {offset + length}, text length is {total}"
+        if entity["type"] == "text_link" and not entity.get("url"):
+            return "Bad Request: can't parse entities: text_link without url"
+    return None
+
+
+@dataclass
+class FakeApiConfig:
+    """Параметри поведінки фейкового сервера."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_429: float = 0.0
+    rate_edit_not_found: float = 0.0
+    retry_after: int = 1
+    seed: Optional[int] = None
+
+
+@dataclass
+class BotEvent:
+    """Одна дія бота, видима "користувачу" (повідомлення, редагування, документ...)."""
+    method: str
+    chat_id: int
+    message_id: Optional[int]
+    text: Optional[str]
+    reply_markup: Optional[Dict[str, Any]]
+    ts: float = field(default_factory=time.perf_counter)
+
+
+class FakeBotAPI:
+    """Стан фейкового Bot API + aiohttp-застосунок."""
+
+    def __init__(self, config: Optional[FakeApiConfig] = None):
+        self.config = config or FakeApiConfig()
+        self._rng = random.Random(self.config.seed)
+
+        self._next_update_id = 1
+        self._updates: List[Dict[str, Any]] = []
+        self._updates_cond = asyncio.Condition()
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._webhook_session: Optional[ClientSession] = None
+
+        self._next_message_id: Dict[int, int] = defaultdict(lambda: 1)
+        self.messages: Dict[tuple, Dict[str, Any]] = {}
+        # (v3.18) Файли, "надіслані" користувачами: file_id -> вміст
+        self.files: Dict[str, bytes] = {}
+        self._listeners: Dict[int, asyncio.Queue] = {}
+
+        # Статистика по методах: кількість, помилки, сумарна затримка обробки
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.faults: Dict[str, int] = defaultdict(int)
+        self.first_get_updates_at: Optional[float] = None
+
+        self.app = web.Application(client_max_size=50 * 1024 * 1024)
+        self.app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self.app.router.add_get("/file/bot{token}/{file_path:.+}", self._download)
+        self.app.on_cleanup.append(self._on_cleanup)
+
+    # === API для драйвера ===
+
+    def listen(self, chat_id: int) -> asyncio.Queue:
+        """Повертає чергу подій (BotEvent) для чату."""
+        if chat_id not in self._listeners:
+            self._listeners[chat_id] = asyncio.Queue()
+        return self._listeners[chat_id]
+
+    def forget_chat(self, chat_id: int) -> None:
+        """Звільняє пам'ять після завершення віртуального користувача."""
+        self._listeners.pop(chat_id, None)
+        self._next_message_id.pop(chat_id, None)
+        for key in [k for k in self.messages if k[0] == chat_id]:
+            del self.messages[key]
+        for file_id in [f for f in self.files if f.startswith(f"upload-{chat_id}-")]:
+            del self.files[file_id]
+
+    def add_file(self, chat_id: int, content: bytes, file_name: str) -> Dict[str, Any]:
+        """(v3.18) Реєструє файл користувача; повертає об'єкт Document для апдейту."""
+        file_id = f"upload-{chat_id}-{len(self.files)}"
+        self.files[file_id] = content
+        return {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_name": file_name,
+            "file_size": len(content),
+        }
+
+    def new_message_id(self, chat_id: int) -> int:
+        message_id = self._next_message_id[chat_id]
+        self._next_message_id[chat_id] += 1
+        return message_id
+
+    async def push_update(self, update: Dict[str, Any]) -> None:
+        """Ставить апдейт у чергу getUpdates або доставляє його на вебхук."""
+        update["update_id"] = self._next_update_id
+        self._next_update_id += 1
+
+        if self.webhook_url:
+            if self._webhook_session is None:
+                self._webhook_session = ClientSession()
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+            # (v3.28) Як Telegram: не-2xx відповідь вебхука -> повторна доставка
+            for attempt in range(WEBHOOK_ATTEMPTS):
+                try:
+                    async with self._webhook_session.post(self.webhook_url, json=update, headers=headers) as resp:
+                        await resp.read()
+                        if resp.status < 300:
+                            return
+                        reason = f"HTTP {resp.status}"
+                except Exception as e:
+                    reason = str(e)
+                self.faults["webhook:retry"] += 1
+                await asyncio.sleep(WEBHOOK_RETRY_DELAY)
+            logger.warning("Не вдалося доставити апдейт на вебхук: %s", reason)
+            return
+
+        async with self._updates_cond:
+            self._updates.append(update)
+            self._updates_cond.notify_all()
+
+    # === Обробка HTTP ===
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._webhook_session:
+            await self._webhook_session.close()
+
+    async def _read_params(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        params: Dict[str, Any] = {}
+        form = await request.post()
+        for key, value in form.items():
+            if isinstance(value, web.FileField):
+                params[key] = {"filename": value.filename, "size": len(value.file.read())}
+            else:
+                params[key] = value
+        return params
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str, parameters: Optional[Dict[str, Any]] = None) -> web.Response:
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        key = method.lower()
+        self.calls[method] += 1
+        params = await self._read_params(request)
+
+        if key not in _NO_FAULT_METHODS:
+            if self.config.latency_ms or self.config.jitter_ms:
+                delay = self.config.latency_ms + self._rng.uniform(-1, 1) * self.config.jitter_ms
+                await asyncio.sleep(max(delay, 0) / 1000)
+            if self._rng.random() < self.config.rate_429:
+                self.faults[f"{method}:429"] += 1
+                return self._error(
+                    429,
+                    f"Too Many Requests: retry after {self.config.retry_after}",
+                    {"retry_after": self.config.retry_after},
+                )
+
+        handler = getattr(self, f"_m_{key}", None)
+        if handler is None:
+            return self._ok(True)
+        return await handler(params)
+
+    # --- Службові методи ---
+
+    async def _m_getme(self, params):
+        return self._ok(BOT_USER)
+
+    async def _m_deletewebhook(self, params):
+        self.webhook_url = None
+        return self._ok(True)
+
+    async def _m_setwebhook(self, params):
+        self.webhook_url = params.get("url") or None
+        self.webhook_secret = params.get("secret_token") or None
+        return self._ok(True)
+
+    async def _m_getupdates(self, params):
+        if self.first_get_updates_at is None:
+            self.first_get_updates_at = time.perf_counter()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        async with self._updates_cond:
+            # Підтверджені апдейти (update_id < offset) більше не потрібні
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(self._updates_cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._updates[:limit]
+        return self._ok(batch)
+
+    # --- Методи, що "бачить" користувач ---
+
+    def _emit(self, method: str, chat_id: int, message_id: Optional[int], text=None, reply_markup=None) -> None:
+        queue = self._listeners.get(chat_id)
+        if queue is not None:
+            queue.put_nowait(BotEvent(method, chat_id, message_id, text, reply_markup))
+
+    @staticmethod
+    def _markup(params) -> Optional[Dict[str, Any]]:
+        raw = params.get("reply_markup")
+        if not raw:
+            return None
+        return json.loads(raw) if isinstance(raw, str) else raw
+
+    def _message(self, chat_id: int, message_id: int, **extra) -> Dict[str, Any]:
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        message.update({k: v for k, v in extra.items() if v is not None})
+        return message
+
+    def _parse_error(self, method: str, params) -> Optional[web.Response]:
+        """
+        (v3.32) 400 "can't parse entities", якщо Telegram не прийняв би розмітку;
+        (v3.33) 400 "message is too long" для тексту понад MAX_MESSAGE_LENGTH.
+        """
+        text = params.get("text", "")
+        entities = params.get("entities")
+        error = None
+        if entities:
+            error = entities_error(text, json.loads(entities) if isinstance(entities, str) else entities)
+        elif params.get("parse_mode") == "Markdown":
+            text, error = parse_legacy_markdown(text)
+        if error is not None:
+            self.faults[f"{method}:parse_error"] += 1
+            return self._error(400, error)
+        if len(text.encode("utf-16-le")) // 2 > MAX_MESSAGE_LENGTH:
+            self.faults[f"{method}:too_long"] += 1
+            return self._error(400, "Bad Request: message is too long")
+        return None
+
+    async def _m_sendmessage(self, params):
+        rejected = self._parse_error("sendMessage", params)
+        if rejected:
+            return rejected
+        chat_id = int(params["chat_id"])
+        message_id = self.new_message_id(chat_id)
+        markup = self._markup(params)
+        message = self._message(chat_id, message_id, text=params.get("text", ""), reply_markup=markup)
+        self.messages[(chat_id, message_id)] = message
+        self._emit("sendMessage", chat_id, message_id, message["text"], markup)
+        return self._ok(message)
+
+    async def _m_editmessagetext(self, params):
+        rejected = self._parse_error("editMessageText", params)
+        if rejected:
+            return rejected
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"])
+        message = self.messages.get((chat_id, message_id))
+        if message is None or self._rng.random() < self.config.rate_edit_not_found:
+            self.faults["editMessageText:not_found"] += 1
+            return self._error(400, "Bad Request: message to edit not found")
+        markup = self._markup(params)
+        message["text"] = params.get("text", "")
+        if markup:
+            message["reply_markup"] = markup
+        else:
+            message.pop("reply_markup", None)
+        self._emit("editMessageText", chat_id, message_id, message["text"], markup)
+        return self._ok(message)
+
+    async def _m_deletemessage(self, params):
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"])
+        if self.messages.pop((chat_id, message_id), None) is None:
+            return self._error(400, "Bad Request: message to delete not found")
+        self._emit("deleteMessage", chat_id, message_id)
+        return self._ok(True)
+
+    async def _m_deletemessages(self, params):
+        chat_id = int(params["chat_id"])
+        message_ids = params.get("message_ids") or "[]"
+        message_ids = json.loads(message_ids) if isinstance(message_ids, str) else message_ids
+        for message_id in message_ids:
+            if self.messages.pop((chat_id, int(message_id)), None) is not None:
+                self._emit("deleteMessage", chat_id, int(message_id))
+        return self._ok(True)
+
+    async def _m_senddocument(self, params):
+        chat_id = int(params["chat_id"])
+        message_id = self.new_message_id(chat_id)
+        document = params.get("document") or {}
+        message = self._message(
+            chat_id, message_id,
+            document={
+                "file_id": f"fake-{chat_id}-{message_id}",
+                "file_unique_id": f"u{chat_id}{message_id}",
+                "file_name": document.get("filename") if isinstance(document, dict) else None,
+                "file_size": document.get("size") if isinstance(document, dict) else None,
+            },
+        )
+        self._emit("sendDocument", chat_id, message_id)
+        return self._ok(message)
+
+    async def _m_sendmediagroup(self, params):
+        chat_id = int(params["chat_id"])
+        media = params.get("media") or "[]"
+        media = json.loads(media) if isinstance(media, str) else media
+        messages = []
+        for item in media:
+            attached = params.get(str(item.get("media", "")).replace("attach://", ""))
+            message_id = self.new_message_id(chat_id)
+            messages.append(self._message(
+                chat_id, message_id,
+                document={
+                    "file_id": f"fake-{chat_id}-{message_id}",
+                    "file_unique_id": f"u{chat_id}{message_id}",
+                    "file_name": attached.get("filename") if isinstance(attached, dict) else None,
+                    "file_size": attached.get("size") if isinstance(attached, dict) else None,
+                },
+            ))
+            self._emit("sendDocument", chat_id, message_id)
+        return self._ok(messages)
+
+    async def _m_answercallbackquery(self, params):
+        return self._ok(True)
+
+    async def _m_getfile(self, params):
+        file_id = params.get("file_id")
+        if file_id not in self.files:
+            return self._error(400, "Bad Request: invalid file_id")
+        return self._ok({
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": len(self.files[file_id]),
+            "file_path": f"documents/{file_id}",
+        })
+
+    async def _download(self, request: web.Request) -> web.Response:
+        self.calls["downloadFile"] += 1
+        file_id = request.match_info["file_path"].rsplit("/", 1)[-1]
+        if file_id not in self.files:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.files[file_id])
+
+
+async def serve(api: FakeBotAPI, host: str, port: int) -> web.AppRunner:
+    """Запускає aiohttp-сервер у поточному event loop і повертає runner (для cleanup)."""
+    runner = web.AppRunner(api.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Фейковий Bot API слухає http://%s:%s/bot<token>/", host, port)
+    return runner
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Спільні аргументи (використовуються також у loadtest.py)."""
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Середня затримка кожного виклику API")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Розкид затримки (+/-)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Частка викликів, що отримають 429")
+    parser.add_argument("--rate-edit-not-found", type=float, default=0.0,
+                        help="Частка editMessageText з 'message to edit not found'")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeApiConfig:
+    return FakeApiConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429,
+        rate_edit_not_found=args.rate_edit_not_found,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Фейковий Telegram Bot API для тестування бота.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    api = FakeBotAPI(config_from_args(args))
+    web.run_app(api.app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.16) Локальний HTTP API генерації документів (напр., для плагіна LMS курсу).
+
+Використовує ті самі збирачі (`documents.py`) та той самий пул рендера
+(`pdf_utils.render_pdf_async`), що й бот, тож документи однакові.
+
+    POST /v1/policy?format=pdf|md
+    POST /v1/dpia?format=pdf|md|xlsx
+    POST /v1/checklist?format=pdf|md
+    GET  /healthz
+
+Тіло — JSON-об'єкт у полях бота (див. `documents.py`). Відповідь:
+  - format=pdf (за замовчуванням) — application/pdf, передається потоково
+    частинами; тимчасовий файл живе у спулі PDF (v3.26, `pdf_utils.SPOOL`)
+    і втрачає ім'я одразу після рендера;
+  - format=md — text/markdown;
+  - format=xlsx (лише dpia, v3.17) — заповнений `artifacts/1_dpia_lite.xlsx`.
+
+Обмеження (змінні оточення):
+  HTTP_API_MAX_BODY     — макс. розмір тіла, байт (64 КБ)
+  HTTP_API_MAX_FIELD    — макс. довжина поля, символів (4000)
+  HTTP_API_MAX_ITEMS    — макс. пунктів minimization_data (50)
+  HTTP_API_CONCURRENCY  — одночасних рендерів (кількість ядер); решта чекає
+  HTTP_API_QUEUE_TIMEOUT — скільки чекати на вільний слот, с (10), далі 503
+  Документ, що перевищив ліміт процесу рендера (v3.30, RENDER_MAX_*), — 422.
+  HTTP_API_TOKEN        — якщо задано, потрібен заголовок Authorization: Bearer <токен>
+
+Запуск:
+  - у процесі бота: HTTP_API_PORT=8090 (HTTP_API_HOST, за замовчуванням 127.0.0.1);
+  - окремо: python http_api.py --port 8090
+"""
+
+import argparse
+import asyncio
+import functools
+import hmac
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from aiohttp import web
+
+import tracing
+from documents import BUILDERS, normalize_record
+from logging_setup import configure_logging
+from loop_monitor import LoopLagMonitor, install_uvloop
+from pdf_utils import (
+    RenderLimitExceeded, SPOOL, SpoolFullError,
+    close_render_client, render_pdf_async, shutdown_render_pool, warm_up_render_pool,
+)
+from xlsx_export import XLSX_MIME_TYPE, build_dpia_xlsx, xlsx_available
+
+logger = logging.getLogger("http_api")
+logger.setLevel(logging.INFO)
+
+STREAM_CHUNK_BYTES = 64 * 1024
+_dumps = functools.partial(json.dumps, ensure_ascii=False)
+
+_LIMITS_KEY = web.AppKey("limits", dict)
+_SEMAPHORE_KEY = web.AppKey("render_slots", asyncio.Semaphore)
+
+
+def _json_error(status: int, message: str, **headers: str) -> web.Response:
+    return web.json_response({"ok": False, "error": message}, status=status, headers=headers or None, dumps=_dumps)
+
+
+@web.middleware
+async def _auth_middleware(request: web.Request, handler):
+    token = request.app[_LIMITS_KEY]["token"]
+    if token and request.path != "/healthz":
+        provided = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(provided, f"Bearer {token}"):
+            return _json_error(401, "unauthorized")
+    return await handler(request)
+
+
+async def _healthz(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True})
+
+
+async def _generate(request: web.Request) -> web.StreamResponse:
+    limits = request.app[_LIMITS_KEY]
+    doc_type = request.match_info["doc_type"]
+    output_format = request.query.get("format", "pdf")
+    if output_format not in ("pdf", "md", "xlsx"):
+        return _json_error(400, "format має бути pdf, md або xlsx")
+    if output_format == "xlsx" and (doc_type != "dpia" or not xlsx_available()):
+        return _json_error(400, "xlsx доступний лише для dpia (потрібен openpyxl)")
+
+    try:
+        payload = await request.json()
+    except web.HTTPRequestEntityTooLarge:
+        return _json_error(413, f"тіло більше за {limits['max_body']} байт")
+    except ValueError:
+        return _json_error(400, "тіло має бути JSON-об'єктом")
+
+    try:
+        if isinstance(payload, dict):
+            payload = {**payload, "type": doc_type}
+        doc_type, data = normalize_record(
+            payload, max_field_chars=limits["max_field"], max_items=limits["max_items"]
+        )
+    except ValueError as e:
+        return _json_error(422, str(e))
+
+    with tracing.trace("http.generate", document=doc_type, format=output_format):
+        if output_format == "xlsx":
+            body = await asyncio.to_thread(build_dpia_xlsx, data)
+            return web.Response(body=body, content_type=XLSX_MIME_TYPE, headers={
+                "Content-Disposition": 'attachment; filename="dpia.xlsx"',
+            })
+
+        markdown = BUILDERS[doc_type](data)
+        if output_format == "md":
+            return web.Response(text=markdown, content_type="text/markdown", charset="utf-8")
+
+        # Обмеження одночасних рендерів: чекаємо слот не довше queue_timeout.
+        # Слот — раніше за місце в спулі: запити в черзі не тримають квоту спулу.
+        semaphore = request.app[_SEMAPHORE_KEY]
+        try:
+            await asyncio.wait_for(semaphore.acquire(), limits["queue_timeout"])
+        except asyncio.TimeoutError:
+            return _json_error(503, "сервер перевантажений, спробуйте пізніше", **{"Retry-After": "5"})
+
+        holding_slot = True
+        try:
+            # (v3.26) Місце в спулі PDF: при сплеску чекаємо, поки звільниться квота
+            async with SPOOL.file(f"api_{doc_type}") as pdf:
+                started = time.perf_counter()
+                try:
+                    await render_pdf_async(content=markdown, output_filename=pdf.path)
+                except RenderLimitExceeded as e:
+                    # (v3.30) Документ перевищив ліміт процесу рендера — помилка даних, не сервера
+                    return _json_error(422, str(e))
+                except Exception as e:
+                    logger.error("API: генерація %s не вдалася: %s", doc_type, e)
+                    return _json_error(500, "не вдалося створити PDF")
+                finally:
+                    semaphore.release()
+                    holding_slot = False
+                logger.info("API: %s згенеровано за %.0f мс.", doc_type, (time.perf_counter() - started) * 1000)
+
+                # Потокова відправка: у пам'яті не більше одного шматка файлу
+                f = pdf.open()
+                response = web.StreamResponse(headers={
+                    "Content-Type": "application/pdf",
+                    "Content-Disposition": f'attachment; filename="{doc_type}.pdf"',
+                })
+                response.content_length = os.fstat(f.fileno()).st_size
+                await response.prepare(request)
+                while True:
+                    chunk = f.read(STREAM_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+        except SpoolFullError:
+            return _json_error(503, "сервер перевантажений, спробуйте пізніше", **{"Retry-After": "5"})
+        finally:
+            if holding_slot:
+                # Місця в спулі не дочекалися — слот рендера не використано
+                semaphore.release()
+
+
+def create_app(
+    max_body: Optional[int] = None,
+    max_field: Optional[int] = None,
+    max_items: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    queue_timeout: Optional[float] = None,
+    token: Optional[str] = None,
+) -> web.Application:
+    """Створює aiohttp-застосунок (параметри за замовчуванням — зі змінних оточення)."""
+    limits = {
+        "max_body": max_body or int(os.getenv("HTTP_API_MAX_BODY", 64 * 1024)),
+        "max_field": max_field or int(os.getenv("HTTP_API_MAX_FIELD", 4000)),
+        "max_items": max_items or int(os.getenv("HTTP_API_MAX_ITEMS", 50)),
+        "concurrency": concurrency or int(os.getenv("HTTP_API_CONCURRENCY", os.cpu_count() or 1)),
+        "queue_timeout": queue_timeout or float(os.getenv("HTTP_API_QUEUE_TIMEOUT", 10)),
+        "token": token if token is not None else os.getenv("HTTP_API_TOKEN"),
+    }
+    app = web.Application(client_max_size=limits["max_body"], middlewares=[_auth_middleware])
+    app[_LIMITS_KEY] = limits
+    app[_SEMAPHORE_KEY] = asyncio.Semaphore(limits["concurrency"])
+    app.router.add_get("/healthz", _healthz)
+    app.router.add_post("/v1/{doc_type:policy|dpia|checklist}", _generate)
+    return app
+
+
+async def start_http_api(host: str, port: int) -> web.AppRunner:
+    """Запускає API у ПОТОЧНОМУ event loop (напр., у процесі бота). Повертає runner для cleanup()."""
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("HTTP API генерації слухає http://%s:%s/v1/", host, port)
+    return runner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTTP API генерації документів Privacy Sentry.")
+    parser.add_argument("--host", default=os.getenv("HTTP_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("HTTP_API_PORT", 8090)))
+    args = parser.parse_args()
+
+    configure_logging()
+    tracing.configure()
+
+    # (v3.27) Окремий процес API — власний монітор event loop
+    loop_monitor = LoopLagMonitor()
+
+    async def on_startup(app: web.Application) -> None:
+        # Прогрів пулу у фоні — сервер уже приймає запити
+        asyncio.get_running_loop().run_in_executor(None, warm_up_render_pool)
+        SPOOL.start_sweeper()
+        loop_monitor.start()
+
+    async def on_cleanup(app: web.Application) -> None:
+        await loop_monitor.stop()
+        await SPOOL.stop_sweeper()
+        await close_render_client()
+        await asyncio.to_thread(shutdown_render_pool)
+
+    app = create_app()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    install_uvloop()
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
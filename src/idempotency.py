@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.22) Ідемпотентність апдейтів та single-flight генерації.
+
+На повільному мобільному зв'язку кнопку часто натискають двічі, а апдейт
+може прийти повторно (рестарт, повтор вебхука). Без захисту друге
+натискання `cl_skip_note` на останньому кроці запускає генерацію вдруге і
+перезаписує той самий `checklist_{user_id}.pdf`, який ще надсилається.
+
+  - `UpdateDeduplicator.handle` (група -3, раніше за всі інші хендлери)
+    відкидає:
+      * повторний update_id або callback_query.id (повторна доставка);
+      * натискання кнопок і повідомлення (не команди) користувача, для якого
+        вже триває генерація: кнопка отримує спливаючу підказку, повідомлення —
+        відповідь, що його не оброблено; команди (/cancel, /help, /start)
+        проходять. Такі апдейти не чекають у черзі користувача
+        (`skips_queue`, `update_processor.py`) — підказка приходить одразу, а не
+        після рендера;
+      * повторне натискання тієї ж кнопки тієї ж версії повідомлення протягом
+        DEDUP_TAP_WINDOW секунд (за замовчуванням 1.5, 0 — вимкнено) після
+        того, як попереднє натискання було ОБРОБЛЕНО (`mark_processed`) —
+        тож дубль, що чекав у черзі під час рендера, теж відкидається.
+    Дубль callback-запиту лише підтверджується `query.answer()` (прибирає
+    "годинник" на кнопці) — без рендера і без звернення до розмови.
+  - `SingleFlight` — не більше однієї генерації на ключ (user_id) одночасно.
+
+Відкинуті апдейти рахуються в `bot_duplicate_updates_total{reason}`.
+"""
+
+import contextlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterator, Optional, Set
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop
+
+import metrics
+import templates
+import tg_format
+
+logger = logging.getLogger("idempotency")
+logger.setLevel(logging.INFO)
+
+
+class RecentKeys:
+    """Множина нещодавніх ключів, обмежена за часом (TTL) і розміром."""
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        # Ключ -> мітка часу; порядок вставки = порядок міток (touch переносить у кінець)
+        self._keys: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def _purge(self, now: float) -> None:
+        while self._keys:
+            oldest = next(iter(self._keys.values()))
+            if now - oldest < self.ttl and len(self._keys) <= self.max_size:
+                break
+            self._keys.popitem(last=False)
+
+    def seen(self, key: Hashable) -> bool:
+        """True, якщо ключ уже був протягом TTL (мітка оновлюється); інакше запам'ятовує його."""
+        now = time.monotonic()
+        self._purge(now)
+        found = key in self._keys
+        self._keys[key] = now
+        self._keys.move_to_end(key)
+        return found
+
+    def touch(self, key: Hashable) -> None:
+        """Оновлює мітку часу наявного ключа (відлік TTL починається заново)."""
+        if key in self._keys:
+            self._keys[key] = time.monotonic()
+            self._keys.move_to_end(key)
+
+
+class SingleFlight:
+    """Не більше однієї операції на ключ одночасно (в межах одного event loop)."""
+
+    def __init__(self):
+        self._active: Set[Hashable] = set()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._active
+
+    @contextlib.contextmanager
+    def claim(self, key: Hashable) -> Iterator[bool]:
+        """`with flights.claim(user_id) as claimed:` — False, якщо операція вже триває."""
+        if key in self._active:
+            yield False
+            return
+        self._active.add(key)
+        try:
+            yield True
+        finally:
+            self._active.discard(key)
+
+
+class UpdateDeduplicator:
+    """Відкидає дублікати апдейтів до того, як вони дійдуть до розмови."""
+
+    def __init__(self, flights: SingleFlight, tap_window: Optional[float] = None):
+        if tap_window is None:
+            tap_window = float(os.getenv("DEDUP_TAP_WINDOW", 1.5))
+        self.flights = flights
+        self.tap_window = tap_window
+        self._updates = RecentKeys(ttl=600)
+        self._taps = RecentKeys(ttl=tap_window)
+        # update_id апдейтів, які `skips_queue` вже визнав "in_flight"
+        self._in_flight: Set[int] = set()
+
+    def _is_in_flight(self, update: Update) -> bool:
+        """Кнопка або повідомлення-не-команда від користувача, чия генерація ще триває."""
+        user = update.effective_user
+        if not user or user.id not in self.flights:
+            return False
+        if update.callback_query:
+            return True
+        message = update.effective_message
+        return bool(message) and not (message.text or "").startswith("/")
+
+    def skips_queue(self, update: object) -> bool:
+        """
+        (для `update_processor.PerUserUpdateProcessor`) True — апдейт буде
+        відкинуто як "in_flight", тож він не чекає в черзі користувача на кінець рендера.
+        """
+        if not isinstance(update, Update) or not self._is_in_flight(update):
+            return False
+        self._in_flight.add(update.update_id)
+        return True
+
+    @staticmethod
+    def _tap_key(update: Update) -> Optional[tuple]:
+        query = update.callback_query
+        if not query:
+            return None
+        message = query.message
+        if not message:
+            return (query.from_user.id, query.inline_message_id, query.data)
+        # Головне повідомлення редагується на місці (той самий message_id), тому
+        # ключ включає "версію", яку бачив клієнт: текст і клавіатуру. Наступне
+        # питання з тією ж кнопкою (cl_yes) — інша версія, а не дубль.
+        markup = message.reply_markup.to_json() if message.reply_markup else ""
+        version = hash((getattr(message, "text", None), markup))
+        return (query.from_user.id, message.chat.id, message.message_id, version, query.data)
+
+    def classify(self, update: Update) -> Optional[str]:
+        """Причина, з якої апдейт є дублікатом, або None."""
+        if self._updates.seen(("update", update.update_id)):
+            return "update_id"
+        query = update.callback_query
+        if query and self._updates.seen(("callback", query.id)):
+            return "callback_id"
+        # Рішення `skips_queue` остаточне: генерація могла вже завершитися
+        if update.update_id in self._in_flight or self._is_in_flight(update):
+            self._in_flight.discard(update.update_id)
+            return "in_flight"
+        if query and self.tap_window > 0 and self._taps.seen(self._tap_key(update)):
+            return "double_tap"
+        return None
+
+    async def handle(self, update: Update, context) -> None:
+        """(група -3) Дублікат: підтверджуємо callback і зупиняємо обробку апдейту."""
+        reason = self.classify(update)
+        if reason is None:
+            return
+        metrics.DUPLICATE_UPDATES.inc(reason=reason)
+        logger.info("Дублікат апдейту %s відкинуто (%s).", update.update_id, reason)
+        try:
+            if update.callback_query:
+                alert = templates.GENERATION_IN_FLIGHT_ALERT if reason == "in_flight" else None
+                await update.callback_query.answer(alert)
+            elif reason == "in_flight" and update.effective_message:
+                # Відповідь користувача не губиться мовчки
+                await update.effective_message.reply_text(**tg_format.message(templates.GENERATION_IN_FLIGHT_MESSAGE))
+        except TelegramError as e:
+            logger.debug("Відповідь на дублікат не вдалася: %s", e)
+        raise ApplicationHandlerStop
+
+    def mark_processed(self, update: object) -> None:
+        """Викликається ПІСЛЯ обробки апдейту: вікно подвійного натискання рахується від цього моменту."""
+        if isinstance(update, Update) and update.callback_query and self.tap_window > 0:
+            self._taps.touch(self._tap_key(update))
@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.10) Офлайн навантажувальний тест бота без справжнього Telegram.
+
+Піднімає фейковий Bot API (`fake_bot_api.py`), (опційно) запускає `bot.py`
+проти нього і "проганяє" тисячі віртуальних користувачів через сценарії
+Політики, DPIA та Чек-ліста (а також імпорту DPIA з Excel та вставленого Чек-ліста — сценарії
+dpia_xlsx і checklist_paste; "Повного комплекту" — kit; "молотіння" меню — hammer;
+DPIA з відповідями, що ламали legacy Markdown, — hostile; Чек-ліст із
+довгими нотатками та сторінками підсумку — long).
+
+Звіт:
+  - апдейтів/сек (скільки апдейтів бот обробив за час тесту);
+  - перцентилі затримки кожного кроку (від апдейту до видимої відповіді бота);
+  - поведінка рендера: час "остання відповідь -> PDF", скільки генерацій
+    одночасно чекали на документ (макс. та середнє);
+  - кількість викликів Bot API по методах та інжектовані помилки.
+
+Приклад:
+    python loadtest.py --spawn-bot --users 2000 --concurrency 200 \\
+        --latency-ms 40 --jitter-ms 20 --rate-429 0.005
+
+(v3.28) Горизонтальне масштабування: `--dispatcher-workers 3` запускає
+`dispatcher.py` з трьома воркерами (апдейти через вебхук), а
+`--kill-worker-after 5` через 5 с вбиває воркер 0 — перевірка ребалансування.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession
+
+from fake_bot_api import BotEvent, FakeBotAPI, add_config_arguments, config_from_args, serve
+
+logger = logging.getLogger("loadtest")
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Події, які користувач вважає "відповіддю" бота
+VISIBLE_METHODS = ("sendMessage", "editMessageText", "sendDocument")
+
+# Крок сценарію: (дія, значення, мітка).
+# Дія: 'cmd' | 'say' | 'click' | 'upload' | 'spam' | 'generate_say' | 'generate_click'
+Step = Tuple[str, str, str]
+
+# (v3.18) Файли для кроку 'upload': назва -> вміст (будуються ліниво)
+_UPLOADS: Dict[str, bytes] = {}
+
+
+def upload_content(name: str) -> bytes:
+    if name not in _UPLOADS:
+        if name == "dpia.xlsx":
+            from xlsx_export import build_dpia_xlsx
+            _UPLOADS[name] = build_dpia_xlsx({
+                "project_name": "Uploaded project", "team": "Team Lead", "goal": "Help students",
+                "minimization_data": [
+                    {"item": f"Item {i}", "needed": i % 2 == 0, "reason": f"Reason {i}"} for i in range(3)
+                ],
+                "retention_period": "6 months", "retention_mechanism": "Команда deleteme",
+                "storage": "Postgres", "risk": "Leak", "mitigation": "2FA",
+            })
+        else:
+            raise KeyError(name)
+    return _UPLOADS[name]
+
+
+def policy_script(n: int) -> List[Step]:
+    return [
+        ("cmd", "/start", "start"),
+        ("click", "start_policy", "policy:start"),
+        ("say", f"Project {n}", "policy:project_name"),
+        ("say", f"@user{n}", "policy:contact"),
+        ("say", "Telegram ID\nEmail", "policy:data_collected"),
+        ("say", "Google Sheets", "policy:data_storage"),
+        ("generate_say", "Команда deleteme", "policy:generate"),
+    ]
+
+
+def dpia_script(n: int, items: int = 3) -> List[Step]:
+    steps: List[Step] = [
+        ("cmd", "/start", "start"),
+        ("click", "start_dpia", "dpia:start"),
+        ("say", f"Project {n}", "dpia:project_name"),
+        ("say", "Team Lead", "dpia:team"),
+        ("say", "Help students", "dpia:goal"),
+        ("say", "\n".join(f"Item {i}" for i in range(items)), "dpia:data_list"),
+    ]
+    # (v3.20) Мультивибір: знімаємо кожен непарний пункт (по сторінках), потім
+    # усі обґрунтування одним повідомленням. Розмір сторінки — як bot.DPIA_MIN_PAGE_SIZE.
+    page_size = 10
+    for page in range(-(-items // page_size)):
+        if page:
+            steps.append(("click", f"min_page:{page}", "dpia:min_page"))
+        for i in range(page * page_size, min((page + 1) * page_size, items)):
+            if i % 2:
+                steps.append(("click", f"min_toggle:{i}", "dpia:min_toggle"))
+    steps.append(("click", "min_done", "dpia:min_done"))
+    if items:
+        steps.append(("say", "\n".join(f"Reason {i}" for i in range(0, items, 2)), "dpia:min_reasons"))
+    steps += [
+        ("say", "6 months", "dpia:retention_period"),
+        ("say", "Команда deleteme", "dpia:retention_mechanism"),
+        ("say", "Postgres", "dpia:storage"),
+        ("say", "Leak", "dpia:risk"),
+        ("generate_say", "2FA", "dpia:generate"),
+    ]
+    return steps
+
+
+def checklist_script(n: int) -> List[Step]:
+    steps: List[Step] = [
+        ("cmd", "/start", "start"),
+        ("click", "start_checklist", "checklist:start"),
+        ("say", f"Project {n}", "checklist:project_name"),
+    ]
+    for i in range(9):
+        steps.append(("click", "cl_yes" if (n + i) % 3 else "cl_no", "checklist:status"))
+        last = i == 8
+        if i % 2:
+            steps.append(("generate_say" if last else "say", f"Note {i}", "checklist:note"))
+        else:
+            steps.append(("generate_click" if last else "click", "cl_skip_note", "checklist:skip_note"))
+    return steps
+
+
+def dpia_xlsx_script(n: int) -> List[Step]:
+    """(v3.18) Заповнений 1_dpia_lite.xlsx: завантаження -> підсумок -> генерація."""
+    return [
+        ("cmd", "/start", "start"),
+        ("upload", "dpia.xlsx", "dpia_xlsx:upload"),
+        ("generate_click", "dpia_upload_generate", "dpia_xlsx:generate"),
+    ]
+
+
+def checklist_paste_script(n: int) -> List[Step]:
+    """(v3.19) Заповнений Чек-ліст вставлено одним повідомленням."""
+    lines = [f"# Project {n} – Технічний Чек-ліст Безпеки"]
+    for i in range(9):
+        mark = "x" if (n + i) % 3 else " "
+        lines.append(f"- [{mark}] **Пункт {i + 1}:** Note {i}")
+    return [
+        ("cmd", "/start", "start"),
+        ("generate_say", "\n".join(lines), "checklist_paste:generate"),
+    ]
+
+
+def kit_script(n: int, items: int = 3) -> List[Step]:
+    """(v3.21) "Повний комплект": кроки DPIA + контакт + перемикачі Чек-ліста."""
+    steps: List[Step] = [
+        (action, "start_kit" if value == "start_dpia" else value, label.replace("dpia:", "kit:"))
+        for action, value, label in dpia_script(n, items)[:-1]
+    ]
+    steps += [
+        ("say", "2FA", "kit:mitigation"),
+        ("say", f"@user{n}", "kit:contact"),
+    ]
+    for category in range(1, 4):
+        for item in range(1, 4):
+            if (n + category + item) % 3:
+                steps.append(("click", f"kit_cl:c{category}_s{item}", "kit:checklist_toggle"))
+    steps.append(("generate_click", "kit_generate", "kit:generate"))
+    return steps
+
+
+# (v3.32) Відповіді, на яких legacy Markdown отримував 400 "can't parse entities"
+HOSTILE_ANSWERS = ("it`s", "first_last@kai.edu.ua", "5* готель", "[TODO", "```x```", "🤖_*`", "AT&T <b>")
+
+
+def hostile_script(n: int, items: int = 3) -> List[Step]:
+    """(v3.32) DPIA, де кожна відповідь — рядок з HOSTILE_ANSWERS (пункти даних — теж)."""
+    answers = itertools.cycle(HOSTILE_ANSWERS[n % len(HOSTILE_ANSWERS):] + HOSTILE_ANSWERS[:n % len(HOSTILE_ANSWERS)])
+    steps = []
+    for action, value, label in dpia_script(n, items):
+        if action in ("say", "generate_say"):
+            lines = value.count("\n") + 1
+            value = "\n".join(f"{i + 1}. {next(answers)}" if label == "dpia:min_reasons" else next(answers)
+                              for i in range(lines))
+        steps.append((action, value, label.replace("dpia:", "hostile:")))
+    return steps
+
+
+# (v3.33) Довжина нотатки сценарію long: кілька таких — і підсумок Чек-ліста довший за 4096 символів
+LONG_NOTE_CHARS = 1500
+
+
+def long_script(n: int) -> List[Step]:
+    """(v3.33) Чек-ліст з довгими нотатками; посередині — сторінки підсумку й повернення до питання."""
+    steps = []
+    for action, value, label in checklist_script(n):
+        if label == "checklist:note":
+            value = (f"Нотатка {value}: " + "довгий опис заходу, " * LONG_NOTE_CHARS)[:LONG_NOTE_CHARS]
+        steps.append((action, value, label.replace("checklist:", "long:")))
+        # Після другої нотатки підсумок уже не вміщається — з'являється "Показати підсумок"
+        if label == "checklist:note" and sum(1 for _, _, label in steps if label == "long:note") == 2:
+            steps += [
+                ("click", "sum_page:0", "long:summary"),
+                ("click", "sum_page:1", "long:summary"),
+                ("click", "sum_back", "long:summary_back"),
+            ]
+    return steps
+
+
+HAMMER_TAPS = 20
+
+
+def hammer_script(n: int) -> List[Step]:
+    """(v3.23) Посеред Політики користувач "молотить" кнопки головного меню."""
+    steps = policy_script(n)
+    steps.insert(2, ("spam", "start_dpia,start_checklist,start_kit", "hammer:blocked"))
+    return [(action, value, label.replace("policy:", "hammer:")) for action, value, label in steps]
+
+
+SCRIPTS = {
+    "policy": policy_script,
+    "dpia": dpia_script,
+    "checklist": checklist_script,
+    "dpia_xlsx": dpia_xlsx_script,
+    "checklist_paste": checklist_paste_script,
+    "kit": kit_script,
+    "hammer": hammer_script,
+    "hostile": hostile_script,
+    "long": long_script,
+}
+
+
+class Stats:
+    """Збирає затримки кроків і поведінку "черги рендера"."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.timeouts: Dict[str, int] = defaultdict(int)
+        self.updates_sent = 0
+        self.users_done = 0
+        self.users_failed = 0
+        self.in_flight_generations = 0
+        self.max_in_flight_generations = 0
+        self._in_flight_area = 0.0
+        self._in_flight_since = time.perf_counter()
+
+    def generation_started(self) -> None:
+        self._account_in_flight()
+        self.in_flight_generations += 1
+        self.max_in_flight_generations = max(self.max_in_flight_generations, self.in_flight_generations)
+
+    def generation_finished(self) -> None:
+        self._account_in_flight()
+        self.in_flight_generations -= 1
+
+    def _account_in_flight(self) -> None:
+        now = time.perf_counter()
+        self._in_flight_area += self.in_flight_generations * (now - self._in_flight_since)
+        self._in_flight_since = now
+
+    def avg_in_flight(self, elapsed: float) -> float:
+        self._account_in_flight()
+        return self._in_flight_area / elapsed if elapsed else 0.0
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class VirtualUser:
+    """Один синтетичний користувач, що проходить один сценарій."""
+
+    def __init__(self, api: FakeBotAPI, user_id: int, stats: Stats, step_timeout: float,
+                 double_tap: bool = False, think_ms: float = 0):
+        self.api = api
+        self.user_id = user_id
+        self.stats = stats
+        self.step_timeout = step_timeout
+        self.double_tap = double_tap
+        self.think = think_ms / 1000
+        self.events = api.listen(user_id)
+
+    def _user(self):
+        return {"id": self.user_id, "is_bot": False, "first_name": f"VU{self.user_id}"}
+
+    def _drain(self) -> None:
+        while not self.events.empty():
+            self.events.get_nowait()
+
+    async def _send_text(self, text: str) -> None:
+        message = {
+            "message_id": self.api.new_message_id(self.user_id),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self._user(),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        # Бот видаляє відповідь користувача — вона має існувати на "сервері"
+        self.api.messages[(self.user_id, message["message_id"])] = message
+        await self.api.push_update({"message": message})
+
+    async def _send_document(self, name: str) -> None:
+        message = {
+            "message_id": self.api.new_message_id(self.user_id),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self._user(),
+            "document": self.api.add_file(self.user_id, upload_content(name), name),
+        }
+        self.api.messages[(self.user_id, message["message_id"])] = message
+        await self.api.push_update({"message": message})
+
+    def _find_button(self, data: str) -> dict:
+        target = None
+        for (chat_id, _), message in sorted(self.api.messages.items(), reverse=True):
+            if chat_id != self.user_id:
+                continue
+            buttons = itertools.chain.from_iterable(
+                (message.get("reply_markup") or {}).get("inline_keyboard", [])
+            )
+            if any(b.get("callback_data") == data for b in buttons):
+                target = message
+                break
+        if target is None:
+            raise LookupError(f"Кнопку '{data}' не знайдено")
+        return target
+
+    async def _click(self, data: str, taps: int = 1) -> None:
+        target = self._find_button(data)
+        # (v3.22) taps > 1 — подвійне натискання (кожне — окремий callback_query)
+        for _ in range(taps):
+            await self.api.push_update({
+                "callback_query": {
+                    "id": f"{self.user_id}-{time.perf_counter_ns()}",
+                    "from": self._user(),
+                    "chat_instance": str(self.user_id),
+                    "message": target,
+                    "data": data,
+                }
+            })
+
+    async def _wait_for(self, methods) -> BotEvent:
+        deadline = time.perf_counter() + self.step_timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            event = await asyncio.wait_for(self.events.get(), remaining)
+            if event.method in methods:
+                return event
+
+    async def run(self, script: List[Step]) -> bool:
+        try:
+            for index, (action, value, label) in enumerate(script):
+                if index and self.think:
+                    # (v3.23) "Час на роздуми" між кроками (для ліміту частоти)
+                    await asyncio.sleep(self.think)
+                self._drain()
+                started = time.perf_counter()
+                if action in ("say", "cmd", "generate_say"):
+                    await self._send_text(value)
+                elif action == "upload":
+                    await self._send_document(value)
+                elif action == "spam":
+                    # (v3.23) HAMMER_TAPS натискань по черзі різних кнопок, без очікування
+                    buttons = value.split(",")
+                    for i in range(HAMMER_TAPS):
+                        await self._click(buttons[i % len(buttons)])
+                    self.stats.updates_sent += HAMMER_TAPS - 1
+                else:
+                    taps = 2 if self.double_tap and action == "generate_click" else 1
+                    await self._click(value, taps)
+                    self.stats.updates_sent += taps - 1
+                self.stats.updates_sent += 1
+
+                generating = action.startswith("generate")
+                if generating:
+                    self.stats.generation_started()
+                try:
+                    event = await self._wait_for(VISIBLE_METHODS)
+                    self.stats.latencies[label].append(event.ts - started)
+                    if action == "spam":
+                        # Даємо боту розібрати решту натискань до наступного кроку
+                        await asyncio.sleep(0.5)
+                    if generating:
+                        if event.method != "sendDocument":
+                            event = await self._wait_for(("sendDocument",))
+                        self.stats.latencies[f"{label}:pdf"].append(event.ts - started)
+                except asyncio.TimeoutError:
+                    self.stats.timeouts[label] += 1
+                    return False
+                finally:
+                    if generating:
+                        self.stats.generation_finished()
+            return True
+        except LookupError as e:
+            logger.debug("VU %s: %s", self.user_id, e)
+            self.stats.timeouts["missing_button"] += 1
+            return False
+        finally:
+            self.api.forget_chat(self.user_id)
+
+
+def parse_mix(raw: str) -> List[str]:
+    """'policy=2,dpia=1' -> ['policy', 'policy', 'dpia']"""
+    flows = []
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCRIPTS:
+            raise SystemExit(f"Невідомий сценарій: {name}")
+        flows += [name] * int(weight or 1)
+    return flows
+
+
+async def run_load(args: argparse.Namespace) -> None:
+    api = FakeBotAPI(config_from_args(args))
+    runner = await serve(api, args.host, args.port)
+
+    bot_process: Optional[subprocess.Popen] = None
+    if args.spawn_bot or args.dispatcher_workers:
+        env = dict(os.environ)
+        env["BOT_TOKEN"] = env.get("BOT_TOKEN") or "123456:FAKE"
+        env["TELEGRAM_API_BASE_URL"] = f"http://{args.host}:{args.port}/bot"
+        # (v3.23) Віртуальні користувачі діють зі швидкістю машини — ліміт частоти
+        # за замовчуванням вимкнено (--throttle-rate вмикає для сценарію hammer)
+        env["THROTTLE_RATE"] = str(args.throttle_rate)
+        command = [sys.executable, os.path.join(SRC_DIR, "bot.py")]
+        if args.dispatcher_workers:
+            # (v3.28) Диспетчер сам запускає воркерів і встановлює вебхук
+            env["WEBHOOK_URL"] = f"http://{args.host}:{args.webhook_port}/telegram"
+            env["WEBHOOK_SECRET"] = "loadtest-secret"
+            command = [
+                sys.executable, os.path.join(SRC_DIR, "dispatcher.py"),
+                "--workers", str(args.dispatcher_workers), "--port", str(args.webhook_port),
+            ]
+        bot_process = subprocess.Popen(
+            command,
+            env=env,
+            stdout=subprocess.DEVNULL if args.quiet_bot else None,
+            stderr=subprocess.DEVNULL if args.quiet_bot else None,
+        )
+
+    try:
+        print("Чекаю, поки бот почне отримувати апдейти (getUpdates або вебхук)...")
+        while api.first_get_updates_at is None and api.webhook_url is None:
+            if bot_process and bot_process.poll() is not None:
+                raise SystemExit("Бот завершився до старту.")
+            await asyncio.sleep(0.05)
+        if args.kill_worker_after:
+            asyncio.get_running_loop().create_task(kill_worker(args))
+
+        stats = Stats()
+        flows = parse_mix(args.mix)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        base_user_id = 10**9
+
+        async def one_user(n: int) -> None:
+            async with semaphore:
+                flow = flows[n % len(flows)]
+                user = VirtualUser(
+                    api, base_user_id + n, stats, args.step_timeout, args.double_tap, args.think_ms
+                )
+                script = SCRIPTS[flow](n, args.dpia_items) if flow in ("dpia", "kit", "hostile") else SCRIPTS[flow](n)
+                ok = await user.run(script)
+                if ok:
+                    stats.users_done += 1
+                else:
+                    stats.users_failed += 1
+                done = stats.users_done + stats.users_failed
+                if done % max(1, args.users // 10) == 0:
+                    print(f"  ... {done}/{args.users} користувачів")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_user(n) for n in range(args.users)))
+        elapsed = time.perf_counter() - started
+
+        print_report(api, stats, elapsed)
+    finally:
+        if bot_process:
+            # Чекаємо асинхронно: фейковий API має відповідати боту під час його зупинки
+            bot_process.terminate()
+            deadline = time.perf_counter() + 15
+            while bot_process.poll() is None and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+            if bot_process.poll() is None:
+                bot_process.kill()
+        await runner.cleanup()
+
+
+async def kill_worker(args: argparse.Namespace) -> None:
+    """(v3.28) Через N секунд "вбиває" воркер 0 диспетчера — перевірка ребалансування."""
+    await asyncio.sleep(args.kill_worker_after)
+    async with ClientSession() as session:
+        async with session.get(f"http://{args.host}:{args.webhook_port}/healthz") as resp:
+            workers = (await resp.json())["workers"]
+    pid = workers[0]["pid"]
+    print(f"  ... kill -9 воркера 0 (pid {pid})")
+    os.kill(pid, signal.SIGKILL)
+
+
+def print_report(api: FakeBotAPI, stats: Stats, elapsed: float) -> None:
+    print("\n=== Звіт навантажувального тесту ===")
+    print(f"Користувачів: {stats.users_done} успішно, {stats.users_failed} з помилкою")
+    print(f"Апдейтів надіслано: {stats.updates_sent} за {elapsed:.2f} с -> {stats.updates_sent / elapsed:.1f} апдейтів/с")
+
+    print("\nЗатримка кроків (мс):")
+    print(f"  {'крок':<32} {'n':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for label in sorted(stats.latencies):
+        values = [v * 1000 for v in stats.latencies[label]]
+        print(
+            f"  {label:<32} {len(values):>6} {percentile(values, 50):>8.1f} {percentile(values, 90):>8.1f} "
+            f"{percentile(values, 99):>8.1f} {max(values):>8.1f}"
+        )
+
+    pdf_latencies = [v for k, vs in stats.latencies.items() if k.endswith(":pdf") for v in vs]
+    print("\nРендер (остання відповідь -> PDF):")
+    if pdf_latencies:
+        print(f"  середнє {statistics.mean(pdf_latencies) * 1000:.1f} мс, p99 {percentile(pdf_latencies, 99) * 1000:.1f} мс")
+    print(f"  генерацій в очікуванні: макс. {stats.max_in_flight_generations}, "
+          f"середнє {stats.avg_in_flight(elapsed):.2f}")
+
+    if stats.timeouts:
+        print("\nТаймаути / збої кроків:")
+        for label, count in sorted(stats.timeouts.items()):
+            print(f"  {label:<32} {count}")
+
+    print("\nВиклики Bot API:")
+    for method, count in sorted(api.calls.items()):
+        print(f"  {method:<24} {count}")
+    if api.faults:
+        print("Інжектовані помилки:")
+        for fault, count in sorted(api.faults.items()):
+            print(f"  {fault:<32} {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Навантажувальний тест бота проти фейкового Bot API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=100, help="Кількість віртуальних користувачів")
+    parser.add_argument("--concurrency", type=int, default=50, help="Скільки користувачів активні одночасно")
+    parser.add_argument("--mix", default="policy=1,dpia=1,checklist=1", help="Ваги сценаріїв")
+    parser.add_argument("--step-timeout", type=float, default=30.0, help="Таймаут очікування відповіді, с")
+    parser.add_argument("--dpia-items", type=int, default=3, help="Пунктів даних у сценаріях DPIA та kit")
+    parser.add_argument("--double-tap", action="store_true",
+                        help="Натискати кнопку генерації двічі (перевірка дедуплікації, v3.22)")
+    parser.add_argument("--throttle-rate", type=float, default=0,
+                        help="THROTTLE_RATE для запущеного бота (0 — без ліміту)")
+    parser.add_argument("--think-ms", type=float, default=0, help="Пауза користувача між кроками, мс")
+    parser.add_argument("--spawn-bot", action="store_true", help="Запустити bot.py проти фейкового API")
+    parser.add_argument("--quiet-bot", action="store_true", help="Приховати вивід bot.py")
+    parser.add_argument("--dispatcher-workers", type=int, default=0,
+                        help="Запустити dispatcher.py з N воркерами (вебхук) замість bot.py (v3.28)")
+    parser.add_argument("--webhook-port", type=int, default=8443, help="Порт вебхука диспетчера")
+    parser.add_argument("--kill-worker-after", type=float, default=0,
+                        help="Через N секунд вбити воркер 0 (перевірка ребалансування)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.WARNING)
+    asyncio.run(run_load(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.13) Неблокуюче логування.
+
+Раніше `logging.basicConfig` писав у stderr синхронно, прямо з event loop,
+по кілька разів на кожен апдейт. Тепер:
+
+  - Кореневий логер має лише `QueueHandler` — у event loop запис у лог коштує
+    одну вставку в чергу. Форматування та запис виконує `QueueListener`
+    у фоновому потоці.
+  - Повідомлення форматуються ліниво (`logger.info("... %s", x)`), тож
+    відкинуті семплінгом записи взагалі не форматуються.
+  - Семплінг INFO/DEBUG по логерах: LOG_SAMPLING="httpx=0.05,pdf_utils=0.5".
+    WARNING і вище НІКОЛИ не відкидаються.
+  - LOG_FORMAT=json — структурований вивід (один JSON-об'єкт на рядок),
+    з trace_id, якщо апдейт семплований трасуванням (`tracing.py`).
+  - LOG_LEVEL — рівень кореневого логера (за замовчуванням INFO).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import tracing
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# httpx пише рядок INFO на КОЖЕН виклик Bot API — за замовчуванням лишаємо 5%
+DEFAULT_SAMPLING = {"httpx": 0.05}
+
+# Типи аргументів, які безпечно передати у фоновий потік без форматування
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None), bytes)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускає лише частку INFO/DEBUG записів для заданих логерів (і їх дочірніх)."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            # Найдовший збіг префікса: "telegram.ext" перемагає "telegram"
+            best = -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = value, len(prefix)
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class TraceContextFilter(logging.Filter):
+    """Додає trace_id поточного апдейту (contextvars читаються у ПОТОЦІ виклику)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = tracing.current_trace_id()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, що НЕ форматує повідомлення в потоці виклику.
+    Стандартний `prepare()` робить `self.format(record)` ще в event loop —
+    саме цього ми й уникаємо. Форматуємо заздалегідь лише тоді, коли аргументи
+    змінювані (dict, list...), бо до моменту запису їх можуть змінити.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(a, _IMMUTABLE_ARGS) for a in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Один JSON-об'єкт на рядок (для збирачів логів)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """'httpx=0.05,pdf_utils=0.5' -> {'httpx': 0.05, 'pdf_utils': 0.5}"""
+    rates: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, sep, value = part.strip().partition("=")
+        if sep and name:
+            rates[name.strip()] = min(max(float(value), 0.0), 1.0)
+    return rates
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sampling: Optional[str] = None,
+    stream=None,
+) -> logging.handlers.QueueListener:
+    """
+    Налаштовує кореневий логер (замість `logging.basicConfig`).
+    Параметри за замовчуванням беруться з LOG_LEVEL / LOG_FORMAT / LOG_SAMPLING.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.getenv("LOG_LEVEL") or "INFO").upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT") or "text").lower()
+    rates = dict(DEFAULT_SAMPLING)
+    rates.update(parse_sampling(sampling if sampling is not None else os.getenv("LOG_SAMPLING", "")))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(rates))
+    queue_handler.addFilter(TraceContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Під час зупинки дописуємо все, що лишилось у черзі
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Зупиняє фоновий потік, попередньо вичитавши чергу."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.27) Монітор затримки event loop: знаходить блокуючі виклики в хендлерах.
+
+Синхронний рендер PDF — відомий блокуючий виклик (з v3.16 — у пулі процесів),
+але `open()`, синхронний запис у лог чи важкий цикл у хендлері так само
+зупиняють УСІХ користувачів, і без вимірювання їх не видно. Тепер:
+
+  - фонова asyncio-задача ("серцебиття") кожні LOOP_LAG_INTERVAL секунд (0.2)
+    засинає і міряє, наскільки пізніше запланованого прокинулася — це затримка
+    планування, `event_loop_lag_seconds`;
+  - потік-вартовий помічає, що серцебиття запізнюється більше ніж на
+    LOOP_LAG_THRESHOLD секунд (0.1), ПОКИ цикл ще заблоковано, і знімає стек
+    потоку event loop (`sys._current_frames`) — тобто саме той виклик, що
+    блокує, і хендлер, з якого його зроблено (за обгорткою `metrics.timed_callback`);
+  - коли цикл відпускає, пишеться один WARNING зі скільки тривало блокування,
+    хендлером і стеком, а `event_loop_blocked_total{handler}` збільшується.
+
+LOOP_LAG_MONITOR=0 — вимкнено. USE_UVLOOP=1 — цикл uvloop (якщо встановлено,
+`pip install uvloop`); інакше стандартний asyncio з попередженням у лозі.
+
+ВАЖЛИВО (Privacy by Design): у лог потрапляють лише файли, рядки та імена
+функцій — не локальні змінні кадрів (вони можуть містити відповіді).
+"""
+
+import asyncio
+import contextlib
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("loop_monitor")
+logger.setLevel(logging.INFO)
+
+# Кадри з файлів проєкту — для пошуку хендлера і "винного" рядка
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Скільки останніх кадрів стеку показувати в лозі
+STACK_LIMIT = 12
+
+
+def install_uvloop() -> bool:
+    """Якщо USE_UVLOOP=1 і uvloop встановлено — робить його циклом за замовчуванням."""
+    if os.getenv("USE_UVLOOP", "0") != "1":
+        return False
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("USE_UVLOOP=1, але uvloop не встановлено (pip install uvloop) — працюю на asyncio.")
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Event loop: uvloop %s.", uvloop.__version__)
+    return True
+
+
+def _handler_of(frames: List) -> str:
+    """
+    Хендлер, що виконується: стан і назва з обгортки `metrics.timed_callback`;
+    інакше (напр., генерація в окремій задачі `ShutdownCoordinator.run`) —
+    зовнішня корутина проєкту, не рахуючи декораторів `wrapper`.
+    """
+    project = [frame for frame in frames if frame.f_code.co_filename.startswith(PROJECT_DIR)]
+    for frame in project:
+        if frame.f_code.co_name == "wrapper" and frame.f_globals.get("__name__") == "metrics":
+            free = frame.f_locals
+            return f"{free.get('state', '?')}:{free.get('handler_name', '?')}"
+    for frame in project:
+        if frame.f_code.co_flags & inspect.CO_COROUTINE and frame.f_code.co_name != "wrapper":
+            return frame.f_code.co_name
+    return project[-1].f_code.co_name if project else "unknown"
+
+
+class LoopLagMonitor:
+    """Серцебиття в event loop + потік-вартовий, що знімає стек під час блокування."""
+
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None):
+        self.interval = float(os.getenv("LOOP_LAG_INTERVAL", 0.2)) if interval is None else interval
+        self.threshold = float(os.getenv("LOOP_LAG_THRESHOLD", 0.1)) if threshold is None else threshold
+        self.enabled = os.getenv("LOOP_LAG_MONITOR", "1") != "0"
+        self._beat = time.monotonic()  # Коли серцебиття мало прокинутися
+        self._loop_thread: Optional[int] = None
+        # Знімок останнього блокування: (очікуване пробудження, хендлер, стек)
+        self._capture: Optional[Tuple[float, str, str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _snapshot(self, expected: float) -> None:
+        """(потік-вартовий) Стек потоку event loop у момент блокування."""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()  # Від зовнішнього кадру до поточного
+        stack = "".join(traceback.format_list(traceback.extract_stack(frames[-1], limit=STACK_LIMIT)))
+        self._capture = (expected, _handler_of(frames), stack)
+
+    def _watch(self) -> None:
+        poll = max(self.threshold / 2, 0.01)
+        while not self._stopped.wait(poll):
+            expected = self._beat
+            capture = self._capture
+            if time.monotonic() - expected > self.threshold and (capture is None or capture[0] != expected):
+                self._snapshot(expected)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - self._beat, 0.0)
+            metrics.LOOP_LAG.observe(lag)
+            if lag > self.threshold:
+                self._report(lag)
+
+    def _report(self, lag: float) -> None:
+        capture = self._capture
+        if capture is not None and capture[0] == self._beat:
+            _, handler, stack = capture
+        else:
+            # Блокування закінчилося раніше, ніж вартовий встиг подивитися
+            handler, stack = "unknown", ""
+        metrics.LOOP_BLOCKED.inc(handler=handler)
+        logger.warning(
+            "Event loop заблоковано на %.0f мс (хендлер: %s).%s",
+            lag * 1000, handler, f"\nСтек у момент блокування:\n{stack}" if stack else "",
+        )
+
+    def start(self) -> None:
+        """Запускає серцебиття в поточному event loop і потік-вартовий."""
+        if not self.enabled or self._task:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(
+            "Монітор event loop: перевірка кожні %.0f мс, поріг %.0f мс.", self.interval * 1000, self.threshold * 1000
+        )
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
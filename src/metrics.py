@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.11) Мінімальні метрики у форматі Prometheus (без зовнішніх залежностей).
+
+Що міряємо:
+  - bot_updates_total{type}                        — вхідні апдейти (TypeHandler, група -1)
+  - bot_handler_duration_seconds{state,handler}    — латентність кожного кроку розмови
+  - bot_api_requests_total{method,status}          — виклики Bot API
+  - bot_api_request_duration_seconds{method}       — латентність Bot API
+  - pdf_render_duration_seconds{backend,outcome}   — рендер PDF по бекендах
+  - bot_active_sessions{flow}                      — активні сесії (policy/dpia/checklist)
+  - pdf_generation_queue_depth                     — генерації цього процесу, що чекають на пул
+                                                     рендера або рендеряться (>1 — лише завдяки
+                                                     паралельній обробці апдейтів, update_processor.py)
+  - bot_duplicate_updates_total{reason}            — відкинуті дублікати (v3.22, idempotency.py)
+  - bot_throttled_updates_total{type,action}       — ліміт частоти (v3.23, throttle.py)
+  - event_loop_lag_seconds                         — затримка планування event loop (v3.27, loop_monitor.py)
+  - event_loop_blocked_total{handler}              — блокування event loop понад поріг (v3.27)
+  - pdf_render_limit_exceeded_total{limit}         — рендери, зупинені лімітом процесу (v3.30)
+
+ВАЖЛИВО (Privacy by Design): у мітках НІКОЛИ не буває user_id, chat_id чи
+тексту відповідей — лише назви станів, хендлерів, методів API та бекендів.
+
+Ендпоінт /metrics вмикається змінною METRICS_PORT (слухає 127.0.0.1,
+адресу можна змінити через METRICS_HOST).
+"""
+
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import tracing
+
+logger = logging.getLogger("metrics")
+logger.setLevel(logging.INFO)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List["_Metric"] = []
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def expose(self) -> Iterable[str]:
+        yield from super().expose()
+        with _lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def set_function(self, callback: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """Значення обчислюється під час кожного scrape (напр., активні сесії)."""
+        self._callback = callback
+
+    def expose(self) -> Iterable[str]:
+        yield from super().expose()
+        with _lock:
+            values = dict(self._values)
+        if self._callback:
+            try:
+                values.update(self._callback())
+            except Exception as e:
+                logger.warning("Не вдалося обчислити %s: %s", self.name, e)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts по бакетах..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with _lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def expose(self) -> Iterable[str]:
+        yield from super().expose()
+        with _lock:
+            rows = {key: list(row) for key, row in self._values.items()}
+        for key, row in sorted(rows.items()):
+            for bound, count in zip(self.buckets, row):
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', repr(bound)))} {count}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {row[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {row[-1]}"
+
+
+# === Метрики бота ===
+
+UPDATES_TOTAL = Counter("bot_updates_total", "Вхідні апдейти за типом.", ["type"])
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Час виконання хендлера за станом розмови.", ["state", "handler", "outcome"]
+)
+API_REQUESTS = Counter("bot_api_requests_total", "Виклики Bot API за методом і HTTP-статусом.", ["method", "status"])
+API_LATENCY = Histogram("bot_api_request_duration_seconds", "Латентність викликів Bot API.", ["method"])
+RENDER_LATENCY = Histogram(
+    "pdf_render_duration_seconds", "Тривалість рендера PDF за бекендом.", ["backend", "outcome"]
+)
+ACTIVE_SESSIONS = Gauge("bot_active_sessions", "Активні (незавершені) сесії за воркфлоу.", ["flow"])
+GENERATION_QUEUE = Gauge(
+    "pdf_generation_queue_depth", "Генерації документів у цьому процесі, що чекають на пул рендера або рендеряться."
+)
+DUPLICATE_UPDATES = Counter(
+    "bot_duplicate_updates_total", "Відкинуті дублікати апдейтів за причиною (v3.22).", ["reason"]
+)
+THROTTLED_UPDATES = Counter(
+    "bot_throttled_updates_total",
+    "Апдейти, відкинуті лімітом частоти (dropped) або злиті з уже показаним блокувальником (coalesced).",
+    ["type", "action"],
+)
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Затримка планування event loop (v3.27).",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total", "Блокування event loop понад LOOP_LAG_THRESHOLD за хендлером (v3.27).", ["handler"]
+)
+RENDER_LIMIT_EXCEEDED = Counter(
+    "pdf_render_limit_exceeded_total",
+    "Рендери, зупинені лімітом ізольованого процесу: memory, cpu або output (v3.30).",
+    ["limit"],
+)
+
+
+def render_text() -> str:
+    """Повертає всі метрики у текстовому форматі Prometheus 0.0.4."""
+    with _lock:
+        metrics = list(_registry)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+# === Інструментування хендлерів ===
+
+def timed_callback(callback: Callable, state: str) -> Callable:
+    """Обгортає async-колбек хендлера: міряє латентність з міткою стану."""
+    handler_name = getattr(callback, "__name__", "unknown")
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            # (v3.12) Кожен хендлер — окремий спан у трейсі апдейту
+            with tracing.span(f"handler.{handler_name}", state=state):
+                return await callback(update, context)
+        except Exception as e:
+            # ApplicationHandlerStop — це керування потоком, а не помилка
+            if type(e).__name__ != "ApplicationHandlerStop":
+                outcome = "error"
+            raise
+        finally:
+            HANDLER_LATENCY.observe(
+                time.perf_counter() - started, state=state, handler=handler_name, outcome=outcome
+            )
+
+    return wrapper
+
+
+def instrument_handlers(handlers: Iterable, state: str) -> None:
+    """Обгортає `callback` кожного хендлера зі списку."""
+    for handler in handlers:
+        handler.callback = timed_callback(handler.callback, state)
+
+
+def instrument_conversation(conversation, state_names: Dict[int, str]) -> None:
+    """Інструментує entry points, усі стани та fallbacks ConversationHandler."""
+    instrument_handlers(conversation.entry_points, "ENTRY")
+    for state, handlers in conversation.states.items():
+        instrument_handlers(handlers, state_names.get(state, str(state)))
+    instrument_handlers(conversation.fallbacks, "FALLBACK")
+
+
+def update_kind(update) -> str:
+    """Тип апдейта для міток: callback_query | command | message | other."""
+    if update.callback_query:
+        return "callback_query"
+    if update.message:
+        return "command" if (update.message.text or "").startswith("/") else "message"
+    return "other"
+
+
+async def count_update(update, context) -> None:
+    """(група -1) Рахує апдейти за типом. Нічого не блокує і не змінює."""
+    UPDATES_TOTAL.inc(type=update_kind(update))
+
+
+def active_sessions_callback(application, flows: Dict[str, str]) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    """Рахує активні сесії за ключами user_data ('policy', 'dpia', 'cl')."""
+    def collect() -> Dict[Tuple[str, ...], float]:
+        counts = {(flow,): 0.0 for flow in flows.values()}
+        for data in list(application.user_data.values()):
+            for key, flow in flows.items():
+                if key in data:
+                    counts[(flow,)] += 1
+        return counts
+    return collect
+
+
+# === Bot API ===
+
+def instrumented_request_class():
+    """
+    Повертає підклас HTTPXRequest, що міряє кожен виклик Bot API.
+    (Імпорт усередині, щоб metrics.py можна було імпортувати без telegram, напр., у pdf_utils.)
+    """
+    from telegram.request import HTTPXRequest
+
+    class InstrumentedRequest(HTTPXRequest):
+        async def do_request(self, url, method, request_data=None, *args, **kwargs):
+            # URL = <base_url><token>/<method>; беремо лише назву методу (без токена!)
+            api_method = url.rsplit("/", 1)[-1] or "unknown"
+            started = time.perf_counter()
+            status = "error"
+            try:
+                code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+                status = str(code)
+                return code, payload
+            finally:
+                API_LATENCY.observe(time.perf_counter() - started, method=api_method)
+                API_REQUESTS.inc(method=api_method, status=status)
+
+    return InstrumentedRequest
+
+
+# === HTTP-ендпоінт ===
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Не засмічуємо лог кожним scrape
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Запускає /metrics у фоновому (daemon) потоці."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logger.info("Метрики доступні на http://%s:%s/metrics", host, port)
+    return server
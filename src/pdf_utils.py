@@ -6,13 +6,60 @@
   B) xhtml2pdf (pisa) — працює без зовнішніх бінарників (CSS дещо скромніший)
 
 Якщо жоден варіант недоступний — піднімається виняток із чіткою інструкцією, що встановити.
+
+(v3.16) `render_pdf_async` рендерить у пулі процесів (RENDER_WORKERS, за
+замовчуванням — кількість ядер; 0 — у потоці поточного процесу), тож
+важкий рендер не блокує event loop бота чи HTTP API.
+
+(v3.25) Воркери ігнорують SIGINT (Ctrl+C у терміналі б'є по всій групі
+процесів) — зупинку координує бот, даючи рендерам завершитися.
+`sweep_temp_pdfs` прибирає тимчасові PDF, що лишилися після збою.
+
+(v3.26) Тимчасові PDF живуть у спулі (`SPOOL`, див. `PdfSpool`): каталог на
+tmpfs (/dev/shm, PDF_SPOOL_DIR), непередбачувані імена, квота в байтах
+(PDF_SPOOL_QUOTA) з очікуванням місця, прибирання "сиріт" під час старту та
+періодично. Процеси, що ділять PDF_SPOOL_DIR (воркери диспетчера, демон
+рендера), пишуть кожен у свій підкаталог <pid> і отримують 1/PDF_SPOOL_PROCESSES
+квоти — разом вони не перевищують PDF_SPOOL_QUOTA. Після рендера файл відкривається й одразу втрачає ім'я — дані
+живуть, доки відкритий дескриптор, і зникають навіть після краху процесу.
+
+(v3.29) Рендер можна винести в окремий демон (`render_daemon.py`, Unix-сокет
+RENDER_SOCKET) і масштабувати його процеси незалежно від бота; без демона —
+рендер у власному пулі. Кожен рендер має дедлайн RENDER_DEADLINE.
+
+(v3.30) Кожен документ рендериться в окремому дочірньому процесі (форк від
+forkserver, де вже імпортовано бекенди) з rlimit-ами: адресний простір
+(RENDER_MAX_MEMORY_MB, 768), процесорний час (RENDER_MAX_CPU_SECONDS, 30) і
+розмір файлу (RENDER_MAX_OUTPUT_MB, 25); 0 — без ліміту. Патологічний документ
+(тисячі рядків нотаток, гігантська таблиця) падає з `RenderLimitExceeded` і
+зрозумілим користувачу текстом, а не роздуває пам'ять і не вбиває сусідів.
+RENDER_ISOLATION=0 — постійні воркери без лімітів (як до v3.30). wkhtmltopdf
+успадковує ліміти — йому може знадобитися більший RENDER_MAX_MEMORY_MB.
 """
 
+import asyncio
+import contextlib
+import errno
+import gc
 import logging
+import multiprocessing
 import os
-from typing import Optional
+import re
+import signal
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+# (v3.14) markdown2 та бекенди рендера імпортуються ліниво — під час прогріву
+# (`warm_up_renderer`) або першого рендера, а не під час старту бота.
 
-import markdown2
+# (v3.11) Метрики тривалості рендера по бекендах
+from metrics import RENDER_LATENCY, RENDER_LIMIT_EXCEEDED
+# (v3.12) Спани трасування (no-op, якщо трасування вимкнене)
+import tracing
 
 logger = logging.getLogger("pdf_utils")
 logger.setLevel(logging.INFO)
@@ -86,8 +133,20 @@ PDF_CSS_STYLE = """
 </style>
 """
 
+def _raise_if_limit(e: BaseException) -> None:
+    """(v3.30) Ліміт ізольованого процесу — не привід пробувати наступний бекенд."""
+    if isinstance(e, RenderLimitExceeded):
+        raise e
+    if isinstance(e, MemoryError) and _worker_limits.get("memory"):
+        raise RenderLimitExceeded("memory", _worker_limits.get("memory")) from None
+    if isinstance(e, OSError) and e.errno == errno.EFBIG and _worker_limits.get("output"):
+        # RLIMIT_FSIZE: і сам PDF, і тимчасові файли бекенда (xhtml2pdf пише туди HTML)
+        raise RenderLimitExceeded("output", _worker_limits.get("output")) from None
+
+@tracing.traced("pdf.md_to_html")
 def _md_to_html(md_content: str) -> str:
     """Конвертує Markdown (з нашими шаблонами v2.8) в HTML."""
+    import markdown2
     html_body = markdown2.markdown(
         md_content,
         extras=["tables", "fenced-code-blocks", "strike", "cuddled-lists", "break-on-newline"]
@@ -106,7 +165,7 @@ def _generate_with_pdfkit(html_full: str, output_filename: str) -> bool:
         wkhtmltopdf_path_env = os.getenv("WKHTMLTOPDF_CMD")
         config = None
         if wkhtmltopdf_path_env and os.path.exists(wkhtmltopdf_path_env):
-            logger.info(f"Використовую wkhtmltopdf з WKHTMLTOPDF_CMD: {wkhtmltopdf_path_env}")
+            logger.info("Використовую wkhtmltopdf з WKHTMLTOPDF_CMD: %s", wkhtmltopdf_path_env)
             config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path_env)
         
         options = {
@@ -123,13 +182,15 @@ def _generate_with_pdfkit(html_full: str, output_filename: str) -> bool:
         return True
     
     except IOError as e:
+        _raise_if_limit(e)
         if "No wkhtmltopdf executable found" in str(e):
             logger.warning("wkhtmltopdf не знайдено у PATH. Спроба 2: xhtml2pdf...")
         else:
-            logger.error(f"pdfkit впав з помилкою вводу-виводу: {e}")
+            logger.error("pdfkit впав з помилкою вводу-виводу: %s", e)
         return False
     except Exception as e:
-        logger.error(f"pdfkit впав з невідомою помилкою: {e}")
+        _raise_if_limit(e)
+        logger.error("pdfkit впав з невідомою помилкою: %s", e)
         return False
 
 def _generate_with_xhtml2pdf(html_full: str, output_filename: str) -> bool:
@@ -152,47 +213,650 @@ def _generate_with_xhtml2pdf(html_full: str, output_filename: str) -> bool:
             logger.info("PDF успішно створено через xhtml2pdf.")
             return True
         else:
-            logger.error(f"xhtml2pdf впав з помилкою: {pisa_status.err}")
+            logger.error("xhtml2pdf впав з помилкою: %s", pisa_status.err)
             return False
             
     except Exception as e:
-        logger.warning(f"xhtml2pdf впав: {e}")
+        _raise_if_limit(e)
+        logger.warning("xhtml2pdf впав: %s", e)
         return False
 
-def create_pdf_from_markdown(content: str, is_html: bool, output_filename: str) -> str:
+# (v3.14) Черга бекендів. Після `warm_up_renderer()` містить лише ті, що реально
+# працюють у цьому оточенні (напр., без зайвої спроби wkhtmltopdf на кожен PDF).
+_BACKENDS: List[Tuple[str, Callable[[str, str], bool]]] = [
+    ("wkhtmltopdf", _generate_with_pdfkit),
+    ("xhtml2pdf", _generate_with_xhtml2pdf),
+]
+_available_backends: Optional[List[Tuple[str, Callable[[str, str], bool]]]] = None
+
+WARM_UP_MARKDOWN = """# Прогрів
+
+| Питання | Відповідь |
+| :--- | :--- |
+| Назва проєкту: | Privacy Sentry |
+"""
+
+def _probe_pdfkit() -> bool:
+    """Чи є pdfkit і бінарник wkhtmltopdf (без реального рендера)."""
+    pdfkit = _try_import_pdfkit()
+    if not pdfkit:
+        return False
+    try:
+        wkhtmltopdf_path_env = os.getenv("WKHTMLTOPDF_CMD")
+        if wkhtmltopdf_path_env and os.path.exists(wkhtmltopdf_path_env):
+            pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path_env)
+        else:
+            pdfkit.configuration()
+        return True
+    except (IOError, OSError):
+        return False
+
+def warm_up_renderer(sample_markdown: Optional[str] = None) -> List[str]:
     """
-    (ОНОВЛЕНО v2.9)
-    Генерує *PDF-файл* з Markdown.
-    Повертає шлях до PDF (output_filename). Якщо PDF створити не вийшло — піднімає виняток з інструкцією.
+    (v3.14) Фаза 2 старту (викликається у фоні з post_init бота):
+    імпортує markdown2 та бекенди, перевіряє, які з них працюють, запам'ятовує
+    їх порядок і рендерить пробний документ, щоб перший справжній PDF не платив
+    за імпорт/ініціалізацію (xhtml2pdf + reportlab — це сотні мс).
+    Повертає назви робочих бекендів.
     """
-    logger.info(f"Старт генерації PDF (v2.9 Гібрид): {output_filename}")
-    # is_html ігнорується, ми завжди передаємо Markdown з v2.8
-    html_full = _md_to_html(content)
+    global _available_backends
+    started = time.perf_counter()
+    html_full = _md_to_html(sample_markdown or WARM_UP_MARKDOWN)
 
-    # A) wkhtmltopdf (краща якість)
-    if _generate_with_pdfkit(html_full, output_filename):
-        logger.info(f"PDF створено через wkhtmltopdf: {output_filename}")
-        return output_filename
+    available = []
+    if _probe_pdfkit():
+        available.append(_BACKENDS[0])
+    if _try_import_xhtml2pdf():
+        available.append(_BACKENDS[1])
+
+    # Пробний рендер: відкидаємо бекенд, якщо він імпортується, але не працює
+    working = []
+    fd, probe_path = tempfile.mkstemp(prefix="warmup_", suffix=".pdf")
+    os.close(fd)
+    try:
+        for i, backend in enumerate(available):
+            if backend[1](html_full, probe_path):
+                # Наступні лишаємо як запасні (без пробного рендера — він не потрібен)
+                working = available[i:]
+                break
+            logger.warning("Бекенд %s не пройшов пробний рендер — відкидаю.", backend[0])
+    finally:
+        clear_temp_file(probe_path)
+
+    _available_backends = working
+    names = [name for name, _ in working]
+    logger.info("Прогрів рендера завершено за %.0f мс. Бекенди: %s",
+                (time.perf_counter() - started) * 1000, ", ".join(names) or "НЕМАЄ")
+    return names
 
-    # B) xhtml2pdf (без зовнішніх бінарників)
-    if _generate_with_xhtml2pdf(html_full, output_filename):
-        logger.info(f"PDF створено через xhtml2pdf: {output_filename}")
+def _attempt_backends(html_full: str, output_filename: str) -> List[Tuple[str, float, bool]]:
+    """
+    Пробує бекенди по черзі до першого успіху:
+    A) wkhtmltopdf (краща якість), B) xhtml2pdf (без зовнішніх бінарників).
+    Після прогріву пробуємо лише ті, що працюють.
+    Повертає спроби [(бекенд, секунди, успіх)] — їх записує в метрики
+    процес бота (спроба могла виконуватись у воркері пулу).
+    """
+    attempts = []
+    # (v3.14) Порожній список після прогріву — робочих бекендів немає, а не "ще не прогріто"
+    for backend, generate in _BACKENDS if _available_backends is None else _available_backends:
+        started = time.perf_counter()
+        with tracing.span("pdf.backend", backend=backend) as span:
+            ok = generate(html_full, output_filename)
+            span.set(ok=ok)
+        attempts.append((backend, time.perf_counter() - started, ok))
+        if ok:
+            break
+    return attempts
+
+def _finish_render(attempts: List[Tuple[str, float, bool]], output_filename: str) -> str:
+    """(v3.11) Записує тривалість спроб у метрики; повертає шлях або піднімає виняток."""
+    for backend, seconds, ok in attempts:
+        RENDER_LATENCY.observe(seconds, backend=backend, outcome="ok" if ok else "failed")
+
+    if attempts and attempts[-1][2]:
+        logger.info("PDF створено через %s: %s", attempts[-1][0], output_filename)
         return output_filename
 
-    # Обидва варіанти недоступні → пояснюємо, що встановити
+    # Жоден варіант недоступний → пояснюємо, що встановити
     raise Exception(
         "Не вдалося створити PDF.\n\n"
         "**Варіант A (рекомендовано):** Встановіть `wkhtmltopdf` у вашій системі (напр., `sudo apt install wkhtmltopdf`).\n"
         "**Варіант B (запасний):** Встановіть `xhtml2pdf` (`pip install xhtml2pdf`)."
     )
 
+@tracing.traced("pdf.render")
+def create_pdf_from_markdown(content: str, is_html: bool, output_filename: str) -> str:
+    """
+    (ОНОВЛЕНО v3.14)
+    Генерує *PDF-файл* з Markdown.
+    Повертає шлях до PDF (output_filename). Якщо PDF створити не вийшло — піднімає виняток з інструкцією.
+    """
+    logger.info("Старт генерації PDF (v2.9 Гібрид): %s", output_filename)
+    # is_html ігнорується, ми завжди передаємо Markdown з v2.8
+    html_full = _md_to_html(content)
+    return _finish_render(_attempt_backends(html_full, output_filename), output_filename)
+
+# === (v3.16) Пул процесів рендера ===
+# Рендер — це CPU-робота на сотні мс, яка раніше блокувала event loop бота.
+# Пул спільний для бота та HTTP API (`http_api.py`); RENDER_WORKERS=0 —
+# рендер у потоці поточного процесу (без пулу).
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_workers = 0
+_render_pool_isolated = False
+# (v3.30) Робочі бекенди з прогріву — для свіжих процесів, що прогріву не бачили
+_pool_backends: Optional[List[str]] = None
+
+# Модулі, які forkserver імпортує один раз: свіжий процес на кожен документ
+# тоді коштує десятки мс, а не сотні (імпорт xhtml2pdf + reportlab)
+_FORKSERVER_PRELOAD = ["pdf_utils", "markdown2", "xhtml2pdf.pisa"]
+
+_MB = 1024 * 1024
+
+class RenderLimitExceeded(RuntimeError):
+    """
+    (v3.30) Рендер перевищив ліміт ізольованого процесу (`limit`: memory, cpu
+    або output) чи демона рендера (input). `str()` — повідомлення для користувача.
+    """
+
+    MESSAGES = {
+        "memory": "Документ завеликий: на його рендер забракло пам'яті (ліміт {value} МБ).",
+        "cpu": "Документ рендерився надто довго (ліміт {value} с процесорного часу).",
+        "output": "Документ завеликий: рендер перевищив ліміт розміру файлу ({value} МБ).",
+        "input": "Документ завеликий для рендера (понад {value} КБ тексту).",
+    }
+
+    def __init__(self, limit: str, value: Optional[int] = None):
+        super().__init__(limit, value)
+        self.limit = limit
+        self.value = value
+
+    def __str__(self) -> str:
+        message = self.MESSAGES.get(self.limit, "Документ перевищив ліміт рендера.").format(value=self.value)
+        return f"{message} Скоротіть найдовші відповіді (нотатки, таблиці) і спробуйте ще раз."
+
+def render_limits() -> Dict[str, int]:
+    """(v3.30) Ліміти процесу рендера: МБ пам'яті, с CPU, МБ файлу (0 — без ліміту)."""
+    return {
+        "memory": int(os.getenv("RENDER_MAX_MEMORY_MB", 768)),
+        "cpu": int(os.getenv("RENDER_MAX_CPU_SECONDS", 30)),
+        "output": int(os.getenv("RENDER_MAX_OUTPUT_MB", 25)),
+    }
+
+# Ліміти, застосовані в цьому процесі (лише в ізольованому воркері)
+_worker_limits: Dict[str, int] = {}
+# Готові винятки лімітів: коли пам'ять вичерпано, новий об'єкт може й не створитися
+_limit_errors: Dict[str, RenderLimitExceeded] = {}
+
+def _on_cpu_limit(signum, frame) -> None:
+    raise RenderLimitExceeded("cpu", _worker_limits.get("cpu"))
+
+def _apply_render_limits(limits: Dict[str, int]) -> None:
+    """(v3.30) rlimit-и воркера. Процес рендерить один документ і завершується."""
+    import resource
+    _worker_limits.update(limits)
+    _limit_errors.update({limit: RenderLimitExceeded(limit, value) for limit, value in limits.items() if value})
+    if limits.get("memory"):
+        # Адресний простір: алокація понад ліміт — MemoryError, а не OOM-killer для всього хоста
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory"] * _MB,) * 2)
+    if limits.get("cpu"):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + limits["cpu"]
+        # М'який ліміт — SIGXCPU і чиста помилка; жорсткий (SIGKILL) — якщо обробник не встиг
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 5))
+    if limits.get("output"):
+        # Запис понад ліміт — OSError(EFBIG), а не вбивство процесу сигналом SIGXFSZ
+        signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+        resource.setrlimit(resource.RLIMIT_FSIZE, (limits["output"] * _MB,) * 2)
+
+def _init_render_worker(quiet: bool = False, limits: Optional[Dict[str, int]] = None) -> None:
+    """Ініціалізація воркера: лише попередження у stderr (або тиша для CLI)."""
+    # (v3.25) Ctrl+C не вбиває рендер посеред документа — зупинку веде батьківський процес
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if quiet:
+        logging.disable(logging.WARNING)
+    else:
+        logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.WARNING)
+        # Попередження xhtml2pdf про CSS/шрифти на КОЖЕН документ — не корисні
+        logging.getLogger("xhtml2pdf").setLevel(logging.ERROR)
+    if limits:
+        _apply_render_limits(limits)
+
+def create_render_pool(workers: int, quiet: bool = False, isolate: bool = False) -> ProcessPoolExecutor:
+    """
+    Створює пул рендера. Використовуємо forkserver, а не fork: у батьківському
+    процесі працюють потоки (логування, трасування, сховище сесій), і fork
+    посеред їх роботи може успадкувати захоплені локи.
+    (v3.30) `isolate` — новий процес із `render_limits()` на кожен документ.
+    """
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(_FORKSERVER_PRELOAD)
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_render_worker,
+        initargs=(quiet, render_limits() if isolate else None), max_tasks_per_child=1 if isolate else None,
+    )
+
+def get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """Спільний пул (створюється ліниво). None, якщо RENDER_WORKERS=0."""
+    global _render_pool, _render_pool_workers, _render_pool_isolated
+    if _render_pool is None:
+        workers = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+        if workers <= 0:
+            return None
+        _render_pool_isolated = os.getenv("RENDER_ISOLATION", "1") != "0"
+        _render_pool = create_render_pool(workers, isolate=_render_pool_isolated)
+        _render_pool_workers = workers
+        logger.info(
+            "Пул рендера: %s процес(ів)%s.", workers,
+            ", процес на документ, ліміти %s" % render_limits() if _render_pool_isolated else "",
+        )
+    return _render_pool
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=True, cancel_futures=True)
+        _render_pool = None
+
+def _render_job(
+    content: str, output_filename: str, backends: Optional[List[str]] = None
+) -> List[Tuple[str, float, bool]]:
+    """Виконується у воркері пулу. (v3.30) `backends` — робочі бекенди з прогріву."""
+    global _available_backends
+    if backends is not None and _available_backends is None:
+        _available_backends = [backend for backend in _BACKENDS if backend[0] in backends]
+    exceeded = None
+    try:
+        attempts = _attempt_backends(_md_to_html(content), output_filename)
+    except RenderLimitExceeded as e:
+        exceeded = e.limit
+    except MemoryError:
+        exceeded = "memory"
+    except OSError as e:
+        _raise_if_limit(e)
+        raise
+    if exceeded:
+        # Поза блоком except: traceback з кадрами рендера (HTML, дерево документа)
+        # уже звільнено, і результат воркера є чим серіалізувати. Інакше воркер
+        # падає в `_sendback_result`, а бот бачить лише BrokenProcessPool.
+        gc.collect()
+        raise _limit_errors.get(exceeded) or RenderLimitExceeded(exceeded, _worker_limits.get(exceeded))
+    output = _worker_limits.get("output")
+    if output and not (attempts and attempts[-1][2]):
+        # wkhtmltopdf — окремий процес: його EFBIG видно лише за розміром недописаного файлу
+        with contextlib.suppress(OSError):
+            if os.path.getsize(output_filename) >= output * _MB:
+                raise RenderLimitExceeded("output", output)
+    return attempts
+
+class RenderDeadlineExceeded(RuntimeError):
+    """(v3.29) Документ не встиг відрендеритися за RENDER_DEADLINE секунд."""
+
+class RenderDaemonUnavailable(ConnectionError):
+    """(v3.29) Демона рендера немає (сокет відсутній) або з'єднання з ним обірвалося."""
+
+class RenderDaemonBusy(RenderDaemonUnavailable):
+    """(v3.29) Демон живий, але цього разу не взяв завдання (переповнено спул PDF)."""
+
+def render_deadline() -> float:
+    """(v3.29) Дедлайн одного рендера, с (RENDER_DEADLINE, за замовчуванням 60)."""
+    return float(os.getenv("RENDER_DEADLINE", 60))
+
+async def render_pdf_local(content: str, output_filename: str) -> str:
+    """
+    (v3.16) Рендер у пулі процесів поточного процесу (або в потоці, якщо пулу немає).
+    Event loop вільний, поки документ рендериться.
+    """
+    global _render_pool
+    pool = get_render_pool()
+    if pool is None:
+        return await asyncio.to_thread(create_pdf_from_markdown, content, False, output_filename)
+
+    logger.info("Старт генерації PDF (пул): %s", output_filename)
+    with tracing.span("pdf.render", pool=True):
+        try:
+            job = asyncio.get_running_loop().run_in_executor(
+                pool, _render_job, content, output_filename, _pool_backends
+            )
+            # (v3.29) Дедлайн звільняє того, хто чекає; сам воркер дорендерить документ
+            attempts = await asyncio.wait_for(job, render_deadline())
+        except asyncio.TimeoutError:
+            raise RenderDeadlineExceeded(f"Рендер не завершився за {render_deadline():.0f} с.") from None
+        except RenderLimitExceeded as e:
+            RENDER_LIMIT_EXCEEDED.inc(limit=e.limit)
+            logger.warning("Рендер %s зупинено лімітом: %s (%s).", output_filename, e.limit, e.value)
+            raise
+        except BrokenProcessPool:
+            # Воркер упав (напр., OOM) — наступний рендер створить новий пул
+            logger.error("Пул рендера зламано, буде створено новий.")
+            if _render_pool is pool:
+                _render_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            if _render_pool_isolated and render_limits()["memory"]:
+                # (v3.30) Ізольований воркер гине з ліміту пам'яті, не встигнувши
+                # відповісти (MemoryError поза нашим кодом) — це той самий ліміт
+                RENDER_LIMIT_EXCEEDED.inc(limit="memory")
+                logger.warning("Рендер %s: воркер пулу загинув — вважаю лімітом пам'яті.", output_filename)
+                raise RenderLimitExceeded("memory", render_limits()["memory"]) from None
+            raise
+    return _finish_render(attempts, output_filename)
+
+# === (v3.29) Окремий демон рендера (render_daemon.py) ===
+# Якщо задано RENDER_SOCKET, рендер іде в демон через Unix-сокет (пул з'єднань
+# `render_daemon.RenderClient`); якщо демона немає — у власному пулі процесу,
+# а повторна спроба підключитися буде не раніше ніж за RENDER_DAEMON_RETRY секунд.
+
+_render_client = None
+
+def _get_render_client():
+    global _render_client
+    socket_path = os.getenv("RENDER_SOCKET")
+    if not socket_path:
+        return None
+    if _render_client is None:
+        from render_daemon import RenderClient
+        _render_client = RenderClient(socket_path)
+    return _render_client
+
+async def _render_via_daemon(client, content: str, output_filename: str) -> str:
+    started = time.perf_counter()
+    outcome = "failed"
+    try:
+        with tracing.span("pdf.render", daemon=True):
+            pdf_bytes = await client.render(content, render_deadline())
+        outcome = "ok"
+    except RenderLimitExceeded as e:
+        # (v3.30) Ліміт спрацював у демоні — у метриках бота теж
+        RENDER_LIMIT_EXCEEDED.inc(limit=e.limit)
+        raise
+    finally:
+        RENDER_LATENCY.observe(time.perf_counter() - started, backend="daemon", outcome=outcome)
+    with open(output_filename, "wb") as f:
+        f.write(pdf_bytes)
+    logger.info("PDF створено демоном рендера: %s", output_filename)
+    return output_filename
+
+async def render_pdf_async(content: str, output_filename: str) -> str:
+    """
+    (v3.16) Асинхронний рендер: event loop вільний, поки документ рендериться.
+    (v3.29) У демоні рендера, якщо він налаштований і доступний, інакше — локально.
+    """
+    client = _get_render_client()
+    if client is not None and client.available:
+        try:
+            return await _render_via_daemon(client, content, output_filename)
+        except RenderDaemonBusy as e:
+            # Демон не вважаємо недоступним: наступні документи знову підуть до нього
+            logger.warning("Демон рендера зайнятий (%s) — цей документ рендерю в цьому процесі.", e)
+        except RenderDaemonUnavailable as e:
+            logger.warning("Демон рендера недоступний (%s) — рендерю в цьому процесі.", e)
+    return await render_pdf_local(content, output_filename)
+
+async def close_render_client() -> None:
+    """(v3.29) Закриває з'єднання з демоном рендера (під час зупинки)."""
+    global _render_client
+    if _render_client is not None:
+        await _render_client.close()
+        _render_client = None
+
+def warm_up_render_pool(sample_markdown: Optional[str] = None) -> List[str]:
+    """(v3.16) Прогріває кожен воркер пулу (або поточний процес, якщо пулу немає)."""
+    socket_path = os.getenv("RENDER_SOCKET")
+    if socket_path and os.path.exists(socket_path):
+        # (v3.29) Рендерить демон (він прогрівається сам) — локальний пул не створюємо
+        return []
+    global _pool_backends
+    pool = get_render_pool()
+    if pool is None:
+        return warm_up_renderer(sample_markdown)
+    # (v3.30) Ізольований процес живе один документ — прогрівати кожен воркер марно,
+    # достатньо дізнатися робочі бекенди (forkserver уже імпортував їх)
+    count = 1 if _render_pool_isolated else _render_pool_workers
+    futures = [pool.submit(warm_up_renderer, sample_markdown) for _ in range(count)]
+    _pool_backends = [future.result() for future in futures][0]
+    return _pool_backends
+
+@tracing.traced("pdf.clear_temp_file")
 def clear_temp_file(filepath: str):
     """Видаляє тимчасовий PDF-файл після надсилання."""
     try:
         if os.path.exists(filepath):
             os.remove(filepath)
-            logger.info(f"Тимчасовий файл видалено: {filepath}")
+            logger.info("Тимчасовий файл видалено: %s", filepath)
         else:
-            logger.warning(f"TІMЧАСОВИЙ ФАЙЛ НЕ ЗНАЙДЕНО для видалення: {filepath}")
+            logger.warning("TІMЧАСОВИЙ ФАЙЛ НЕ ЗНАЙДЕНО для видалення: %s", filepath)
     except Exception as e:
-        logger.error(f"Помилка під час видалення тимчасового файлу {filepath}: {e}")
\ No newline at end of file
+        logger.error("Помилка під час видалення тимчасового файлу %s: %s", filepath, e)
+
+# (v3.25) Тимчасові PDF бота: policy_<id>.pdf, dpia_<id>.pdf, kit_checklist_<id>.pdf, ...
+_TEMP_PDF_RE = re.compile(r"^(?:kit_)?(?:policy|dpia|checklist)_\d+\.pdf$")
+
+def sweep_temp_pdfs(directory: str = ".") -> int:
+    """(v3.25) Видаляє тимчасові PDF, що лишилися після збою чи перерваної генерації."""
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError as e:
+        logger.warning("Не вдалося переглянути %s: %s", directory, e)
+        return 0
+    for name in names:
+        if _TEMP_PDF_RE.match(name):
+            try:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+            except OSError as e:
+                logger.warning("Не вдалося видалити тимчасовий файл %s: %s", name, e)
+    if removed:
+        logger.info("Прибрано тимчасових PDF: %s", removed)
+    return removed
+
+# === (v3.26) Спул тимчасових документів ===
+# Раніше PDF з відповідями лежали в робочому каталозі як `policy_{user_id}.pdf`
+# і лишалися там назавжди, якщо процес падав між рендером і clear_temp_file.
+
+class SpoolFullError(RuntimeError):
+    """Квоту спулу вичерпано, і місце не звільнилося за PDF_SPOOL_WAIT секунд."""
+
+
+def _default_spool_dir() -> str:
+    # tmpfs: файли не торкаються диска і зникають після перезавантаження
+    base = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, "privacy_sentry_spool")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SpoolFile:
+    """Файл у спулі. `path` — для рендера; `open()` відкриває його і одразу прибирає ім'я."""
+
+    def __init__(self, spool: "PdfSpool", path: str):
+        self.spool = spool
+        self.path = path
+        self._handle: Optional[BinaryIO] = None
+
+    def open(self) -> BinaryIO:
+        """Відкриває готовий PDF і видаляє ім'я: дані живуть, доки відкритий дескриптор."""
+        if self._handle is None:
+            self._handle = open(self.path, "rb")
+            self.spool._account(self.path, os.fstat(self._handle.fileno()).st_size)
+            self.spool._unlink(self.path)
+        self._handle.seek(0)
+        return self._handle
+
+    def read(self) -> bytes:
+        return self.open().read()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        self.spool._unlink(self.path)
+
+
+class PdfSpool:
+    """
+    Каталог для тимчасових PDF з квотою. Кожен файл займає PDF_SPOOL_RESERVE
+    байт (оцінка) до рендера і свій справжній розмір після — поки його не закрито.
+    Якщо квоту вичерпано, новий файл чекає (не довше PDF_SPOOL_WAIT), тож при
+    сплеску навантаження пам'ять tmpfs обмежена, а зайві рендери стають у чергу.
+
+    Файли з імені втрачають ім'я ще до закриття, тож зайнятість каталогу не
+    порахувати через `scandir`. Тому квота ділиться: кожен процес пише в
+    `<root>/<pid>` і рахує лише своє — `quota` = PDF_SPOOL_QUOTA / PDF_SPOOL_PROCESSES
+    (скільки процесів ділять каталог; диспетчер задає це своїм воркерам).
+    """
+
+    def __init__(self, directory: Optional[str] = None, quota: Optional[int] = None,
+                 reserve: Optional[int] = None, wait: Optional[float] = None, max_age: Optional[float] = None,
+                 processes: Optional[int] = None):
+        self.root = directory or os.getenv("PDF_SPOOL_DIR") or _default_spool_dir()
+        self.processes = max(1, int(os.getenv("PDF_SPOOL_PROCESSES", 1)) if processes is None else processes)
+        total = int(os.getenv("PDF_SPOOL_QUOTA", 64 * 1024 * 1024)) if quota is None else quota
+        self.quota = total // self.processes
+        self.reserve = int(os.getenv("PDF_SPOOL_RESERVE", 1024 * 1024)) if reserve is None else reserve
+        self.wait = float(os.getenv("PDF_SPOOL_WAIT", 30)) if wait is None else wait
+        self.max_age = float(os.getenv("PDF_SPOOL_MAX_AGE", 15 * 60)) if max_age is None else max_age
+        self._sizes: Dict[str, int] = {}  # Файли цього процесу -> зарезервовано байт
+        self._freed: Optional[asyncio.Condition] = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @property
+    def directory(self) -> str:
+        """Підкаталог цього процесу (pid — на момент виклику, тож і після fork)."""
+        return os.path.join(self.root, str(os.getpid()))
+
+    @property
+    def used(self) -> int:
+        return sum(self._sizes.values())
+
+    def _ensure_dir(self) -> None:
+        # mode діє лише на останній каталог шляху — корінь створюємо окремо
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def _account(self, path: str, size: int) -> None:
+        if path in self._sizes:
+            self._sizes[path] = size
+
+    def _unlink(self, path: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._freed is None:
+            self._freed = asyncio.Condition()
+        return self._freed
+
+    @contextlib.asynccontextmanager
+    async def file(self, prefix: str = "doc") -> AsyncIterator[SpoolFile]:
+        """`async with SPOOL.file("policy") as pdf:` — рендер у `pdf.path`, надсилання `pdf.open()`."""
+        freed = self._condition()
+        async with freed:
+            try:
+                await asyncio.wait_for(
+                    freed.wait_for(lambda: self.used + self.reserve <= self.quota or not self._sizes), self.wait
+                )
+            except asyncio.TimeoutError:
+                raise SpoolFullError(
+                    f"Спул PDF переповнено ({self.used} з {self.quota} байт), спробуйте за хвилину."
+                ) from None
+            self._ensure_dir()
+            path = os.path.join(self.directory, f"{prefix}_{os.getpid()}_{uuid.uuid4().hex}.pdf")
+            self._sizes[path] = self.reserve
+
+        spool_file = SpoolFile(self, path)
+        try:
+            yield spool_file
+        finally:
+            spool_file.close()
+            async with freed:
+                self._sizes.pop(path, None)
+                freed.notify_all()
+
+    def _sweep_dir(self, directory: str, owner: int, now: float) -> Tuple[int, bool]:
+        """Прибирає "сиріт" в одному каталозі; (скільки видалено, чи каталог тепер порожній)."""
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return 0, False
+        removed, left = 0, 0
+        for entry in entries:
+            if entry.path in self._sizes or not entry.name.endswith(".pdf"):
+                left += 1
+                continue
+            file_owner = owner
+            if not file_owner:
+                # Файли в корені (старий формат, без підкаталогів): власник — у назві файлу
+                try:
+                    file_owner = int(entry.name.rsplit("_", 2)[-2])
+                except (IndexError, ValueError):
+                    file_owner = 0
+            try:
+                stale = now - entry.stat().st_mtime > self.max_age
+            except FileNotFoundError:
+                continue
+            if file_owner == os.getpid() or not file_owner or not _pid_alive(file_owner) or stale:
+                self._unlink(entry.path)
+                removed += 1
+            else:
+                left += 1
+        return removed, not left
+
+    def sweep_orphans(self) -> int:
+        """
+        Видаляє файли, яких не відстежує цей процес і чий процес-власник мертвий
+        або які застаріли; порожні підкаталоги мертвих процесів теж.
+        """
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        removed, _ = self._sweep_dir(self.root, 0, now)
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False) or not entry.name.isdigit():
+                continue
+            owner = int(entry.name)
+            count, empty = self._sweep_dir(entry.path, owner, now)
+            removed += count
+            if empty and owner != os.getpid() and not _pid_alive(owner):
+                with contextlib.suppress(OSError):
+                    os.rmdir(entry.path)
+        if removed:
+            logger.info("Спул: прибрано файлів-сиріт: %s", removed)
+        return removed
+
+    async def _sweep_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.sweep_orphans)
+
+    def start_sweeper(self, interval: Optional[float] = None) -> None:
+        """Прибирання "сиріт" одразу і далі кожні PDF_SPOOL_SWEEP_INTERVAL секунд (300)."""
+        interval = interval or float(os.getenv("PDF_SPOOL_SWEEP_INTERVAL", 300))
+        self.sweep_orphans()
+        self._sweeper = asyncio.get_running_loop().create_task(self._sweep_periodically(interval))
+
+    async def stop_sweeper(self) -> None:
+        if self._sweeper:
+            self._sweeper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sweeper
+            self._sweeper = None
+        # Порожній підкаталог процесу не лишаємо (непорожній прибере наступний старт)
+        with contextlib.suppress(OSError):
+            os.rmdir(self.directory)
+
+
+# Спільний спул процесу (бот і HTTP API)
+SPOOL = PdfSpool()
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.29) Окремий демон рендера PDF на Unix-сокеті.
+
+Рендер (CPU, сотні мс, сотні МБ пам'яті на воркер) і робота з Telegram (I/O,
+тисячі дрібних запитів) мають зовсім різні профілі ресурсів. Демон забирає
+рендер з процесу бота: його пул процесів (`pdf_utils`, --workers) масштабується
+окремо, а кілька ботів / воркерів диспетчера / HTTP API можуть ділити один демон.
+
+Протокол (компактний, двійковий, по одному завданню на з'єднання за раз):
+  запит:   REQUEST  = !BfI (версія, дедлайн у секундах, довжина) + Markdown (UTF-8)
+  відповідь: RESPONSE = !BI  (статус, довжина) + PDF (OK) або текст помилки (UTF-8)
+Статуси: 0 — OK, 1 — рендер не вдався, 2 — дедлайн вичерпано,
+3 — ліміт процесу рендера (v3.30; тіло — "ліміт:значення", напр. "memory:768"),
+4 — демон зайнятий: переповнено його спул PDF (клієнт рендерить цей документ
+сам, але демон недоступним не вважає).
+
+Бік бота — `RenderClient`: пул до RENDER_DAEMON_CONNECTIONS (4) з'єднань,
+що перевикористовуються. Якщо сокета немає або з'єднання обірвалося —
+`RenderDaemonUnavailable`, і `pdf_utils.render_pdf_async` рендерить у власному
+процесі, а демон знову пробує не раніше ніж за RENDER_DAEMON_RETRY секунд (30).
+
+Спул PDF (v3.26): якщо демон і боти ділять PDF_SPOOL_DIR, задайте демону той
+самий PDF_SPOOL_PROCESSES (кількість процесів, що ділять каталог), що й ботам:
+кожен процес отримує свою частку PDF_SPOOL_QUOTA.
+
+Запуск:
+    python render_daemon.py --socket /run/privacy-sentry/render.sock --workers 4
+    RENDER_SOCKET=/run/privacy-sentry/render.sock python bot.py
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import pdf_utils
+from logging_setup import configure_logging
+from pdf_utils import (
+    RenderDaemonBusy,
+    RenderDaemonUnavailable,
+    RenderDeadlineExceeded,
+    RenderLimitExceeded,
+    SpoolFullError,
+)
+
+logger = logging.getLogger("render_daemon")
+logger.setLevel(logging.INFO)
+
+PROTOCOL_VERSION = 1
+REQUEST = struct.Struct("!BfI")
+RESPONSE = struct.Struct("!BI")
+STATUS_OK, STATUS_FAILED, STATUS_DEADLINE, STATUS_LIMIT, STATUS_BUSY = 0, 1, 2, 3, 4
+
+# Markdown документа — десятки КБ; більше — помилка клієнта, а не документ
+MAX_JOB_BYTES = 1024 * 1024
+# Запас до дедлайну на передачу PDF через сокет, с
+RESPONSE_GRACE = 5.0
+
+
+# === Демон ===
+
+class RenderDaemon:
+    """Unix-сервер: читає завдання, рендерить у пулі `pdf_utils`, повертає PDF."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.jobs = 0
+        # Відкриті з'єднання: під час зупинки простої закриваються, завдання дочікуються
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self._busy: Set[asyncio.StreamWriter] = set()
+        self._closing = False
+
+    async def _render(self, content: str, deadline: float) -> Tuple[int, bytes]:
+        try:
+            async with pdf_utils.SPOOL.file("daemon") as pdf:
+                # Дедлайн клієнта важливіший за RENDER_DEADLINE демона
+                await asyncio.wait_for(pdf_utils.render_pdf_local(content, pdf.path), deadline)
+                return STATUS_OK, pdf.read()
+        except SpoolFullError as e:
+            # Відповідаємо, а не рвемо з'єднання: інакше клієнт вважав би демон мертвим
+            logger.warning("Завдання відхилено: %s", e)
+            return STATUS_BUSY, str(e).encode()
+        except (asyncio.TimeoutError, RenderDeadlineExceeded):
+            return STATUS_DEADLINE, f"Рендер не завершився за {deadline:g} с.".encode()
+        except RenderLimitExceeded as e:
+            return STATUS_LIMIT, f"{e.limit}:{e.value or ''}".encode()
+        except Exception as e:
+            logger.error("Рендер не вдався: %s", e)
+            return STATUS_FAILED, str(e).encode()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    version, deadline, length = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                except asyncio.IncompleteReadError:
+                    return  # Клієнт закрив з'єднання
+                if version != PROTOCOL_VERSION or length > MAX_JOB_BYTES:
+                    logger.warning("Відкидаю з'єднання: версія %s, довжина %s.", version, length)
+                    return
+                self._busy.add(writer)
+                content = (await reader.readexactly(length)).decode("utf-8")
+                status, payload = await self._render(content, deadline)
+                self.jobs += 1
+                writer.write(RESPONSE.pack(status, len(payload)) + payload)
+                await writer.drain()
+                self._busy.discard(writer)
+                if self._closing:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.info("З'єднання обірвано: %s", e)
+        finally:
+            self._connections.pop(writer, None)
+            self._busy.discard(writer)
+            writer.close()
+
+    def _claim_socket(self) -> None:
+        """Прибирає сокет, що лишився від попереднього (мертвого) демона."""
+        if not os.path.exists(self.socket_path):
+            os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), mode=0o700, exist_ok=True)
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise SystemExit(f"Демон рендера вже слухає {self.socket_path}.")
+
+    async def serve(self, stop: asyncio.Event) -> None:
+        self._claim_socket()
+        loop = asyncio.get_running_loop()
+        # Пул і бекенди рендера — до першого завдання
+        await loop.run_in_executor(None, pdf_utils.warm_up_render_pool)
+        pdf_utils.SPOOL.start_sweeper()
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        # Лише користувач, від якого запущено бота й демон
+        os.chmod(self.socket_path, 0o600)
+        logger.info(
+            "Демон рендера слухає %s (процесів рендера: %s).",
+            self.socket_path, os.getenv("RENDER_WORKERS", os.cpu_count() or 1),
+        )
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            # Прості з'єднання закриваємо; завдання, що вже рендеряться, віддають PDF і теж закриваються
+            self._closing = True
+            for writer in list(self._connections):
+                if writer not in self._busy:
+                    writer.close()
+            if self._connections:
+                await asyncio.wait(list(self._connections.values()), timeout=pdf_utils.render_deadline())
+            await server.wait_closed()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.socket_path)
+            await pdf_utils.SPOOL.stop_sweeper()
+            await asyncio.to_thread(pdf_utils.shutdown_render_pool)
+            logger.info("Демон рендера зупинено, завдань виконано: %s.", self.jobs)
+
+
+# === Клієнт (бік бота) ===
+
+class RenderClient:
+    """Пул з'єднань до демона; `render()` повертає байти PDF."""
+
+    def __init__(self, socket_path: str, size: Optional[int] = None, retry: Optional[float] = None):
+        self.socket_path = socket_path
+        self.size = int(os.getenv("RENDER_DAEMON_CONNECTIONS", 4)) if size is None else size
+        self.retry = float(os.getenv("RENDER_DAEMON_RETRY", 30)) if retry is None else retry
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._down_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        """False протягом `retry` секунд після того, як демон виявився недоступним."""
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, reason: str) -> RenderDaemonUnavailable:
+        self._down_until = time.monotonic() + self.retry
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+        return RenderDaemonUnavailable(reason)
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        try:
+            return await asyncio.open_unix_connection(self.socket_path)
+        except OSError as e:
+            raise self._mark_down(f"{self.socket_path}: {e.strerror or e}") from None
+
+    async def render(self, content: str, deadline: float) -> bytes:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        data = content.encode("utf-8")
+        if len(data) > MAX_JOB_BYTES:
+            # (v3.30) Демон розірвав би з'єднання — і весь бот вважав би його недоступним
+            raise RenderLimitExceeded("input", MAX_JOB_BYTES // 1024)
+        async with self._slots:
+            while True:
+                reused = bool(self._idle)
+                reader, writer = self._idle.pop() if reused else await self._connect()
+                try:
+                    writer.write(REQUEST.pack(PROTOCOL_VERSION, deadline, len(data)) + data)
+                    await writer.drain()
+                    status, length = RESPONSE.unpack(
+                        await asyncio.wait_for(reader.readexactly(RESPONSE.size), deadline + RESPONSE_GRACE)
+                    )
+                    payload = await reader.readexactly(length)
+                except asyncio.TimeoutError:
+                    # Демон живий, але мовчить — з'єднання вже не придатне (відповідь може прийти пізніше)
+                    writer.close()
+                    raise RenderDeadlineExceeded(f"Демон рендера не відповів за {deadline:g} с.") from None
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    if reused:
+                        # З'єднання з пулу могло пережити рестарт демона — пробуємо нове
+                        continue
+                    raise self._mark_down(f"з'єднання обірвано: {e}") from None
+                except BaseException:
+                    # Скасування посеред завдання: відповідь ще в дорозі
+                    writer.close()
+                    raise
+                self._idle.append((reader, writer))
+                break
+
+        if status == STATUS_OK:
+            return payload
+        if status == STATUS_DEADLINE:
+            raise RenderDeadlineExceeded(payload.decode("utf-8", "replace"))
+        if status == STATUS_LIMIT:
+            limit, _, value = payload.decode("utf-8", "replace").partition(":")
+            raise RenderLimitExceeded(limit, int(value) if value.isdigit() else None)
+        if status == STATUS_BUSY:
+            raise RenderDaemonBusy(payload.decode("utf-8", "replace"))
+        raise Exception(payload.decode("utf-8", "replace"))
+
+    async def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Демон рендера PDF Privacy Sentry (Unix-сокет).")
+    parser.add_argument("--socket", default=os.getenv("RENDER_SOCKET", "/tmp/privacy-sentry-render.sock"))
+    parser.add_argument("--workers", type=int, default=None, help="Процесів рендера (RENDER_WORKERS, кількість ядер)")
+    args = parser.parse_args()
+    if args.workers is not None:
+        os.environ["RENDER_WORKERS"] = str(args.workers)
+    # Демон рендерить сам — власний RENDER_SOCKET лише для адреси, не для клієнта
+    os.environ.pop("RENDER_SOCKET", None)
+
+    configure_logging()
+    daemon = RenderDaemon(args.socket)
+
+    async def run() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await daemon.serve(stop)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
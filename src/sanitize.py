@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.31) Вхідна обробка відповідей користувача для Markdown-шляху PDF.
+
+Раніше відповіді лише проходили `html.escape` і вставлялися в Markdown як є,
+а markdown2 з розширеннями tables / cuddled-lists / break-on-newline розбирає
+їх регулярними виразами. Спеціально складений текст ламав документ:
+  - "|" у відповіді розрізав клітинку таблиці DPIA чи Чек-ліста;
+  - перенос рядка посеред клітинки розривав рядок таблиці;
+  - довгі серії "[" / "`" / "*" — сотні мс регулярок на одне поле;
+  - глибоко вкладений список ("  " * N + "- ") — RecursionError у markdown2;
+  - у `код`-спанах `html.escape` екранувався вдруге ("AT&T" -> "AT&amp;T").
+
+Тепер кожне поле перед збиранням документа (`documents.py`) проходить
+`clean_text`:
+  1. обрізається до ліміту свого питання (`FIELD_LIMITS`, символи) з "…";
+  2. керівні символи прибираються, переноси рядків стають `<br>` — відповідь
+     ніколи не починає новий рядок Markdown (ні списків, ні заголовків, ні
+     коду з відступом);
+  3. метасимволи Markdown і HTML замінюються числовими HTML-сутностями
+     (`|` -> `&#124;`) за один прохід: markdown2 не бачить у них розмітки,
+     а в PDF вони виглядають як звичайні символи.
+
+Поля в шаблонах обгортаються в `<code>`, а не в зворотні лапки: сутності
+всередині HTML-тегу не екрануються повторно.
+
+Час перетворення на ворожих даних міряє `bench_markdown.py`.
+"""
+
+import logging
+import re
+from typing import Any, Dict
+
+logger = logging.getLogger("sanitize")
+logger.setLevel(logging.INFO)
+
+# Ліміти за питаннями, символів (до екранування)
+FIELD_LIMITS: Dict[str, int] = {
+    # Політика
+    "project_name": 200,
+    "contact": 200,
+    "data_collected": 1000,
+    "data_storage": 500,
+    "delete_mechanism": 1000,
+    # DPIA
+    "team": 200,
+    "goal": 1000,
+    "item": 200,
+    "reason": 500,
+    "retention_period": 200,
+    "retention_mechanism": 1000,
+    "storage": 500,
+    "risk": 1000,
+    "mitigation": 1000,
+}
+# Нотатки Чек-ліста (cN_sM_note); той самий ліміт — для імпорту (`documents.parse_checklist_markdown`)
+NOTE_LIMIT = 1000
+DEFAULT_LIMIT = 1000
+ELLIPSIS = "…"
+
+# Метасимволи Markdown (інлайн-розмітка, таблиці, посилання, strike) та HTML
+_ENTITIES = str.maketrans({char: f"&#{ord(char)};" for char in "&<>\"'\\`*_~[]()|#!"})
+# Керівні символи (крім табуляції та переносів — їх обробляємо окремо) і роздільники рядків Unicode
+_CONTROL_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u2028\u2029]")
+_NEWLINE_RE = re.compile(r"\r\n?|\n")
+
+
+def field_limit(field: str) -> int:
+    """Ліміт довжини відповіді на питання `field`, символів."""
+    if field in FIELD_LIMITS:
+        return FIELD_LIMITS[field]
+    return NOTE_LIMIT if field.endswith("_note") else DEFAULT_LIMIT
+
+
+def cap(value: Any, field: str) -> str:
+    """Обрізає відповідь до ліміту питання (з "…" у кінці)."""
+    text = str(value)
+    limit = field_limit(field)
+    if len(text) <= limit:
+        return text
+    # У лог — лише назва поля і довжини, не текст відповіді
+    logger.info("Поле %s обрізано: %s -> %s символів.", field, len(text), limit)
+    return text[: limit - len(ELLIPSIS)].rstrip() + ELLIPSIS
+
+
+def clean_text(value: Any, field: str) -> str:
+    """Відповідь користувача -> інлайн-фрагмент Markdown без розмітки (див. модуль)."""
+    text = _CONTROL_RE.sub("", cap(value, field)).replace("\t", " ").strip()
+    return _NEWLINE_RE.sub("<br>", text.translate(_ENTITIES))
+
+
+def answer(data: dict, field: str, default: str) -> str:
+    """
+    Поле відповіді для шаблону: `clean_text`, якщо користувач його заповнив;
+    інакше `default` як є (це наш текст і може містити розмітку, напр. "*Не заповнено*").
+    """
+    value = data.get(field)
+    if value is None:
+        return default
+    return clean_text(value, field)
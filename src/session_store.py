@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.9) Зашифроване, обмежене в часі (TTL) сховище *незавершених* сесій.
+
+Навіщо:
+  Увесь стан розмови живе в пам'яті процесу, тому кожен деплой чи падіння
+  "викидає" користувачів посеред 19-крокового аудиту. Це сховище — опційний
+  бекенд `Persistence` для python-telegram-bot, який переживає рестарт.
+
+Принципи (наше "Stateless" зобов'язання зберігається):
+  - Вмикається ЛИШЕ змінною оточення SESSION_STORE_PATH (шлях до SQLite-файлу).
+  - Усе шифрується (Fernet, бібліотека `cryptography`) ключем, що живе лише
+    в пам'яті або в змінній оточення SESSION_STORE_KEY. Без ключа в env
+    генерується тимчасовий ключ — тоді записи не переживуть рестарт і будуть
+    видалені як нечитабельні.
+  - Кожен запис автоматично видаляється через SESSION_STORE_TTL секунд
+    (за замовчуванням 30 хв).
+  - Запис на диск відбувається пакетами у фоновому потоці (не блокує event loop).
+  - Завершені сесії (`clear_user_data`) стираються з диска НЕГАЙНО (`forget_user`).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger("session_store")
+logger.setLevel(logging.INFO)
+
+DEFAULT_TTL_SECONDS = 30 * 60
+# Скільки чекаємо, щоб зібрати всі update_* виклики одного циклу в один пакет
+BATCH_DELAY_SECONDS = 0.2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    kind       TEXT    NOT NULL,  -- 'user' або 'conv:<name>'
+    skey       TEXT    NOT NULL,  -- user_id або JSON-ключ розмови
+    user_id    INTEGER NOT NULL,
+    payload    BLOB    NOT NULL,  -- зашифрований JSON
+    expires_at REAL    NOT NULL,
+    PRIMARY KEY (kind, skey)
+)
+"""
+
+
+# --- Лінивий імпорт, щоб не падати, якщо пакета немає ---
+def _try_import_fernet():
+    try:
+        from cryptography.fernet import Fernet, InvalidToken  # type: ignore
+        return Fernet, InvalidToken
+    except Exception:
+        return None, None
+
+
+class EncryptedSessionPersistence(BasePersistence):
+    """
+    (v3.9) Persistence для `user_data` та станів ConversationHandler.
+    chat_data / bot_data / callback_data НЕ зберігаються.
+    """
+
+    def __init__(self, path: str, key: bytes, ttl: int = DEFAULT_TTL_SECONDS, update_interval: float = 5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        Fernet, InvalidToken = _try_import_fernet()
+        self._fernet = Fernet(key)
+        self._invalid_token = InvalidToken
+        self._ttl = ttl
+        self._path = path
+
+        # Один потік для всіх записів: видалення (forget_user) гарантовано
+        # виконується ПІСЛЯ пакета, що вже пишеться.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session_store")
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA secure_delete=ON")  # стерті сторінки перезаписуються нулями
+        self._db.execute(_SCHEMA)
+
+        # (kind, skey) -> (user_id, json_str) | None (None = видалити)
+        self._pending: Dict[Tuple[str, str], Optional[Tuple[int, str]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def ttl(self) -> int:
+        """Скільки секунд живе запис після останнього оновлення."""
+        return self._ttl
+
+    # === Робота з диском (виконується у фоновому потоці) ===
+
+    def _encrypt(self, raw: str) -> bytes:
+        return self._fernet.encrypt(raw.encode("utf-8"))
+
+    def _decrypt(self, token: bytes) -> Optional[Any]:
+        try:
+            return json.loads(self._fernet.decrypt(token, ttl=self._ttl).decode("utf-8"))
+        except self._invalid_token:
+            # Прострочений або зашифрований іншим (тимчасовим) ключем
+            return None
+
+    def _write_batch(self, batch: Dict[Tuple[str, str], Optional[Tuple[int, str]]]) -> None:
+        now = time.time()
+        rows_upsert = []
+        rows_delete = []
+        for (kind, skey), value in batch.items():
+            if value is None:
+                rows_delete.append((kind, skey))
+            else:
+                user_id, raw = value
+                rows_upsert.append((kind, skey, user_id, self._encrypt(raw), now + self._ttl))
+
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                if rows_delete:
+                    self._db.executemany("DELETE FROM sessions WHERE kind = ? AND skey = ?", rows_delete)
+                if rows_upsert:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO sessions (kind, skey, user_id, payload, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        rows_upsert,
+                    )
+                purged = self._db.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        logger.info(
+            "Записано пакет сесій: %d оновлено, %d видалено, %d прострочено.",
+            len(rows_upsert), len(rows_delete), purged,
+        )
+
+    def _load_kind(self, kind: str) -> Dict[str, Any]:
+        now = time.time()
+        result = {}
+        unreadable = []
+        with self._db_lock:
+            self._db.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            rows = self._db.execute("SELECT skey, payload FROM sessions WHERE kind = ?", (kind,)).fetchall()
+        for skey, payload in rows:
+            data = self._decrypt(payload)
+            if data is None:
+                unreadable.append((kind, skey))
+            else:
+                result[skey] = data
+        if unreadable:
+            with self._db_lock:
+                self._db.executemany("DELETE FROM sessions WHERE kind = ? AND skey = ?", unreadable)
+            logger.warning("Видалено %d нечитабельних/прострочених сесій.", len(unreadable))
+        return result
+
+    def _close_db(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+    def _delete_user_rows(self, user_id: int) -> None:
+        with self._db_lock:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    # === Пакетний запис ===
+
+    def _queue(self, kind: str, skey: str, value: Optional[Tuple[int, str]]) -> None:
+        self._pending[(kind, skey)] = value
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        await asyncio.sleep(BATCH_DELAY_SECONDS)
+        batch, self._pending = self._pending, {}
+        if batch:
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, batch)
+            except Exception as e:
+                logger.error("Не вдалося записати пакет сесій: %s", e, exc_info=True)
+
+    def forget_user(self, user_id: int) -> None:
+        """(v3.9) НЕГАЙНО стирає всі записи користувача (сесію завершено)."""
+        self._pending = {k: v for k, v in self._pending.items() if not (v and v[0] == user_id)}
+        try:
+            asyncio.get_running_loop().run_in_executor(self._executor, self._delete_user_rows, user_id)
+        except RuntimeError:
+            # Немає event loop (напр., під час зупинки) — видаляємо синхронно
+            self._delete_user_rows(user_id)
+
+    # === Інтерфейс BasePersistence ===
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        rows = await asyncio.to_thread(self._load_kind, "user")
+        logger.info("Відновлено %s незавершених сесій.", len(rows))
+        return {int(skey): data for skey, data in rows.items()}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[int, ...], object]:
+        rows = await asyncio.to_thread(self._load_kind, f"conv:{name}")
+        return {tuple(json.loads(skey)): state for skey, state in rows.items()}
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        skey = json.dumps(list(key))
+        if new_state is None:
+            self._queue(f"conv:{name}", skey, None)
+        else:
+            # Ключ розмови — (chat_id, user_id); останній елемент — user_id
+            self._queue(f"conv:{name}", skey, (int(key[-1]), json.dumps(new_state)))
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        if not data:
+            self._queue("user", str(user_id), None)
+        else:
+            self._queue("user", str(user_id), (user_id, json.dumps(data, ensure_ascii=False)))
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self.forget_user(user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Викликається під час зупинки: дописуємо залишок пакета і закриваємо БД."""
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        batch, self._pending = self._pending, {}
+        loop = asyncio.get_running_loop()
+        if batch:
+            await loop.run_in_executor(self._executor, self._write_batch, batch)
+        # Чекаємо, доки виконаються всі заплановані видалення
+        await loop.run_in_executor(self._executor, self._close_db)
+        self._executor.shutdown(wait=True)
+        logger.info("Сховище сесій закрито.")
+
+
+def build_session_persistence() -> Optional[EncryptedSessionPersistence]:
+    """
+    (v3.9) Створює Persistence зі змінних оточення або повертає None,
+    якщо сховище вимкнене / недоступне (тоді бот працює як раніше, лише в RAM).
+    """
+    path = os.getenv("SESSION_STORE_PATH")
+    if not path:
+        return None
+
+    Fernet, _ = _try_import_fernet()
+    if not Fernet:
+        logger.warning("Бібліотека 'cryptography' не встановлена. Сховище сесій вимкнено.")
+        return None
+
+    key = os.getenv("SESSION_STORE_KEY")
+    if key:
+        key = key.encode("ascii")
+    else:
+        logger.warning(
+            "SESSION_STORE_KEY не задано: використовую тимчасовий ключ у пам'яті. "
+            "Сесії НЕ переживуть рестарт."
+        )
+        key = Fernet.generate_key()
+
+    ttl = int(os.getenv("SESSION_STORE_TTL", DEFAULT_TTL_SECONDS))
+    try:
+        persistence = EncryptedSessionPersistence(path, key, ttl=ttl)
+    except Exception as e:
+        logger.error("Не вдалося відкрити сховище сесій %s: %s", path, e)
+        return None
+
+    logger.info("Сховище сесій увімкнено: %s (TTL %s с).", path, ttl)
+    return persistence
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.25) Коректна зупинка бота під час деплою.
+
+Раніше `run_polling()` зупинявся посеред рендерів: користувачі втрачали
+документи, на які вже відповіли, а в робочому каталозі лишалися
+`*_<user_id>.pdf`. Тепер `PrivacySentryApplication.stop()` викликає
+`ShutdownCoordinator.drain()` ДО стандартної зупинки PTB:
+
+  1. нові генерації більше не приймаються (`accepting = False`) —
+     користувач отримує прохання повторити за хвилину;
+  2. генерації, що вже рендеряться або надсилаються, мають до
+     SHUTDOWN_DEADLINE секунд (20), щоб завершитися;
+  3. решта скасовується, користувачі отримують повідомлення з проханням
+     повторити (`templates.SHUTDOWN_GENERATION_ABORTED`);
+  4. тимчасові PDF, що лишилися, видаляються (`pdf_utils.sweep_temp_pdfs`,
+     v3.26 — і "сироти" у спулі `pdf_utils.SPOOL`);
+  5. у лог пишеться звіт: скільки дочекалися, скасували, сповістили, прибрали.
+
+Кожна генерація запускається окремою задачею (`run`), тож скасувати можна
+саме її, не чіпаючи задачу, що отримує апдейти.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Dict, Optional, Set
+
+from telegram.error import TelegramError
+
+import templates
+import tg_format
+from pdf_utils import SPOOL, sweep_temp_pdfs
+
+logger = logging.getLogger("shutdown")
+logger.setLevel(logging.INFO)
+
+
+class ShutdownCoordinator:
+    """Відстежує генерації в роботі та "зливає" їх під час зупинки."""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = float(os.getenv("SHUTDOWN_DEADLINE", 20)) if deadline is None else deadline
+        self.accepting = True
+        # Задача генерації -> chat_id (для повідомлення, якщо її скасовано)
+        self._in_flight: Dict[asyncio.Task, int] = {}
+        # Задачі, скасовані саме зупинкою (а не ззовні)
+        self._aborted: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, coro: Awaitable[Any], chat_id: int, aborted_result: Any = None) -> Any:
+        """
+        Виконує генерацію окремою задачею, яку `drain` може дочекатися або скасувати.
+        Якщо її скасувала зупинка — повертає `aborted_result` (скасування не виходить
+        за межі, інакше воно зупинило б задачу, що отримує апдейти).
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        self._in_flight[task] = chat_id
+        task.add_done_callback(self._in_flight.pop)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task not in self._aborted:
+                raise
+            self._aborted.discard(task)
+            return aborted_result
+
+    async def drain(self, bot) -> Dict[str, Any]:
+        """Зупиняє прийом генерацій, чекає до `deadline`, скасовує решту. Повертає звіт."""
+        self.accepting = False
+        started = time.monotonic()
+        tasks = list(self._in_flight)
+        report: Dict[str, Any] = {"in_flight": len(tasks), "finished": 0, "cancelled": 0, "notified": 0}
+
+        if tasks:
+            logger.info("Зупинка: чекаю на %s генерацій (до %.0f с).", len(tasks), self.deadline)
+            done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+            report["finished"] = len(done)
+            chats = [self._in_flight.get(task) for task in pending]
+            for task in pending:
+                self._aborted.add(task)
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            report["cancelled"] = len(pending)
+
+            for chat_id in chats:
+                try:
+                    await bot.send_message(chat_id=chat_id, **tg_format.message(templates.SHUTDOWN_GENERATION_ABORTED))
+                    report["notified"] += 1
+                except TelegramError as e:
+                    logger.warning("Не вдалося повідомити про перервану генерацію: %s", e)
+
+        report["swept"] = await asyncio.to_thread(sweep_temp_pdfs) + await asyncio.to_thread(SPOOL.sweep_orphans)
+        report["seconds"] = round(time.monotonic() - started, 2)
+        logger.info(
+            "Зупинка: генерацій у роботі %(in_flight)s, завершено %(finished)s, скасовано %(cancelled)s "
+            "(сповіщено %(notified)s), прибрано файлів %(swept)s, за %(seconds)s с.",
+            report,
+        )
+        return report
@@ -10,6 +10,16 @@
 (v3.8 - Фікс Чек-ліста)
 Містить усі текстові шаблони для бота.
 
+- (v3.32) Розмітку шаблонів для Telegram (**жирний**, *курсив*, `код`,
+         [текст](url)) розбирає `tg_format.py`, а не Telegram; `{поля}` — текст як є.
+- (v3.22) Додано GENERATION_IN_FLIGHT_* (апдейт під час генерації).
+- (v3.9) BOT_PRIVACY_POLICY: пункт 2.3 ({storage_notice}) — PRIVACY_STORAGE_*
+         залежно від сховища сесій.
+- (v3.25) Додано SHUTDOWN_* (повідомлення під час перезапуску бота).
+- (v3.21) Додано KIT_Q_* ("Повний комплект").
+- (v3.20) DPIA_Q_MINIMIZATION_ASK / _REASON замінено на DPIA_Q_MINIMIZATION_SELECT /
+         _REASONS / _REASONS_MISSING (мінімізація одним екраном).
+- (v3.18) Додано DPIA_UPLOAD_SUMMARY / DPIA_UPLOAD_ERROR (імпорт DPIA з Excel).
 - (v3.8) Повністю переписано Розділ 5 (Шаблони Чек-ліста)
          для сумісності з bot.py (v3.8).
 - (v3.8) Додано CHECKLIST_Q_PROJECT_NAME (фікс AttributeError).
@@ -32,6 +42,9 @@ BOT_HELP = """
 3.  Отримайте готовий `PDF`-файл.
 4.  Бот **миттєво забуде** всі ваші відповіді.
 
+**Вже заповнили `1_dpia_lite.xlsx`?** Просто надішліть файл боту — він покаже підсумок і одразу згенерує PDF.
+**Заповнили `3_minimization_checklist.md`?** Вставте його текстом або надішліть файлом — PDF Чек-ліста прийде одразу.
+
 **Контакти:**
 - **Team Lead / Arch:** Ревякін Кирило (@rntroo)
 - **Tech Lead:** Лєбєдєв Олександр (@QFITP)
@@ -62,7 +75,7 @@ BOT_PRIVACY_POLICY = """<b>🔒 Політика Приватності бота
 
 1. Бот використовує ваші відповіді <b>лише</b> для однієї мети: згенерувати для вас фінальний <code>.pdf</code> документ.
 2. Щойно сеанс розмови завершено (ви отримали свій PDF або натиснули <code>/cancel</code>), всі ваші відповіді та ваш <code>Telegram ID</code> <b>негайно та автоматично видаляються</b> з оперативної пам'яті.
-3. Ми <b>НІКОЛИ</b> не зберігаємо ваші відповіді, назви ваших проєктів чи згенеровані PDF-файли на диск, у базу даних чи будь-яке інше постійне сховище.
+{storage_notice}
 
 Бот "забуває" про вас у ту саму секунду, як розмова завершується.
 
@@ -78,11 +91,16 @@ BOT_PRIVACY_POLICY = """<b>🔒 Політика Приватності бота
 
 <b>5. Відкритий Код (Open Source)</b>
 
-Ви не маєте вірити нам на слово. Весь наш "stateless" код є відкритим. Ви можете особисто перевірити, що ми не маємо підключення до баз даних:
+Ви не маєте вірити нам на слово. Весь наш "stateless" код є відкритим. Ви можете особисто перевірити, що і де ми зберігаємо:
 
 ➡️ <a href="https://github.com/Kirill3224/KAI-Privacy-Kit/tree/main/src"><b>Подивитися код на GitHub</b></a>
 """
 
+# (v3.9) Пункт 2.3 Політики бота: залежить від того, чи увімкнено сховище сесій (SESSION_STORE_PATH)
+PRIVACY_STORAGE_RAM_ONLY = """3. Ми <b>НІКОЛИ</b> не зберігаємо ваші відповіді, назви ваших проєктів чи згенеровані PDF-файли на диск, у базу даних чи будь-яке інше постійне сховище."""
+
+PRIVACY_STORAGE_SESSION_STORE = """3. Згенеровані PDF-файли ми <b>НІКОЛИ</b> не зберігаємо. Щоб незавершений аудит пережив перезапуск бота, відповіді <b>незавершеної</b> розмови зберігаються на диску сервера бота (база SQLite) у <b>зашифрованому</b> вигляді; через {ttl_minutes} хв після останньої відповіді запис стає недійсним і видаляється з диска. Щойно розмову завершено (PDF або <code>/cancel</code>), запис стирається негайно."""
+
 # (НОВЕ v3.3) "Етичне Нагадування"
 POST_POLICY_UPSELL = """
 Вітаю! Ви завершили "Крок 1: Пообіцяй".
@@ -99,6 +117,8 @@ POST_POLICY_UPSELL = """
 # === 2. Шаблони для Генерації PDF ===
 
 # --- 2.1. Шаблон "Політики Конфіденційності" ---
+# (v3.31) Поля — у <code> / <strong>, а не в `...` / **...**: значення вже екрановані
+# (`sanitize.clean_text`) і можуть містити <br>, з яким markdown2 не розбирає **...**
 POLICY_TEMPLATE = """
 # {project_name} – Наша Політика Приватності
 
@@ -108,9 +128,9 @@ POLICY_TEMPLATE = """
 
 ### 1. Хто ми? (Володілець даних)
 
-- **Проєкт:** `{project_name}`
+- **Проєкт:** <code>{project_name}</code>
 - **Організація:** `[Студентська ініціатива при [Назва факультету/клубу] КАІ]`
-- **Контакт:** `{contact}`
+- **Контакт:** <code>{contact}</code>
 
 ### 2. Які дані ми збираємо і навіщо? (Мета та Мінімізація)
 
@@ -118,14 +138,14 @@ POLICY_TEMPLATE = """
 
 | Дані, які ми збираємо | Навіщо нам це (Мета) |
 | :--- | :--- |
-| **`{data_collected}`** | `[Напр., Щоб ідентифікувати вас у системі та надсилати вам відповіді.]` |
+| <strong><code>{data_collected}</code></strong> | `[Напр., Щоб ідентифікувати вас у системі та надсилати вам відповіді.]` |
 | ... | `[Напр., Чітка мета]` |
 
 > **Ми НЕ збираємо:** `[Напр., Номери телефонів, геолокацію, банківські дані чи будь-яку іншу "надлишкову" інформацію.]`
 
 ### 3. Де ми зберігаємо дані? (Безпека)
 
-- Ваші дані зберігаються на **`{data_storage}`**.
+- Ваші дані зберігаються на <strong><code>{data_storage}</code></strong>.
 - Ми вживаємо всіх технічних заходів для захисту.
 - Ми **ніколи не використовуємо "публічні посилання"** для доступу до даних.
 
@@ -135,7 +155,7 @@ POLICY_TEMPLATE = """
 
 - **Право на видалення ("Право на забуття"):** Ви можете повністю видалити себе з нашої системи.
 
-Щоб скористатися цим правом, будь ласка, **`{delete_mechanism}`**. (Це вимога Закону).
+Щоб скористатися цим правом, будь ласка, <strong><code>{delete_mechanism}</code></strong>. (Це вимога Закону).
 
 ### 5. Як довго ми зберігаємо дані? (Retention)
 
@@ -299,32 +319,43 @@ DPIA_Q_DATA_LIST_ERROR = """
 `Email`)
 """
 
-DPIA_Q_MINIMIZATION_ASK = """
+# (v3.20) Мінімізація одним екраном: перемикачі замість питання на кожен пункт
+DPIA_Q_MINIMIZATION_SELECT = """
 ✅ **Назва Проєкту:** `{project_name}`
 ...
 ✅ **Дані:**
 {data_list}
 
 ---
-**Крок 5/8: Мінімізація (Питання {count})**
+**Крок 5/8: Мінімізація** (залишено {kept}/{total})
 
-Давайте проаналізуємо ваші дані.
-
-Пункт: {item}
-**Питання:** Вам *справді* потрібні ці дані для роботи сервісу?
+Вам *справді* потрібні всі ці дані для роботи сервісу?
+Натисніть на пункт, щоб **відмовитися** від нього (❌) або повернути (✅).
 (Напр., чи можна ідентифікувати користувача за `Telegram ID` замість `Номеру телефону`?)
+
+Коли закінчите — натисніть **Готово**.
 """
 
-DPIA_Q_MINIMIZATION_REASON = """
-{minimization_summary}
+DPIA_Q_MINIMIZATION_REASONS = """
+**Крок 5/8: Мінімізація — Обґрунтування**
 
----
-**Крок 5/8: Мінімізація**
+Ви залишили {kept} з {total} пунктів:
+{items}
 
-Добре, вам потрібні дані: {item}.
+Будь ласка, надішліть **одним повідомленням** коротке обґрунтування (Навіщо?) для кожного — по рядку на пункт, у тому ж порядку.
+(Напр.:
+`1. Для ідентифікації`
+`2. Для показу розкладу групи`)
+"""
 
-Будь ласка, введіть **коротке обґрунтування (Навіщо?)**.
-(Напр., `Для ідентифікації` або `Для показу розкладу групи`)
+DPIA_Q_MINIMIZATION_REASONS_MISSING = """
+⚠️ **Бракує обґрунтування для:**
+{items}
+
+---
+**Крок 5/8: Мінімізація — Обґрунтування**
+
+Надішліть їх одним повідомленням (можна з номерами: `3. Для входу`).
 """
 
 DPIA_Q_RETENTION_PERIOD = """
@@ -388,6 +419,96 @@ DPIA_Q_MITIGATION = """
 (Напр., `Доступ до Sheet лише по email + 2FA` або `Токен в .env`)
 """
 
+# (v3.18) Імпорт заповненого 1_dpia_lite.xlsx: один екран підтвердження
+DPIA_UPLOAD_SUMMARY = """
+📥 **DPIA Lite з файлу Excel**
+
+✅ **Назва Проєкту:** `{project_name}`
+✅ **Команда:** `{team}`
+✅ **Мета:** `{goal}`
+{minimization_summary}
+✅ **Строк Зберігання:** `{retention_period}`
+✅ **Механізм Видалення:** `{retention_mechanism}`
+✅ **Місце Зберігання:** `{storage}`
+✅ **Головний Ризик:** `{risk}`
+✅ **Мінімізація Ризику:** `{mitigation}`
+
+---
+Перевірте відповіді. Якщо все вірно — натисніть **Згенерувати**.
+Щоб щось виправити, відредагуйте файл і надішліть його ще раз.
+"""
+
+DPIA_UPLOAD_ERROR = """
+⚠️ **Не вдалося прочитати файл:** {error}
+
+Надішліть заповнений `1_dpia_lite.xlsx` (до {max_kb} КБ) або пройдіть DPIA в меню.
+"""
+
+# === (v3.25) Перезапуск бота (деплой) ===
+
+SHUTDOWN_GENERATION_ABORTED = """
+⚠️ **Бот перезапускається — генерацію вашого документа перервано.**
+
+Ваші відповіді вже видалено з пам'яті (ми їх не зберігаємо). Будь ласка, натисніть /start за хвилину і пройдіть опитування ще раз. Вибачте за незручності!
+"""
+
+SHUTDOWN_GENERATION_DEFERRED = """
+⏳ **Бот перезапускається і зараз не генерує документи.**
+
+Натисніть кнопку або надішліть останню відповідь ще раз за хвилину. Якщо після перезапуску бот не продовжить аудит — натисніть /start.
+"""
+
+# === (v3.22) Генерація вже триває (idempotency.py) ===
+
+# Спливаюча підказка на кнопці (answerCallbackQuery, до 200 символів)
+GENERATION_IN_FLIGHT_ALERT = "⏳ Документ ще генерується — зачекайте кілька секунд."
+
+GENERATION_IN_FLIGHT_MESSAGE = """
+⏳ **Ваш документ ще генерується**, тому це повідомлення не оброблено.
+
+Дочекайтеся документа й надішліть його ще раз, якщо воно потрібне. /cancel і /help працюють і зараз.
+"""
+
+# === (v3.21) "Повний комплект" (питання DPIA + контакт + статуси Чек-ліста) ===
+
+KIT_Q_PROJECT_NAME = """
+**Повний комплект: Політика + DPIA + Чек-ліст**
+
+Я поставлю питання DPIA, а Політику та Чек-ліст зберу з тих самих відповідей — нічого не доведеться вводити двічі. Наприкінці: контакт і статуси пунктів Чек-ліста.
+
+Натисніть /cancel у будь-який момент, щоб скасувати.
+
+---
+**Крок 1/8: Назва Проєкту**
+
+Будь ласка, введіть **Назву Вашого Проєкту**
+"""
+
+KIT_Q_CONTACT = """
+{minimization_summary}
+✅ **Місце Зберігання:** `{storage}`
+✅ **Головний Ризик:** `{risk}`
+✅ **Мінімізація Ризику:** `{mitigation}`
+
+---
+**Політика: Контакт**
+
+DPIA готова. Для Політики бракує лише одного: **контакт** для зв'язку та видалення даних.
+(Напр., `@my_username` або `email@example.com`)
+"""
+
+KIT_Q_CHECKLIST = """
+✅ **Проєкт:** `{project_name}`
+✅ **Контакт:** `{contact}`
+
+---
+**Чек-ліст: що вже виконано?**
+
+Позначте виконані пункти (натисніть ще раз, щоб зняти). Нотатки про сховище, видалення та контакт я візьму з ваших відповідей.
+
+Коли закінчите — натисніть **Згенерувати 3 документи**.
+"""
+
 # =========================================================================
 # === 5. (v3.8) "Безшовні" Шаблони для Чек-ліста (Фікс UX) ===
 #
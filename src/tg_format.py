@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.32) Локальне форматування повідомлень Telegram: текст + MessageEntity.
+
+Раніше шаблони (`templates.py`) заповнювалися через `str.format` і надсилалися
+з `ParseMode.MARKDOWN` (legacy). Відповідь користувача потрапляла прямо в
+розмітку: зворотна лапка в назві проєкту закривала `код`-спан, "_" у пункті
+даних відкривав курсив — Telegram відповідав 400 "can't parse entities", а
+`edit_main_message` видаляв повідомлення й пробував надіслати нове з тим
+самим текстом (ще один 400). До того ж legacy-Markdown не знає `**жирний**`:
+"**" — порожня сутність, тож заголовки шаблонів ніколи не були жирними.
+
+Тепер розмітку шаблону розбираємо ми, а не Telegram:
+  - `**жирний**`, `*курсив*` / `_курсив_`, `` `код` ``, `[текст](url)`;
+    у коді розмітка не діє; "[", за яким не йде "](url)", — звичайний текст;
+  - `{поле}` підставляється ПІСЛЯ розбору: рядок — це текст як є (без
+    екранування, без розмітки), `Rich` — готовий фрагмент зі своїми сутностями;
+  - зсуви й довжини сутностей — в одиницях UTF-16, як вимагає Bot API
+    (емодзі поза BMP, напр. 📥, — дві одиниці); всередині `Rich` — індекси
+    рядка Python, в UTF-16 їх переводить `entities`.
+Результат надсилається з `entities=` і без `parse_mode`: текст користувача не
+може зламати повідомлення. Незакрита розмітка в самому шаблоні — помилка
+програміста (`ValueError`), а не відповідь 400 на проді.
+
+(v3.33) Довжина "Головного" повідомлення. Підсумок відповідей DPIA й
+Чек-ліста росте з кожним кроком: 100 пунктів даних чи кілька довгих нотаток —
+і текст перевищує 4096 символів; Telegram відповідає "message is too long", і
+повторне надсилання того самого тексту — теж. `fit()` міряє повідомлення
+(символи UTF-16 і байти тексту + сутностей, MAIN_MESSAGE_BUDGET_BYTES) і, якщо
+воно не вміщається:
+  1. згортає відповіді до дайджесту (MAIN_MESSAGE_DIGEST_CHARS символів + "…"),
+     від найстаріших (вищих у тексті);
+  2. ховає рядки з відповідями, знову від найстаріших, за одним рядком-позначкою;
+     рядки самого шаблону після них (питання, підказки) лишаються завжди;
+  3. у крайньому разі обрізає текст.
+Повний текст тоді показується по сторінках (`paginate`) — кнопка
+"Показати підсумок" у bot.py.
+
+Приклад:
+    msg = tg_format.message(templates.POLICY_Q_CONTACT, project_name="a_b `c`")
+    await bot.send_message(chat_id, **msg)
+
+Ворожий корпус і підрахунок зекономлених викликів API — `bench_formatting.py`.
+"""
+
+import json
+import os
+import re
+import string
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from telegram import MessageEntity
+
+# (тип, початок, довжина, url) — індекси рядка Python
+Span = Tuple[str, int, int, Optional[str]]
+# Відповідь користувача в тексті: [початок, кінець)
+Answer = Tuple[int, int]
+
+# Ліміт Bot API на текст повідомлення (після розбору сутностей), одиниць UTF-16
+MAX_MESSAGE_CHARS = 4096
+ELLIPSIS = "…"
+
+_FORMATTER = string.Formatter()
+# Посилання в шаблоні: [текст](url), текст без розмітки
+_LINK_RE = re.compile(r"\[([^\[\]\n]+)\]\(([^()\s]+)\)")
+# Розмітка -> тип сутності; "**" перевіряється раніше за "*"
+_MARKERS = (
+    ("**", MessageEntity.BOLD),
+    ("*", MessageEntity.ITALIC),
+    ("_", MessageEntity.ITALIC),
+)
+# (v3.33) Рядок замість схованих відповідей (див. `fit`)
+HIDDEN_MARKER = "_(сховано рядків з відповідями: {count} — натисніть «📋 Показати підсумок»)_\n"
+
+
+def utf16_len(text: str) -> int:
+    """Довжина рядка в одиницях UTF-16 (так рахує Bot API)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def main_message_budget() -> int:
+    """(v3.33) Бюджет "Головного" повідомлення: байти UTF-8 тексту + JSON сутностей."""
+    return int(os.getenv("MAIN_MESSAGE_BUDGET_BYTES", 4096))
+
+
+class Rich:
+    """Готовий фрагмент повідомлення: текст, сутності та місця відповідей користувача."""
+
+    __slots__ = ("text", "spans", "answers")
+
+    def __init__(self, text: str = "", spans: Iterable[Span] = (), answers: Iterable[Answer] = ()):
+        self.text = text
+        self.spans: List[Span] = list(spans)
+        self.answers: List[Answer] = list(answers)
+
+    def __add__(self, other: Any) -> "Rich":
+        if not isinstance(other, Rich):
+            other = Rich(str(other))
+        shift = len(self.text)
+        return Rich(
+            self.text + other.text,
+            self.spans + [(kind, start + shift, length, url) for kind, start, length, url in other.spans],
+            self.answers + [(start + shift, end + shift) for start, end in other.answers],
+        )
+
+    def __radd__(self, other: Any) -> "Rich":
+        return Rich(str(other)) + self
+
+    def __bool__(self) -> bool:
+        return bool(self.text)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __repr__(self) -> str:
+        return f"Rich({self.text!r}, {self.spans!r})"
+
+    def __getitem__(self, key: slice) -> "Rich":
+        """Зріз тексту; сутності й відповіді обрізаються по його межах."""
+        first, last, _ = key.indices(len(self.text))
+        spans, answers = [], []
+        for kind, start, length, url in self.spans:
+            begin, end = max(start, first), min(start + length, last)
+            if end > begin:
+                spans.append((kind, begin - first, end - begin, url))
+        for start, end in self.answers:
+            begin, end = max(start, first), min(end, last)
+            if end > begin:
+                answers.append((begin - first, end - first))
+        return Rich(self.text[first:last], spans, answers)
+
+    def replace(self, first: int, last: int, text: str) -> "Rich":
+        """(v3.33) Замінює [first, last) на `text`; сутності, що його охоплюють, охоплюють і заміну."""
+        delta = len(text) - (last - first)
+
+        def move(position: int, is_end: bool) -> int:
+            if position <= first:
+                return position
+            if position >= last:
+                return position + delta
+            return first + len(text) if is_end else first
+
+        spans = []
+        for kind, start, length, url in self.spans:
+            begin, end = move(start, False), move(start + length, True)
+            if end > begin:
+                spans.append((kind, begin, end - begin, url))
+        answers = [(move(start, False), move(end, True)) for start, end in self.answers]
+        return Rich(self.text[:first] + text + self.text[last:], spans, [a for a in answers if a[1] > a[0]])
+
+    def strip(self) -> "Rich":
+        """Як `str.strip()`; сутності зсуваються й обрізаються разом із текстом."""
+        head = len(self.text) - len(self.text.lstrip())
+        return self[head:len(self.text.rstrip())]
+
+    @classmethod
+    def join(cls, separator: str, parts: Iterable["Rich"]) -> "Rich":
+        result = cls()
+        for i, part in enumerate(parts):
+            result = result + separator + part if i else result + part
+        return result
+
+    def dump(self) -> list:
+        """(v3.33) JSON-сумісне подання (для `user_data` і сховища сесій)."""
+        return [self.text, [list(span) for span in self.spans], [list(answer) for answer in self.answers]]
+
+    @classmethod
+    def load(cls, data: list) -> "Rich":
+        text, spans, answers = data
+        return cls(text, [tuple(span) for span in spans], [tuple(answer) for answer in answers])
+
+    def entity_dicts(self) -> List[Dict[str, Any]]:
+        """Сутності у форматі Bot API (зсуви в UTF-16)."""
+        units = [0]
+        for char in self.text:
+            units.append(units[-1] + (2 if ord(char) > 0xFFFF else 1))
+        result = []
+        for kind, start, length, url in self.spans:
+            entity = {"type": str(kind), "offset": units[start], "length": units[start + length] - units[start]}
+            if url:
+                entity["url"] = url
+            result.append(entity)
+        return result
+
+    @property
+    def entities(self) -> List[MessageEntity]:
+        return [MessageEntity(**entity) for entity in self.entity_dicts()]
+
+
+class _Builder:
+    """Розбирає розмітку шаблону по шматках і вставляє значення полів як текст."""
+
+    def __init__(self, template: str):
+        self.template = template
+        self.parts: List[str] = []
+        self.spans: List[Span] = []
+        self.answers: List[Answer] = []
+        self.offset = 0
+        # Відкриті сутності: (маркер, тип, початок)
+        self.open: List[Tuple[str, str, int]] = []
+
+    def text(self, text: str, answer: bool = False) -> None:
+        if text:
+            if answer:
+                self.answers.append((self.offset, self.offset + len(text)))
+            self.parts.append(text)
+            self.offset += len(text)
+
+    def rich(self, value: Rich) -> None:
+        self.spans.extend((kind, start + self.offset, length, url) for kind, start, length, url in value.spans)
+        self.answers.extend((start + self.offset, end + self.offset) for start, end in value.answers)
+        self.text(value.text)
+
+    def _close(self, marker: str) -> bool:
+        for i in range(len(self.open) - 1, -1, -1):
+            if self.open[i][0] == marker:
+                _, kind, start = self.open.pop(i)
+                if self.offset > start:
+                    self.spans.append((kind, start, self.offset - start, None))
+                return True
+        return False
+
+    def _toggle(self, marker: str, kind: str) -> None:
+        if not self._close(marker):
+            self.open.append((marker, kind, self.offset))
+
+    def markup(self, literal: str) -> None:
+        i, plain = 0, 0
+        while i < len(literal):
+            in_code = bool(self.open) and self.open[-1][0] == "`"
+            if literal[i] == "`":
+                self.text(literal[plain:i])
+                self._toggle("`", MessageEntity.CODE)
+                i = plain = i + 1
+                continue
+            if in_code:
+                i += 1
+                continue
+            if literal[i] == "[":
+                link = _LINK_RE.match(literal, i)
+                if link:
+                    self.text(literal[plain:i])
+                    start = self.offset
+                    self.text(link.group(1))
+                    self.spans.append((MessageEntity.TEXT_LINK, start, self.offset - start, link.group(2)))
+                    i = plain = link.end()
+                    continue
+            for marker, kind in _MARKERS:
+                if literal.startswith(marker, i):
+                    self.text(literal[plain:i])
+                    self._toggle(marker, kind)
+                    i = plain = i + len(marker)
+                    break
+            else:
+                i += 1
+        self.text(literal[plain:])
+
+    def finish(self) -> Rich:
+        if self.open:
+            marker = self.open[-1][0]
+            raise ValueError(f"Незакрита розмітка {marker!r} у шаблоні: {self.template[:60]!r}...")
+        # Telegram вимагає сутності, впорядковані за зсувом
+        return Rich("".join(self.parts), sorted(self.spans, key=lambda span: (span[1], -span[2])), self.answers)
+
+
+def render(template: str, **values: Any) -> Rich:
+    """
+    Заповнює шаблон: розмітка шаблону -> сутності, `{поле}` -> значення.
+    `str` вставляється як текст (і запам'ятовується як відповідь для `fit`),
+    числа — як текст, `Rich` — разом зі своїми сутностями.
+    Формат-специфікатори (`{total:>3}`) працюють як у `str.format`.
+    """
+    builder = _Builder(template)
+    for literal, field, spec, conversion in _FORMATTER.parse(template):
+        builder.markup(literal)
+        if field is None:
+            continue
+        value, _ = _FORMATTER.get_field(field, (), values)
+        if isinstance(value, Rich):
+            builder.rich(value)
+        else:
+            answer = isinstance(value, str)
+            value = _FORMATTER.convert_field(value, conversion)
+            builder.text(_FORMATTER.format_field(value, spec or ""), answer=answer)
+    return builder.finish()
+
+
+def message(template: Any, **values: Any) -> Dict[str, Any]:
+    """Аргументи `text` / `entities` для send_message, reply_text, edit_message_text."""
+    rich = template if isinstance(template, Rich) else render(template, **values)
+    rich = rich.strip()
+    return {"text": rich.text, "entities": rich.entities}
+
+
+# === (v3.33) Довжина повідомлення: дайджест і сторінки ===
+
+def payload_bytes(rich: Rich) -> int:
+    """Байти, які займе повідомлення в запиті: текст UTF-8 + JSON сутностей."""
+    return len(rich.text.encode("utf-8")) + len(json.dumps(rich.entity_dicts(), ensure_ascii=False).encode("utf-8"))
+
+
+def fits(rich: Rich, budget: Optional[int] = None) -> bool:
+    budget = main_message_budget() if budget is None else budget
+    return utf16_len(rich.text) <= MAX_MESSAGE_CHARS and payload_bytes(rich) <= budget
+
+
+def _lines(rich: Rich) -> List[Tuple[int, int]]:
+    """Межі рядків [початок, кінець) разом із "\\n"."""
+    bounds, start = [], 0
+    for match in re.finditer("\n", rich.text):
+        bounds.append((start, match.end()))
+        start = match.end()
+    if start < len(rich.text):
+        bounds.append((start, len(rich.text)))
+    return bounds
+
+
+def _longest_prefix(rich: Rich, budget: int, suffix: str = "") -> int:
+    """Найдовший префікс (символів), що разом із `suffix` вміщається в бюджет."""
+    low, high = 0, len(rich.text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(rich[:middle] + suffix, budget):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def fit(rich: Rich, budget: Optional[int] = None, digest_chars: Optional[int] = None) -> Tuple[Rich, bool]:
+    """
+    Повідомлення, що вміщається в ліміт Telegram і бюджет (див. модуль), та
+    ознака, чи щось згорнуто (тоді повний текст варто показати через `paginate`).
+    """
+    budget = main_message_budget() if budget is None else budget
+    digest_chars = int(os.getenv("MAIN_MESSAGE_DIGEST_CHARS", 40)) if digest_chars is None else digest_chars
+    if fits(rich, budget):
+        return rich, False
+
+    # 1. Дайджест: довгі відповіді -> перші digest_chars символів, від найстаріших
+    view = Rich(rich.text, rich.spans, sorted(rich.answers))
+    for i in range(len(view.answers)):
+        start, end = view.answers[i]
+        if end - start > digest_chars:
+            view = view.replace(start + digest_chars - len(ELLIPSIS), end, ELLIPSIS)
+            if fits(view, budget):
+                return view, True
+
+    # 2. Ховаємо рядки з відповідями (від першого до k-го) за одним рядком-позначкою
+    lines = _lines(view)
+    answer_lines = [
+        (start, end) for start, end in lines
+        if any(first < end and last > start for first, last in view.answers)
+    ]
+
+    def hide(count: int) -> Rich:
+        first, last = answer_lines[0][0], answer_lines[count - 1][1]
+        return view[:first] + render(HIDDEN_MARKER, count=count) + view[last:]
+
+    low, high = 1, len(answer_lines)
+    while low < high:
+        middle = (low + high) // 2
+        if fits(hide(middle), budget):
+            high = middle
+        else:
+            low = middle + 1
+    if answer_lines:
+        view = hide(low)
+        if fits(view, budget):
+            return view, True
+
+    # 3. Крайній випадок: шаблон сам по собі довший за бюджет
+    return view[:_longest_prefix(view, budget, ELLIPSIS)] + ELLIPSIS, True
+
+
+def paginate(rich: Rich, budget: Optional[int] = None) -> List[Rich]:
+    """Повний текст по сторінках (по рядках; задовгий рядок ділиться), кожна — в межах бюджету."""
+    budget = main_message_budget() if budget is None else budget
+    pages: List[Rich] = []
+    page = Rich()
+    for start, end in _lines(rich):
+        line = rich[start:end]
+        if page and not fits(page + line, budget):
+            pages.append(page)
+            page = Rich()
+        while not fits(page + line, budget):
+            cut = max(_longest_prefix(line, budget), 1)
+            pages.append(line[:cut])
+            line = line[cut:]
+        page = page + line
+    pages.append(page)
+    return [page.strip() for page in pages if page.text.strip()] or [Rich()]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.23) Обмеження частоти апдейтів на користувача (token bucket) до хендлерів.
+
+Користувач, що "молотить" кнопки меню посеред аудиту, раніше коштував два
+виклики Bot API і задачу планувальника на КОЖНЕ натискання. Тепер
+`UpdateThrottle.handle` (група -2, одразу після фільтра дублікатів) дає
+кожному користувачу кошик на THROTTLE_BURST апдейтів, що поповнюється зі
+швидкістю THROTTLE_RATE апдейтів/с; надлишкові натискання відкидаються до
+розмови, з одним дешевим `query.answer()` (інакше кнопка "крутиться", доки
+клієнт не здасться). Повідомлення (відповіді, команди) ліміт не рахує і не
+відкидає: надруковану відповідь не можна мовчки загубити, а "молотять" саме
+кнопки. THROTTLE_RATE=0 — вимкнено.
+
+Відкинуті апдейти рахуються в `bot_throttled_updates_total{type,action}`.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, Hashable, List, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop
+
+import metrics
+
+logger = logging.getLogger("throttle")
+logger.setLevel(logging.INFO)
+
+PRUNE_INTERVAL = 60.0
+
+
+class UpdateThrottle:
+    """Token bucket на користувача: `burst` апдейтів одразу, далі `rate` за секунду."""
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None):
+        self.rate = float(os.getenv("THROTTLE_RATE", 3)) if rate is None else rate
+        self.burst = float(os.getenv("THROTTLE_BURST", 10)) if burst is None else burst
+        # Ключ -> [токени, час останнього оновлення]
+        self._buckets: Dict[Hashable, List[float]] = {}
+        self._last_prune = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def allow(self, key: Hashable) -> bool:
+        """Забирає один токен; False, якщо кошик порожній."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._prune(now)
+            self._buckets[key] = [self.burst - 1, now]
+            return True
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def _prune(self, now: float) -> None:
+        # Кошик, що встиг наповнитися, нічим не відрізняється від відсутнього
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        refill = self.burst / self.rate
+        for key in [key for key, (_, updated) in self._buckets.items() if now - updated >= refill]:
+            del self._buckets[key]
+
+    async def handle(self, update: Update, context) -> None:
+        """(група -2) Надлишкові натискання зупиняються до розмови й метрик."""
+        user = update.effective_user
+        query = update.callback_query
+        if not self.enabled or not user or not query or self.allow(user.id):
+            return
+        metrics.THROTTLED_UPDATES.inc(type=metrics.update_kind(update), action="dropped")
+        logger.debug("Апдейт %s відкинуто лімітом частоти.", update.update_id)
+        try:
+            await query.answer()
+        except TelegramError as e:
+            logger.debug("answer() для відкинутого натискання не вдався: %s", e)
+        raise ApplicationHandlerStop
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.12) Легке трасування "від апдейту до доставленого PDF".
+
+  - Для кожного апдейту створюється трейс з ВИПАДКОВИМ (анонімним) trace_id —
+    він ніяк не пов'язаний з user_id чи chat_id.
+  - Спани передаються через contextvars, тому працюють у хелперах бота
+    (`delete_main_message`, `edit_main_message`, ...) та в `pdf_utils` без
+    явної передачі контексту.
+  - Семплінг: TRACE_SAMPLE_RATE (0.0-1.0, за замовчуванням 0.01). Для
+    не-семплованих апдейтів `span()` — це no-op без алокацій.
+  - Експорт у фоновому потоці, пакетами:
+      TRACE_EXPORT=jsonl:/шлях/traces.jsonl
+      TRACE_EXPORT=otlp:http://127.0.0.1:4318/v1/traces   (OTLP/HTTP JSON)
+    Без TRACE_EXPORT трасування вимкнене повністю.
+
+Атрибути спанів — лише технічні (назви хендлерів, методів, розміри), ніколи
+не тексти відповідей користувачів.
+"""
+
+import atexit
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("tracing")
+logger.setLevel(logging.INFO)
+
+SERVICE_NAME = "privacy-sentry"
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL_SECONDS = 2.0
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+# Поточний спан (None = трасування не ведеться для цього апдейту)
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _NoopSpan:
+    """Спан-заглушка для не-семплованих апдейтів."""
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+# === Експорт ===
+
+class _Exporter(threading.Thread):
+    """Фоновий потік: збирає завершені спани і відправляє пакетами."""
+
+    def __init__(self, target: str):
+        super().__init__(name="trace-exporter", daemon=True)
+        self.kind, _, self.destination = target.partition(":")
+        if self.kind not in ("jsonl", "otlp"):
+            raise ValueError(f"Невідомий TRACE_EXPORT: {target}")
+        self.queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self.dropped = 0
+
+    def submit(self, span: Span) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            # Ніколи не блокуємо event loop через трасування
+            self.dropped += 1
+
+    def run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+        while True:
+            try:
+                span = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if span is None:
+                    self._export(batch)
+                    return
+                batch.append(span)
+            except queue.Empty:
+                pass
+            if len(batch) >= EXPORT_BATCH_SIZE or time.monotonic() >= deadline:
+                self._export(batch)
+                batch = []
+                deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+
+    def _export(self, batch: List[Span]) -> None:
+        if not batch:
+            return
+        try:
+            if self.kind == "jsonl":
+                with open(self.destination, "a", encoding="utf-8") as f:
+                    for span in batch:
+                        f.write(json.dumps(span.to_dict(), ensure_ascii=False) + "\n")
+            else:
+                payload = {
+                    "resourceSpans": [{
+                        "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                        "scopeSpans": [{
+                            "scope": {"name": SERVICE_NAME},
+                            "spans": [span.to_otlp() for span in batch],
+                        }],
+                    }]
+                }
+                request = urllib.request.Request(
+                    self.destination,
+                    data=json.dumps(payload).encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST",
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            logger.warning("Не вдалося експортувати %s спанів: %s", len(batch), e)
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self.join(timeout=10)
+
+
+_exporter: Optional[_Exporter] = None
+_sample_rate = 0.0
+
+
+def configure(export: Optional[str] = None, sample_rate: Optional[float] = None) -> bool:
+    """Налаштовує трасування (за замовчуванням — з TRACE_EXPORT / TRACE_SAMPLE_RATE)."""
+    global _exporter, _sample_rate
+    export = export if export is not None else os.getenv("TRACE_EXPORT")
+    if not export:
+        return False
+    _sample_rate = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    _exporter = _Exporter(export)
+    _exporter.start()
+    atexit.register(_exporter.stop)
+    logger.info("Трасування увімкнено: %s (семплінг %.2f%%).", export, _sample_rate * 100)
+    return True
+
+
+def _finish(span: Span) -> None:
+    span.end_ns = time.time_ns()
+    if _exporter:
+        _exporter.submit(span)
+
+
+# === Публічний API ===
+
+@contextmanager
+def trace(name: str, **attributes: Any):
+    """Кореневий спан (один на апдейт). Рішення про семплінг приймається тут."""
+    if not _exporter or random.random() >= _sample_rate:
+        # Явно "вимикаємо" трасування для цього контексту
+        token = _current.set(None)
+        try:
+            yield _NOOP
+        finally:
+            _current.reset(token)
+        return
+
+    root = Span(os.urandom(16).hex(), None, name, attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        _finish(root)
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Дочірній спан поточного трейсу (no-op, якщо трейс не семплований)."""
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+
+    child = Span(parent.trace_id, parent.span_id, name, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        _finish(child)
+
+
+def current_trace_id() -> Optional[str]:
+    """trace_id поточного (семплованого) трейсу — для кореляції з логами."""
+    current = _current.get()
+    return current.trace_id if current else None
+
+
+def traced(name: Optional[str] = None):
+    """Декоратор для sync та async функцій: кожен виклик — окремий спан."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
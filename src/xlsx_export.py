@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+(v3.17) DPIA Lite в Excel: заповнення `artifacts/1_dpia_lite.xlsx` відповідями.
+
+Шаблон читається ОДИН раз (`load_dpia_template`, під час прогріву) у
+компактну модель "рядок -> клітинки зі стилями". Для кожного запиту модель
+клонується, заповнюється і записується openpyxl у write-only режимі прямо в
+пам'ять (BytesIO) — без рендера і без тимчасових файлів. Це в рази дешевше
+за PDF, а студент отримує файл, який можна редагувати.
+
+Розкладка шаблону (Лист1):
+  B3 назва, B4 команда, B5 дата, B6 мета, B7 список даних;
+  рядки 10-11 — приклади мінімізації (A пункт / B відповідь), замість них
+  вставляємо по рядку на кожен пункт; A12 — висновок;
+  B15 зберігання, B16 ризик, B17 мінімізація ризику;
+  B20 строк зберігання, B21 механізм видалення.
+
+(v3.18) Зворотний напрям — `parse_dpia_xlsx`: заповнений офлайн шаблон
+(або файл, згенерований ботом) -> поля сесії `dpia`. Рядки шукаються за
+підписами в стовпці A, тож додані студентом рядки мінімізації не заважають.
+
+openpyxl — опційний: без нього `xlsx_available()` повертає False, а бот
+надсилає лише PDF.
+"""
+
+import copy
+import io
+import logging
+import os
+import threading
+import zipfile
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger("xlsx_export")
+logger.setLevel(logging.INFO)
+
+DEFAULT_TEMPLATE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artifacts", "1_dpia_lite.xlsx"
+)
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Клітинки з простими відповідями: адреса в шаблоні -> ключ у dpia-даних
+_ANSWER_CELLS = {
+    (3, 2): "project_name",
+    (4, 2): "team",
+    (6, 2): "goal",
+    (15, 2): "storage",
+    (16, 2): "risk",
+    (17, 2): "mitigation",
+    (20, 2): "retention_period",
+    (21, 2): "retention_mechanism",
+}
+_DATE_CELL = (5, 2)
+_DATA_LIST_CELL = (7, 2)
+_MINIMIZATION_ROWS = (10, 11)  # приклади в шаблоні, замінюються пунктами
+_CONCLUSION_CELL = (12, 1)
+
+_STYLE_ATTRS = ("font", "fill", "border", "alignment", "number_format", "protection")
+
+
+# --- Лінивий імпорт, щоб не падати, якщо пакета немає ---
+def _try_import_openpyxl():
+    try:
+        import openpyxl  # type: ignore
+        return openpyxl
+    except Exception:
+        return None
+
+
+def xlsx_available() -> bool:
+    return _try_import_openpyxl() is not None
+
+
+class _TemplateModel:
+    """Розібраний шаблон: значення та стилі клітинок, розміри, об'єднання."""
+
+    def __init__(self, sheet_title: str, rows: Dict[int, Dict[int, Tuple[Any, Dict[str, Any]]]],
+                 row_heights: Dict[int, float], column_widths: Dict[str, float],
+                 merged: List[Tuple[int, int, int, int]], max_row: int):
+        self.sheet_title = sheet_title
+        self.rows = rows
+        self.row_heights = row_heights
+        self.column_widths = column_widths
+        self.merged = merged  # (min_row, min_col, max_row, max_col)
+        self.max_row = max_row
+
+
+_template: Optional[_TemplateModel] = None
+_template_lock = threading.Lock()
+
+
+def _parse_template(path: str) -> _TemplateModel:
+    openpyxl = _try_import_openpyxl()
+    if not openpyxl:
+        raise RuntimeError("Для Excel-версії DPIA потрібен openpyxl: pip install openpyxl")
+    workbook = openpyxl.load_workbook(path)
+    sheet = workbook.active
+
+    rows: Dict[int, Dict[int, Tuple[Any, Dict[str, Any]]]] = {}
+    for row in sheet.iter_rows():
+        for cell in row:
+            if cell.value is None and not cell.has_style:
+                continue
+            style = {attr: copy.copy(getattr(cell, attr)) for attr in _STYLE_ATTRS}
+            rows.setdefault(cell.row, {})[cell.column] = (cell.value, style)
+
+    model = _TemplateModel(
+        sheet_title=sheet.title,
+        rows=rows,
+        row_heights={i: dim.height for i, dim in sheet.row_dimensions.items() if dim.height},
+        column_widths={key: dim.width for key, dim in sheet.column_dimensions.items() if dim.width},
+        merged=[(r.min_row, r.min_col, r.max_row, r.max_col) for r in sheet.merged_cells.ranges],
+        max_row=sheet.max_row,
+    )
+    workbook.close()
+    return model
+
+
+def load_dpia_template(path: Optional[str] = None) -> _TemplateModel:
+    """Розбирає шаблон один раз і кешує модель (потокобезпечно). Env: DPIA_XLSX_TEMPLATE."""
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                path = path or os.getenv("DPIA_XLSX_TEMPLATE", DEFAULT_TEMPLATE_PATH)
+                _template = _parse_template(path)
+                logger.info("Шаблон DPIA Excel завантажено: %s", path)
+    return _template
+
+
+def _cell_text(value: str) -> str:
+    """Прибирає керуючі символи, які заборонені в XLSX."""
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE  # type: ignore
+    return ILLEGAL_CHARACTERS_RE.sub("", value)
+
+
+def _minimization_rows(dpia: dict) -> Tuple[List[Tuple[str, str]], str]:
+    """Рядки мінімізації (пункт, відповідь) і текст висновку."""
+    items = dpia.get('minimization_data') or []
+    if not items:
+        return [("[Не вказано]", "")], "Висновок: [Не вказано]"
+
+    rows = []
+    refused = []
+    for item in items:
+        if item['needed']:
+            rows.append((item['item'], f"Так — {item['reason']}" if item['reason'] else "Так"))
+        else:
+            rows.append((item['item'], "Ні — відмовлено (мінімізовано)"))
+            refused.append(item['item'])
+    if refused:
+        conclusion = "Висновок: відмовилися від " + ", ".join(refused)
+    else:
+        conclusion = "Висновок: усі дані необхідні, відмов немає"
+    return rows, conclusion
+
+
+def build_dpia_xlsx(dpia: dict, today: Optional[date] = None) -> bytes:
+    """
+    Заповнює шаблон відповідями DPIA (ті самі поля, що й `documents.build_dpia_markdown`)
+    і повертає готовий .xlsx у байтах.
+    """
+    openpyxl = _try_import_openpyxl()
+    if not openpyxl:
+        raise RuntimeError("Для Excel-версії DPIA потрібен openpyxl: pip install openpyxl")
+    from openpyxl.cell import WriteOnlyCell  # type: ignore
+    from openpyxl.utils import get_column_letter  # type: ignore
+
+    model = load_dpia_template()
+    min_rows, conclusion = _minimization_rows(dpia)
+    first_min_row, last_min_row = _MINIMIZATION_ROWS
+    # На скільки зсуваються рядки шаблону після блоку мінімізації
+    shift = len(min_rows) - (last_min_row - first_min_row + 1)
+
+    data_list = dpia.get('data_list') or [item['item'] for item in dpia.get('minimization_data') or []]
+    answers = {cell: dpia.get(key, '[Не вказано]') for cell, key in _ANSWER_CELLS.items()}
+    answers[_DATE_CELL] = (today or date.today()).strftime("%d.%m.%Y")
+    answers[_DATA_LIST_CELL] = "\n".join(data_list) or '[Не вказано]'
+    answers[_CONCLUSION_CELL] = conclusion
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(model.sheet_title)
+    for key, width in model.column_widths.items():
+        sheet.column_dimensions[key].width = width
+
+    def make_cell(template_cell: Optional[Tuple[Any, Dict[str, Any]]], value: Any):
+        cell = WriteOnlyCell(sheet, value=_cell_text(value) if isinstance(value, str) else value)
+        if isinstance(value, str):
+            # Відповідь "=..." — це текст, а не формула
+            cell.data_type = "s"
+        if template_cell:
+            for attr, style in template_cell[1].items():
+                setattr(cell, attr, copy.copy(style))
+        return cell
+
+    def template_row(row_index: int, out_index: int, overrides: Dict[int, Any]) -> list:
+        cells = model.rows.get(row_index, {})
+        width = max(list(cells) + list(overrides) + [0])
+        row = []
+        for column in range(1, width + 1):
+            template_cell = cells.get(column)
+            value = overrides.get(column, template_cell[0] if template_cell else None)
+            row.append(make_cell(template_cell, value))
+        if row_index in model.row_heights:
+            sheet.row_dimensions[out_index].height = model.row_heights[row_index]
+        return row
+
+    out_index = 0
+    for row_index in range(1, model.max_row + 1):
+        if first_min_row < row_index <= last_min_row:
+            continue
+        if row_index == first_min_row:
+            for item, answer in min_rows:
+                out_index += 1
+                sheet.append(template_row(first_min_row, out_index, {1: item, 2: answer}))
+            continue
+        out_index += 1
+        overrides = {col: value for (row, col), value in answers.items() if row == row_index}
+        sheet.append(template_row(row_index, out_index, overrides))
+
+    for min_row, min_col, max_row, max_col in model.merged:
+        if min_row > last_min_row:
+            min_row, max_row = min_row + shift, max_row + shift
+        sheet.merged_cells.add(f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}")
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+# === (v3.18) Імпорт заповненого шаблону ===
+
+# Підпис у стовпці A (початок, без регістру) -> ключ у dpia-даних
+_UPLOAD_LABELS = (
+    ("назва проєкту", "project_name"),
+    ("керівник/розробник", "team"),
+    ("1. мета", "goal"),
+    ("2. дані", "data_list"),
+    ("де зберігаємо", "storage"),
+    ("який головний ризик", "risk"),
+    ("як мінімізуємо ризик", "mitigation"),
+    ("план зберігання", "retention_period"),
+    ("план очистки", "retention_mechanism"),
+)
+_MINIMIZATION_HEADER = "3. мінімізація"
+_MINIMIZATION_END = ("висновок", "4.")
+_YES_PREFIXES = ("так", "yes", "+")
+_NO_PREFIXES = ("ні", "no", "-")
+_ANSWER_SEPARATORS = " —–-:,.()"
+
+
+def _is_placeholder(text: str) -> bool:
+    """Незаповнена клітинка шаблону: "[Впишіть ...]"."""
+    return not text or (text.startswith("[") and text.endswith("]"))
+
+
+def _parse_minimization_answer(answer: str) -> Optional[Tuple[bool, str]]:
+    """ "Так — для входу" -> (True, "для входу"); "Ні" -> (False, ...); плейсхолдер -> None."""
+    if _is_placeholder(answer):
+        return None
+    lowered = answer.lower()
+    for prefix in _NO_PREFIXES:
+        if lowered.startswith(prefix):
+            return False, "Відмовлено (мінімізовано)"
+    for prefix in _YES_PREFIXES:
+        if lowered.startswith(prefix):
+            return True, answer[len(prefix):].strip(_ANSWER_SEPARATORS) or "[Не вказано]"
+    return True, answer
+
+
+def _check_unpacked_size(buffer: io.BytesIO, max_unpacked_bytes: int, max_entry_bytes: int) -> None:
+    """ValueError, якщо архів розпакується більшим за ліміти (захист від zip-бомби)."""
+    try:
+        archive = zipfile.ZipFile(buffer)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ValueError("це не схоже на файл .xlsx") from e
+    with archive:
+        # zipfile не віддає більше за заявлений file_size (і перевіряє CRC),
+        # тож суми з центрального каталогу достатньо — нічого не розпаковуючи
+        total = 0
+        for info in archive.infolist():
+            if info.file_size > max_entry_bytes:
+                raise ValueError(f"файл у архіві завеликий після розпакування ({info.file_size // 1024} КБ)")
+            total += info.file_size
+            if total > max_unpacked_bytes:
+                raise ValueError(f"файл завеликий після розпакування (понад {max_unpacked_bytes // (1024 * 1024)} МБ)")
+    buffer.seek(0)
+
+
+def parse_dpia_xlsx(
+    content: Union[bytes, bytearray],
+    max_rows: int = 200,
+    max_field_chars: int = 1000,
+    max_items: int = 30,
+    max_unpacked_bytes: int = 8 * 1024 * 1024,
+    max_entry_bytes: int = 4 * 1024 * 1024,
+) -> Dict[str, Any]:
+    """
+    Читає заповнений `1_dpia_lite.xlsx` (read-only, потоково) і повертає
+    словник у полях сесії `dpia`. Піднімає ValueError з поясненням для користувача.
+    Синхронна — викликати через asyncio.to_thread.
+
+    `max_unpacked_bytes` / `max_entry_bytes` — ліміти розпакованого вмісту
+    архіву (усього / на один файл): .xlsx — це zip, і 300 КБ можуть
+    розпакуватися в сотні МБ XML.
+    """
+    openpyxl = _try_import_openpyxl()
+    if not openpyxl:
+        raise RuntimeError("Для імпорту Excel потрібен openpyxl: pip install openpyxl")
+
+    buffer = io.BytesIO(content)
+    _check_unpacked_size(buffer, max_unpacked_bytes, max_entry_bytes)
+    try:
+        workbook = openpyxl.load_workbook(buffer, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError, ValueError) as e:
+        raise ValueError("це не схоже на файл .xlsx") from e
+
+    data: Dict[str, Any] = {}
+    minimization: List[Dict[str, Any]] = []
+    in_minimization = False
+    try:
+        sheet = workbook.active
+        for row_number, row in enumerate(sheet.iter_rows(max_col=2, values_only=True), start=1):
+            if row_number > max_rows:
+                raise ValueError(f"у файлі більше {max_rows} рядків")
+            label, answer = (list(row) + [None, None])[:2]
+            label = str(label).strip() if label is not None else ""
+            answer = str(answer).strip() if answer is not None else ""
+            if not label:
+                continue
+            if max(len(label), len(answer)) > max_field_chars:
+                raise ValueError(f"рядок {row_number}: текст довший за {max_field_chars} символів")
+
+            lowered = label.lower()
+            if lowered.startswith(_MINIMIZATION_HEADER):
+                in_minimization = True
+                continue
+            if in_minimization:
+                if lowered.startswith(_MINIMIZATION_END):
+                    in_minimization = False
+                    continue
+                parsed = _parse_minimization_answer(answer)
+                if parsed is None:
+                    continue
+                if len(minimization) >= max_items:
+                    raise ValueError(f"більше {max_items} пунктів мінімізації")
+                needed, reason = parsed
+                minimization.append({"item": label, "needed": needed, "reason": reason})
+                continue
+
+            for prefix, key in _UPLOAD_LABELS:
+                if lowered.startswith(prefix) and not _is_placeholder(answer):
+                    data[key] = answer
+                    break
+    finally:
+        workbook.close()
+        buffer.close()
+
+    if "project_name" not in data:
+        raise ValueError("не заповнено 'Назва проєкту' — це точно DPIA Lite?")
+
+    data_list = [item.strip() for item in data.pop("data_list", "").splitlines() if item.strip()]
+    if not minimization:
+        # Дані перелічені, але таблицю мінімізації не заповнено
+        minimization = [{"item": item, "needed": True, "reason": "[Не вказано]"} for item in data_list[:max_items]]
+    if not minimization:
+        raise ValueError("не знайдено жодного пункту даних (розділи 2-3)")
+    data["data_list"] = data_list or [item["item"] for item in minimization]
+    data["minimization_data"] = minimization
+    return data